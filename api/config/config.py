@@ -6,12 +6,16 @@ Configuration settings for the fraud detection API
 import os
 import pandas as pd
 import pymysql
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.exc import SQLAlchemyError
 import logging
-from typing import Dict, Any, Optional, Iterator
+from typing import Callable, Dict, Any, Optional, Iterator, List
 import warnings
 import gc
+import threading
+import time
+import weakref
+from contextlib import contextmanager
 from dataclasses import dataclass
 
 # Configure logging
@@ -30,6 +34,18 @@ class DatabaseConfig:
     charset: str = 'utf8mb4'
     autocommit: bool = True
     
+    # Storage backend: 'mysql' (MariaDB server) or 'sqlite' (embedded file in WAL mode
+    # with the same Prescriptions schema, for single-node deployments, CI and benchmarks)
+    backend: str = os.getenv('DB_BACKEND', 'mysql').lower()
+    sqlite_path: str = os.getenv('DB_SQLITE_PATH', 'fraud_detection.sqlite')
+    sqlite_cache_mb: int = int(os.getenv('DB_SQLITE_CACHE_MB', '256'))  # page cache per connection
+    
+    # Connection pool settings (per worker process)
+    pool_size: int = int(os.getenv('DB_POOL_SIZE', '5'))
+    max_overflow: int = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+    pool_timeout: int = int(os.getenv('DB_POOL_TIMEOUT', '30'))
+    pool_recycle: int = int(os.getenv('DB_POOL_RECYCLE', '3600'))
+    
     def to_dict(self) -> Dict[str, Any]:
         """Convert to dictionary format for database operations"""
         return {
@@ -66,6 +82,26 @@ class MemoryConfig:
     memory_cleanup_interval: int = int(os.getenv('MEMORY_CLEANUP_INTERVAL', '300'))  # seconds
     max_memory_usage_mb: int = int(os.getenv('MAX_MEMORY_USAGE_MB', '2048'))  # 2GB default
 
+    # Feature extraction backend: 'pandas' (in-memory) or 'duckdb' (embedded SQL engine, out-of-core)
+    feature_backend: str = os.getenv('FEATURE_BACKEND', 'pandas').lower()
+    sql_engine_threads: int = int(os.getenv('SQL_ENGINE_THREADS', '0'))  # 0 = use all cores
+    sql_engine_temp_dir: str = os.getenv('SQL_ENGINE_TEMP_DIR', '')  # spill directory, empty = engine default
+
+    # Stream query results through an unbuffered server-side cursor
+    enable_server_side_cursor: bool = os.getenv('ENABLE_SERVER_SIDE_CURSOR', 'True').lower() == 'true'
+    stream_fetch_size: int = int(os.getenv('STREAM_FETCH_SIZE', '1000'))  # rows buffered per fetch
+
+    # Compute monthly group aggregates in the database during training instead of in pandas
+    enable_aggregate_pushdown: bool = os.getenv('ENABLE_AGGREGATE_PUSHDOWN', 'False').lower() == 'true'
+
+    # Rendered chart cache (LRU bounded by total encoded size) and background prerendering
+    chart_cache_max_mb: int = int(os.getenv('CHART_CACHE_MAX_MB', '64'))
+    enable_chart_prerender: bool = os.getenv('ENABLE_CHART_PRERENDER', 'True').lower() == 'true'
+
+    # Catalog lookups (services, specialties, providers) answered from an in-process summary
+    catalog_cache_ttl: int = int(os.getenv('CATALOG_CACHE_TTL', '600'))  # seconds before a background refresh
+    catalog_watermark_column: str = os.getenv('CATALOG_WATERMARK_COLUMN', '')  # strictly increasing integer key (id, or rowid on SQLite) for incremental refreshes; empty = full reloads
+
 @dataclass
 class AppConfig:
     """Application configuration"""
@@ -77,6 +113,27 @@ class AppConfig:
     # Chart configuration
     chart_dpi: int = 300
     chart_figsize: tuple = (12, 6)
+    chart_max_dpi: int = int(os.getenv('CHART_MAX_DPI', '600'))  # upper bound for the dpi query parameter
+    chart_max_points: int = int(os.getenv('CHART_MAX_POINTS', '500'))  # target points of date series charts
+    chart_data_max_age: int = int(os.getenv('CHART_DATA_MAX_AGE', '300'))  # Cache-Control max-age for chart data, seconds
+    chart_render_processes: int = int(os.getenv('CHART_RENDER_PROCESSES', '2'))  # 0 = render in the serving process
+    chart_render_queue_size: int = int(os.getenv('CHART_RENDER_QUEUE_SIZE', '16'))  # pending renders before rejecting
+    chart_shaping_memo_size: int = int(os.getenv('CHART_SHAPING_MEMO_SIZE', '4096'))  # shaped label strings kept per render process
+    chart_render_timeout: float = float(os.getenv('CHART_RENDER_TIMEOUT', '30'))  # seconds per render
+    chart_render_retry_after: int = int(os.getenv('CHART_RENDER_RETRY_AFTER', '2'))  # Retry-After seconds on an overloaded pool
+    chart_bundle_threads: int = int(os.getenv('CHART_BUNDLE_THREADS', '4'))  # charts of one /charts/bundle request produced concurrently
+    chart_bundle_max_charts: int = int(os.getenv('CHART_BUNDLE_MAX_CHARTS', '32'))  # chart specs accepted per bundle
+    
+    # Profiling configuration (admin requests carry X-Admin-Token)
+    enable_request_profiling: bool = os.getenv('ENABLE_REQUEST_PROFILING', 'False').lower() == 'true'
+    profiling_admin_token: str = os.getenv('PROFILING_ADMIN_TOKEN', '')
+    profile_history_size: int = int(os.getenv('PROFILE_HISTORY_SIZE', '20'))  # request profiles kept per worker
+    profile_top_functions: int = int(os.getenv('PROFILE_TOP_FUNCTIONS', '30'))  # functions listed per profile
+    profile_sample_interval_ms: float = float(os.getenv('PROFILE_SAMPLE_INTERVAL_MS', '1'))  # sampling mode interval
+    enable_continuous_profiling: bool = os.getenv('ENABLE_CONTINUOUS_PROFILING', 'False').lower() == 'true'
+    profiler_sample_interval_ms: float = float(os.getenv('PROFILER_SAMPLE_INTERVAL_MS', '10'))  # continuous sampler interval
+    profiler_max_overhead: float = float(os.getenv('PROFILER_MAX_OVERHEAD', '0.01'))  # share of wall time spent sampling
+    profiler_max_duration: int = int(os.getenv('PROFILER_MAX_DURATION', '900'))  # seconds before a run stops by itself
     
     # Feature configuration
     max_percentage_change: float = 2000.0
@@ -102,6 +159,113 @@ class APIConfig:
         if self.schemes is None:
             self.schemes = ["http"]
 
+# Missing provider names fall back to the referrer, resolved in the database
+PROVIDER_NAME_EXPRESSION = "COALESCE(`provider_name`, `Ref_code`, `Ref_name`)"
+
+# Stored group keys of feature extraction that are derived rather than raw columns:
+# adm_month is the Gregorian year_month LazyDataLoader._process_chunk derives from the
+# Shamsi Adm_date ('NaT' when it does not convert) and provider_key the provider name
+# the rows are loaded with ('None' when missing). They are filled by
+# DatabaseManager.fill_feature_keys so the aggregate queries can group on indexed columns.
+FEATURE_KEY_COLUMNS = {
+    'adm_month': 'VARCHAR(16)',
+    'provider_key': 'VARCHAR(255)'
+}
+
+# Per-group aggregate queries used by feature extraction when aggregates are pushed down
+# to the database. They group on the stored columns in the key order of the composite
+# indexes of scripts/setup_database.py, so MariaDB and SQLite read the groups in order
+# from a covering index. NULL raw keys form their own group and are reported as 'None',
+# as they are after clean_key_column. {table} is the source table and {cost} the cost
+# expression of DatabaseManager.feature_aggregate_queries.
+FEATURE_AGGREGATE_QUERIES = {
+    'patient_month': """
+        SELECT adm_month AS year_month, COALESCE({table}.ID, 'None') AS ID,
+               COUNT(*) AS total_providers_monthly,
+               COUNT(DISTINCT provider_key) AS unique_providers,
+               AVG({cost}) AS mean_amount_patient
+        FROM {table}
+        GROUP BY {table}.ID, adm_month
+    """,
+    'provider_month': """
+        SELECT adm_month AS year_month, provider_key AS provider_name,
+               COUNT(*) AS total_patients_monthly,
+               COUNT(DISTINCT COALESCE({table}.ID, 'None')) AS unique_patients,
+               AVG({cost}) AS mean_amount_provider
+        FROM {table}
+        GROUP BY provider_key, adm_month
+    """,
+    'service_month': """
+        SELECT adm_month AS year_month, COALESCE({table}.Service, 'None') AS Service, AVG({cost}) AS avg_amount
+        FROM {table}
+        GROUP BY {table}.Service, adm_month
+    """,
+    'provider_service_month': """
+        SELECT adm_month AS year_month, provider_key AS provider_name, COALESCE({table}.Service, 'None') AS Service,
+               AVG({cost}) AS avg_amount_ser
+        FROM {table}
+        GROUP BY provider_key, adm_month, {table}.Service
+    """,
+    'patient_service_month': """
+        SELECT adm_month AS year_month, COALESCE({table}.ID, 'None') AS ID, COALESCE({table}.Service, 'None') AS Service,
+               AVG({cost}) AS avg_amount_ser_patient
+        FROM {table}
+        GROUP BY {table}.ID, adm_month, {table}.Service
+    """,
+    'specialty_month': """
+        SELECT adm_month AS year_month, COALESCE({table}.provider_specialty, 'None') AS provider_specialty,
+               AVG({cost}) AS overall_avg_amount_spe
+        FROM {table}
+        GROUP BY {table}.provider_specialty, adm_month
+    """,
+    'provider_specialty_month': """
+        SELECT adm_month AS year_month, provider_key AS provider_name,
+               COALESCE({table}.provider_specialty, 'None') AS provider_specialty,
+               AVG({cost}) AS avg_amount_spe
+        FROM {table}
+        GROUP BY provider_key, adm_month, {table}.provider_specialty
+    """,
+    'provider_service': """
+        SELECT provider_key AS provider_name, COALESCE({table}.Service, 'None') AS Service, COUNT(*) AS Count
+        FROM {table}
+        GROUP BY provider_key, {table}.Service
+    """,
+    'provider_total': """
+        SELECT provider_key AS provider_name, COUNT(*) AS TotalCount
+        FROM {table}
+        GROUP BY provider_key
+    """
+}
+
+# Key columns of each aggregate; a key may appear only once per aggregate
+FEATURE_AGGREGATE_KEYS = {
+    'patient_month': ['year_month', 'ID'],
+    'provider_month': ['year_month', 'provider_name'],
+    'service_month': ['year_month', 'Service'],
+    'provider_service_month': ['year_month', 'provider_name', 'Service'],
+    'patient_service_month': ['year_month', 'ID', 'Service'],
+    'specialty_month': ['year_month', 'provider_specialty'],
+    'provider_specialty_month': ['year_month', 'provider_name', 'provider_specialty'],
+    'provider_service': ['provider_name', 'Service'],
+    'provider_total': ['provider_name']
+}
+
+# Session table mapping each distinct Adm_date to the Gregorian year_month of the rows
+ADM_MONTH_TABLE = 'adm_month_keys'
+
+# Column types applied to streamed chunks so every chunk has the same schema
+# (an all-NULL or DECIMAL column would otherwise come back as object)
+PRESCRIPTION_DTYPES = {
+    'cost_amount': 'float64',
+    'ded_amount': 'float64',
+    'confirmed_amount': 'float64',
+    'record_id': 'Int64',
+    'age': 'Int64'
+}
+
+# Live DatabaseManager instances, reset in forked children (see _reset_managers_after_fork)
+_db_managers = weakref.WeakSet()
+
 class DatabaseManager:
     """Database manager for connections and operations"""
     
@@ -109,46 +273,192 @@ class DatabaseManager:
         self.config = config or db_config
         self.engine = None
         self.connection = None
+        self._engine_pid = None
+        self._engine_lock = threading.Lock()
+        self._reset_pool_stats()
+        # Timing histograms installed by the application through instrument()
+        self._query_duration = None
+        self._connection_wait = None
+        _db_managers.add(self)
+    
+    def instrument(self, query_duration=None, connection_wait=None):
+        """
+        Record database timings into the given histograms
+        
+        Args:
+            query_duration: Histogram observed with the query time and an operation label
+            connection_wait: Histogram observed with the time spent waiting for a pooled connection
+        """
+        self._query_duration = query_duration
+        self._connection_wait = connection_wait
+    
+    def _observe_query(self, seconds: float, operation: str):
+        if self._query_duration is not None:
+            self._query_duration.observe(seconds, operation=operation)
+    
+    @contextmanager
+    def _timed_query(self, operation: str):
+        """Observe the wall time of a block as a query of the given operation"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._observe_query(time.perf_counter() - started, operation)
+    
+    def _reset_pool_stats(self):
+        """Reset connection acquisition statistics"""
+        self._stats_lock = threading.Lock()
+        self._checkouts = 0
+        self._checkout_failures = 0
+        self._total_wait_seconds = 0.0
+        self._max_wait_seconds = 0.0
         
     def create_engine(self) -> bool:
         """Create SQLAlchemy engine for database connection"""
         try:
-            config_dict = self.config.to_dict()
-            connection_string = (
-                f"mysql+pymysql://{config_dict['user']}:{config_dict['password']}"
-                f"@{config_dict['host']}:{config_dict['port']}/{config_dict['database']}"
-                f"?charset={config_dict['charset']}"
-            )
-            
-            self.engine = create_engine(
-                connection_string,
-                pool_pre_ping=True,
-                pool_recycle=3600,
-                echo=False,
-                # Connection pool settings
-                pool_size=5,
-                max_overflow=10,
-                pool_timeout=30
-            )
+            if self.is_embedded:
+                self.engine = self._create_sqlite_engine()
+            elif self.config.backend == 'mysql':
+                config_dict = self.config.to_dict()
+                connection_string = (
+                    f"mysql+pymysql://{config_dict['user']}:{config_dict['password']}"
+                    f"@{config_dict['host']}:{config_dict['port']}/{config_dict['database']}"
+                    f"?charset={config_dict['charset']}"
+                )
+                
+                self.engine = create_engine(
+                    connection_string,
+                    pool_pre_ping=True,
+                    pool_recycle=self.config.pool_recycle,
+                    echo=False,
+                    # Connection pool settings
+                    pool_size=self.config.pool_size,
+                    max_overflow=self.config.max_overflow,
+                    pool_timeout=self.config.pool_timeout
+                )
+            else:
+                raise ValueError(f"Unknown database backend: {self.config.backend} (expected mysql or sqlite)")
+            self._engine_pid = os.getpid()
             
             # Test connection
             with self.engine.connect() as conn:
                 conn.execute(text("SELECT 1"))
             
-            logger.info("Database engine created successfully")
+            logger.info(f"Database engine created successfully (backend {self.config.backend}, pid {self._engine_pid}, "
+                        f"pool_size={self.config.pool_size}, max_overflow={self.config.max_overflow})")
             return True
             
         except Exception as e:
             logger.error(f"Failed to create database engine: {str(e)}")
             return False
     
+    @property
+    def is_embedded(self) -> bool:
+        """Whether the database is an embedded SQLite file rather than a MariaDB server"""
+        return self.config.backend == 'sqlite'
+    
+    def _create_sqlite_engine(self):
+        """
+        Engine over the SQLite file with WAL journaling
+        
+        WAL lets readers run concurrently with the single writer, and each
+        pooled connection is tuned for bulk reads on first connect.
+        """
+        engine = create_engine(
+            f"sqlite:///{os.path.abspath(self.config.sqlite_path)}",
+            echo=False,
+            # Connections are shared across request threads, one at a time per checkout
+            connect_args={'check_same_thread': False, 'timeout': self.config.pool_timeout},
+            pool_size=self.config.pool_size,
+            max_overflow=self.config.max_overflow,
+            pool_timeout=self.config.pool_timeout
+        )
+        
+        @event.listens_for(engine, 'connect')
+        def _configure_connection(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.execute(f"PRAGMA busy_timeout={self.config.pool_timeout * 1000}")
+            cursor.execute(f"PRAGMA cache_size=-{self.config.sqlite_cache_mb * 1024}")
+            cursor.execute("PRAGMA temp_store=MEMORY")
+            cursor.close()
+        
+        return engine
+    
+    def dispose_after_fork(self):
+        """
+        Drop an engine inherited from the parent process
+        
+        The pooled sockets belong to the parent, so they are discarded without
+        being closed and a fresh engine is created lazily on next use.
+        """
+        if self.engine is not None and self._engine_pid != os.getpid():
+            self.engine.dispose(close=False)
+            self.engine = None
+            self._engine_pid = None
+            self._engine_lock = threading.Lock()
+            self._reset_pool_stats()
+            logger.info(f"Disposed inherited database engine in worker {os.getpid()}")
+    
     def get_connection(self):
         """Get database connection"""
+        if self.engine is not None and self._engine_pid != os.getpid():
+            self.dispose_after_fork()
+        
         if not self.engine:
-            if not self.create_engine():
-                raise Exception("Failed to create database engine")
+            with self._engine_lock:
+                if not self.engine and not self.create_engine():
+                    raise Exception("Failed to create database engine")
+        
+        start_time = time.perf_counter()
+        try:
+            conn = self.engine.connect()
+        except Exception:
+            with self._stats_lock:
+                self._checkout_failures += 1
+            raise
+        wait_seconds = time.perf_counter() - start_time
+        if self._connection_wait is not None:
+            self._connection_wait.observe(wait_seconds)
+        
+        with self._stats_lock:
+            self._checkouts += 1
+            self._total_wait_seconds += wait_seconds
+            self._max_wait_seconds = max(self._max_wait_seconds, wait_seconds)
+        
+        return conn
+    
+    def get_pool_stats(self) -> Dict[str, Any]:
+        """
+        Get connection pool statistics for the current process
         
-        return self.engine.connect()
+        Returns:
+            Dictionary with pool occupancy and connection wait times
+        """
+        with self._stats_lock:
+            stats = {
+                'pid': os.getpid(),
+                'engine_created': self.engine is not None,
+                'pool_size': self.config.pool_size,
+                'max_overflow': self.config.max_overflow,
+                'pool_timeout': self.config.pool_timeout,
+                'checkouts': self._checkouts,
+                'checkout_failures': self._checkout_failures,
+                'avg_wait_ms': round(self._total_wait_seconds / self._checkouts * 1000, 3) if self._checkouts else 0.0,
+                'max_wait_ms': round(self._max_wait_seconds * 1000, 3)
+            }
+        
+        pool = self.engine.pool if self.engine is not None else None
+        if pool is not None and hasattr(pool, 'checkedout'):
+            stats.update({
+                'checked_out': pool.checkedout(),
+                'checked_in': pool.checkedin(),
+                'overflow': pool.overflow(),
+                'status': pool.status()
+            })
+        
+        return stats
     
     def test_connection(self) -> bool:
         """Test database connection"""
@@ -174,38 +484,74 @@ class DatabaseManager:
         """
         try:
             query = f"SELECT COUNT(*) as total FROM {table_name}"
-            with self.get_connection() as conn:
+            with self.get_connection() as conn, self._timed_query('count'):
                 result = pd.read_sql(query, conn)
                 return int(result.iloc[0]['total'])
         except Exception as e:
             logger.error(f"Failed to get count for {table_name}: {str(e)}")
             return None
     
-    def load_data_from_db(self, table_name: str, query: Optional[str] = None, 
-                         chunk_size: Optional[int] = None) -> Optional[pd.DataFrame]:
+    def build_select_query(self, table_name: str, columns: Optional[List[str]] = None,
+                           column_expressions: Optional[Dict[str, str]] = None,
+                           limit: Optional[int] = None, offset: Optional[int] = None):
+        """
+        Build a parameterized SELECT with column projection
+        
+        Args:
+            table_name: Name of the table to query
+            columns: Columns to select (None selects all columns)
+            column_expressions: SQL expressions to select under an alias, e.g.
+                {'provider_name': 'COALESCE(provider_name, Ref_code)'}
+            limit: Maximum number of rows
+            offset: Number of rows to skip
+            
+        Returns:
+            Tuple of (SQLAlchemy text clause, bound parameters)
+        """
+        select_items = [f"`{col}`" for col in (columns or []) if col not in (column_expressions or {})]
+        select_items += [f"{expr} AS `{alias}`" for alias, expr in (column_expressions or {}).items()]
+        projection = ", ".join(select_items) if select_items else "*"
+        
+        params: Dict[str, Any] = {}
+        sql_query = f"SELECT {projection} FROM {table_name}"
+        if limit is not None:
+            sql_query += " LIMIT :limit"
+            params['limit'] = int(limit)
+            if offset is not None:
+                sql_query += " OFFSET :offset"
+                params['offset'] = int(offset)
+        
+        return text(sql_query), params
+    
+    def load_data_from_db(self, table_name: str, query: Optional[Any] = None, 
+                         chunk_size: Optional[int] = None, columns: Optional[List[str]] = None,
+                         params: Optional[Dict[str, Any]] = None) -> Optional[pd.DataFrame]:
         """
         Load data from database table
         
         Args:
             table_name: Name of the table to load
-            query: Custom SQL query (optional)
+            query: Custom SQL query or text clause (optional, overrides the projection)
             chunk_size: Size of chunks to load (optional, for streaming)
+            columns: Columns to load (optional, defaults to all columns)
+            params: Bound parameters for a custom query (optional)
             
         Returns:
             DataFrame with loaded data or None if failed
         """
         try:
-            if query:
-                sql_query = query
+            if query is not None:
+                sql_query = text(query) if isinstance(query, str) else query
+                query_params = params or {}
             else:
-                sql_query = f"SELECT * FROM {table_name}"
+                sql_query, query_params = self.build_select_query(table_name, columns=columns)
             
-            with self.get_connection() as conn:
-                if chunk_size:
-                    # Load in chunks for large datasets
-                    return pd.read_sql(sql_query, conn, chunksize=chunk_size)
-                else:
-                    df = pd.read_sql(sql_query, conn)
+            if chunk_size:
+                # Load in chunks for large datasets (streamed, connection held by the iterator)
+                return self.stream_data_from_db(table_name, sql_query, chunk_size=chunk_size, params=query_params)
+            
+            with self.get_connection() as conn, self._timed_query('load'):
+                df = pd.read_sql(sql_query, conn, params=query_params)
             
             logger.info(f"Successfully loaded {len(df)} rows from {table_name}")
             return df
@@ -214,28 +560,47 @@ class DatabaseManager:
             logger.error(f"Failed to load data from {table_name}: {str(e)}")
             return None
     
-    def stream_data_from_db(self, table_name: str, query: Optional[str] = None, 
-                           chunk_size: int = 10000) -> Iterator[pd.DataFrame]:
+    def stream_data_from_db(self, table_name: str, query: Optional[Any] = None, 
+                           chunk_size: int = 10000, columns: Optional[List[str]] = None,
+                           params: Optional[Dict[str, Any]] = None) -> Iterator[pd.DataFrame]:
         """
         Stream data from database table to reduce memory usage
         
         Args:
             table_name: Name of the table to stream
-            query: Custom SQL query (optional)
+            query: Custom SQL query or text clause (optional, overrides the projection)
             chunk_size: Size of each chunk
+            columns: Columns to load (optional, defaults to all columns)
+            params: Bound parameters for a custom query (optional)
             
         Yields:
             DataFrame chunks
         """
         try:
-            if query:
-                sql_query = query
+            if query is not None:
+                sql_query = text(query) if isinstance(query, str) else query
+                query_params = params or {}
             else:
-                sql_query = f"SELECT * FROM {table_name}"
+                sql_query, query_params = self.build_select_query(table_name, columns=columns)
             
             with self.get_connection() as conn:
-                for chunk in pd.read_sql(sql_query, conn, chunksize=chunk_size):
-                    yield chunk
+                if memory_config.enable_server_side_cursor and not self.is_embedded:
+                    # Unbuffered cursor: rows are fetched from the server as chunks are consumed
+                    # instead of the driver buffering the whole result set up front
+                    conn = conn.execution_options(
+                        stream_results=True,
+                        max_row_buffer=min(memory_config.stream_fetch_size, chunk_size)
+                    )
+                
+                chunks = pd.read_sql(sql_query, conn, params=query_params, chunksize=chunk_size, coerce_float=True)
+                while True:
+                    # Only the fetch of each chunk is timed, not the consumer's work between chunks
+                    started = time.perf_counter()
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        break
+                    self._observe_query(time.perf_counter() - started, 'stream_chunk')
+                    yield self._apply_column_types(chunk)
                     # Force garbage collection after each chunk
                     gc.collect()
                     
@@ -243,6 +608,33 @@ class DatabaseManager:
             logger.error(f"Failed to stream data from {table_name}: {str(e)}")
             yield pd.DataFrame()  # Yield empty DataFrame on error
     
+    @staticmethod
+    def _apply_column_types(chunk: pd.DataFrame) -> pd.DataFrame:
+        """Cast known columns to fixed dtypes so chunks share one schema"""
+        for col, dtype in PRESCRIPTION_DTYPES.items():
+            if col in chunk.columns:
+                try:
+                    chunk[col] = chunk[col].astype(dtype)
+                except (TypeError, ValueError):
+                    # Leave unparseable text (e.g. '1,200') for clean_numeric_column
+                    pass
+        return chunk
+    
+    def get_column_names(self, table_name: str) -> Optional[List[str]]:
+        """
+        Get the column names of a table
+        
+        Args:
+            table_name: Name of the table
+            
+        Returns:
+            List of column names or None if failed
+        """
+        table_info = self.get_table_info(table_name)
+        if table_info is None:
+            return None
+        return [col['name'] for col in table_info['columns']]
+    
     def load_data_in_chunks(self, table_name: str, chunk_size: int = 10000) -> Optional[pd.DataFrame]:
         """
         Load data from database in chunks and combine
@@ -282,6 +674,181 @@ class DatabaseManager:
             logger.error(f"Failed to load data in chunks from {table_name}: {str(e)}")
             return None
     
+    def feature_aggregate_queries(self, table_name: str = 'Prescriptions') -> Dict[str, str]:
+        """
+        FEATURE_AGGREGATE_QUERIES formatted for a table
+
+        Costs are cleaned to whole numbers with NULL as 0, as clean_numeric_column
+        does for the rows.
+
+        Args:
+            table_name: Name of the source table
+
+        Returns:
+            Dictionary of aggregate name to SQL query
+        """
+        if self.is_embedded:
+            cost = "CAST(COALESCE(cost_amount, 0) AS INTEGER)"
+        else:
+            cost = "TRUNCATE(COALESCE(cost_amount, 0), 0)"
+        return {name: query.format(table=table_name, cost=cost) for name, query in FEATURE_AGGREGATE_QUERIES.items()}
+    
+    def add_feature_key_columns(self, table_name: str = 'Prescriptions') -> List[str]:
+        """
+        Add the FEATURE_KEY_COLUMNS a table does not have yet
+        
+        Args:
+            table_name: Name of the table
+            
+        Returns:
+            Names of the columns added
+        """
+        existing = {column.lower() for column in (self.get_column_names(table_name) or [])}
+        missing = [column for column in FEATURE_KEY_COLUMNS if column not in existing]
+        if missing:
+            with self.get_connection() as conn:
+                for column in missing:
+                    conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {column} {FEATURE_KEY_COLUMNS[column]}"))
+                conn.commit()
+            logger.info(f"Added feature key columns to {table_name}: {', '.join(missing)}")
+        return missing
+    
+    def has_feature_key_columns(self, table_name: str = 'Prescriptions') -> bool:
+        """Whether a table has every column of FEATURE_KEY_COLUMNS"""
+        existing = {column.lower() for column in (self.get_column_names(table_name) or [])}
+        return all(column in existing for column in FEATURE_KEY_COLUMNS)
+    
+    def fill_feature_keys(self, conn, table_name: str, month_of: Callable[[pd.Series], pd.Series],
+                          provider_expression: str = '`provider_name`') -> int:
+        """
+        Fill adm_month and provider_key of the rows that do not have them yet
+        
+        Args:
+            conn: Connection to run the update on (committed here)
+            table_name: Name of the table
+            month_of: Maps a series of Adm_date values to their year_month keys
+            provider_expression: SQL expression the rows' provider_name is loaded with
+            
+        Returns:
+            Number of rows filled
+        """
+        try:
+            self.create_month_keys(conn, table_name, month_of, missing_only=True)
+            result = conn.execute(text(f"""
+                UPDATE {table_name}
+                SET adm_month = COALESCE(
+                        (SELECT year_month FROM {ADM_MONTH_TABLE} WHERE {ADM_MONTH_TABLE}.adm_date = {table_name}.Adm_date),
+                        'NaT'
+                    ),
+                    provider_key = COALESCE({provider_expression}, 'None')
+                WHERE adm_month IS NULL
+            """))
+            conn.commit()
+            return result.rowcount
+        finally:
+            self.drop_month_keys(conn)
+    
+    def create_month_keys(self, conn, table_name: str, month_of: Callable[[pd.Series], pd.Series],
+                          missing_only: bool = False) -> int:
+        """
+        Fill ADM_MONTH_TABLE of the connection's session with the year_month of every Adm_date
+
+        The Shamsi dates are converted in Python with the same function the row
+        processing uses, once per distinct date rather than once per row.
+
+        Args:
+            conn: Connection the queries using the keys will run on
+            table_name: Name of the source table
+            month_of: Maps a series of Adm_date values to their year_month keys
+            missing_only: Only map the dates of rows without an adm_month
+
+        Returns:
+            Number of distinct dates mapped
+        """
+        self.drop_month_keys(conn)
+        if self.is_embedded:
+            conn.execute(text(
+                f"CREATE TEMP TABLE {ADM_MONTH_TABLE} (adm_date VARCHAR(20) PRIMARY KEY, year_month VARCHAR(16))"
+            ))
+        else:
+            # Copy the Adm_date column definition so the join compares under the same collation
+            conn.execute(text(
+                f"CREATE TEMPORARY TABLE {ADM_MONTH_TABLE} (PRIMARY KEY (adm_date)) "
+                f"SELECT Adm_date AS adm_date, CAST(NULL AS CHAR(16)) AS year_month FROM {table_name} LIMIT 0"
+            ))
+        condition = "Adm_date IS NOT NULL" + (" AND adm_month IS NULL" if missing_only else "")
+        dates = pd.read_sql(f"SELECT DISTINCT Adm_date FROM {table_name} WHERE {condition}", conn)['Adm_date']
+        if not self.is_embedded:
+            # Dates differing only in trailing spaces are equal under PAD SPACE collations
+            dates = dates[~dates.astype(str).str.rstrip().duplicated()]
+        if dates.empty:
+            return 0
+        mapping = pd.DataFrame({'adm_date': dates.values, 'year_month': month_of(dates).values})
+        conn.execute(
+            text(f"INSERT INTO {ADM_MONTH_TABLE} (adm_date, year_month) VALUES (:adm_date, :year_month)"),
+            mapping.to_dict('records')
+        )
+        return len(mapping)
+    
+    def drop_month_keys(self, conn):
+        """Drop the connection's ADM_MONTH_TABLE, if any, before it returns to the pool"""
+        if self.is_embedded:
+            conn.execute(text(f"DROP TABLE IF EXISTS temp.{ADM_MONTH_TABLE}"))
+        else:
+            conn.execute(text(f"DROP TEMPORARY TABLE IF EXISTS {ADM_MONTH_TABLE}"))
+        # The mapping inserts opened a transaction that would roll the drop back
+        conn.commit()
+    
+    def load_feature_aggregates(self, month_of: Callable[[pd.Series], pd.Series], table_name: str = 'Prescriptions',
+                                provider_expression: str = '`provider_name`') -> Optional[Dict[str, pd.DataFrame]]:
+        """
+        Compute the per-group feature aggregates in the database
+
+        Runs the GROUP BY queries in FEATURE_AGGREGATE_QUERIES server-side so only
+        the aggregate tables are transferred instead of every raw row. Rows added
+        since the keys were last filled get them first.
+
+        Args:
+            month_of: Maps a series of Adm_date values to their year_month keys
+            table_name: Name of the source table
+            provider_expression: SQL expression the rows' provider_name is loaded with
+
+        Returns:
+            Dictionary of aggregate name to DataFrame or None if failed
+        """
+        try:
+            if not self.has_feature_key_columns(table_name):
+                logger.warning(f"{table_name} has no stored feature keys; run "
+                               f"'python scripts/setup_database.py migrate_indexes' to enable aggregate pushdown")
+                return None
+
+            aggregates = {}
+            queries = self.feature_aggregate_queries(table_name)
+            with self.get_connection() as conn:
+                with self._timed_query('aggregate:feature_keys'):
+                    filled = self.fill_feature_keys(conn, table_name, month_of, provider_expression)
+                if filled:
+                    logger.info(f"Filled feature keys of {filled} rows")
+                for name, query in queries.items():
+                    with self._timed_query(f'aggregate:{name}'):
+                        aggregates[name] = pd.read_sql(query, conn)
+                    logger.info(f"Loaded aggregate {name}: {len(aggregates[name])} groups")
+
+            # A raw 'None' key and a NULL key are one group in the rows but two here
+            for name, frame in aggregates.items():
+                duplicated = int(frame.duplicated(FEATURE_AGGREGATE_KEYS[name]).sum())
+                if duplicated:
+                    logger.error(f"Aggregate {name} has {duplicated} duplicate keys ('None' stored as text?)")
+                    return None
+
+            total_groups = sum(len(df) for df in aggregates.values())
+            logger.info(f"Successfully loaded {len(aggregates)} feature aggregates ({total_groups} group rows) from {table_name}")
+            return aggregates
+
+        except Exception as e:
+            logger.error(f"Failed to load feature aggregates from {table_name}: {str(e)}")
+            return None
+
     def execute_query(self, query: str) -> bool:
         """
         Execute a custom SQL query
@@ -293,7 +860,7 @@ class DatabaseManager:
             True if successful, False otherwise
         """
         try:
-            with self.get_connection() as conn:
+            with self.get_connection() as conn, self._timed_query('execute'):
                 conn.execute(text(query))
                 conn.commit()
             logger.info("Query executed successfully")
@@ -313,6 +880,9 @@ class DatabaseManager:
             Dictionary with table information or None if failed
         """
         try:
+            if self.is_embedded:
+                return self._get_sqlite_table_info(table_name)
+            
             query = f"""
             SELECT 
                 COLUMN_NAME,
@@ -351,6 +921,30 @@ class DatabaseManager:
             logger.error(f"Failed to get table info for {table_name}: {str(e)}")
             return None
     
+    def _get_sqlite_table_info(self, table_name: str) -> Optional[Dict[str, Any]]:
+        """get_table_info for the SQLite backend, from PRAGMA table_info"""
+        with self.get_connection() as conn:
+            columns = conn.execute(text(f'PRAGMA table_info("{table_name}")')).fetchall()
+        if not columns:
+            return None
+        
+        table_info = {
+            'table_name': table_name,
+            'columns': [
+                {
+                    'name': col[1],
+                    'type': col[2].split('(')[0].lower(),
+                    'nullable': 'NO' if col[3] or col[5] else 'YES',
+                    'default': col[4],
+                    'comment': None
+                }
+                for col in columns
+            ]
+        }
+        
+        logger.info(f"Retrieved table info for {table_name}")
+        return table_info
+    
     def get_table_size_info(self, table_name: str) -> Optional[Dict[str, Any]]:
         """
         Get table size information for optimization
@@ -362,6 +956,9 @@ class DatabaseManager:
             Dictionary with size information or None if failed
         """
         try:
+            if self.is_embedded:
+                return self._get_sqlite_table_size_info(table_name)
+            
             query = f"""
             SELECT 
                 TABLE_ROWS,
@@ -391,6 +988,31 @@ class DatabaseManager:
             logger.error(f"Failed to get table size info for {table_name}: {str(e)}")
             return None
 
+    def _get_sqlite_table_size_info(self, table_name: str) -> Dict[str, Any]:
+        """get_table_size_info for the SQLite backend, sizes from the dbstat table when compiled in"""
+        with self.get_connection() as conn:
+            rows = conn.execute(text(f"SELECT COUNT(*) FROM {table_name}")).scalar()
+            try:
+                sizes = dict(conn.execute(text(
+                    "SELECT CASE WHEN m.type = 'table' THEN 'data' ELSE 'index' END, SUM(s.pgsize) "
+                    "FROM dbstat s JOIN sqlite_master m ON m.name = s.name "
+                    "WHERE m.tbl_name = :table GROUP BY 1"
+                ), {'table': table_name}).fetchall())
+            except SQLAlchemyError:
+                sizes = {}
+        
+        def megabytes(size: Optional[int]) -> Optional[float]:
+            return round(size / 1024 / 1024, 2) if size is not None else None
+        
+        total = sum(sizes.values()) if sizes else None
+        return {
+            'table_name': table_name,
+            'estimated_rows': int(rows),
+            'data_size_mb': megabytes(sizes.get('data')),
+            'index_size_mb': megabytes(sizes.get('index')),
+            'total_size_mb': megabytes(total)
+        }
+
 # Global configuration instances
 db_config = DatabaseConfig()
 model_config = ModelConfig()
@@ -401,6 +1023,14 @@ api_config = APIConfig()
 # Global database manager instance
 db_manager = DatabaseManager()
 
+def _reset_managers_after_fork():
+    """Dispose engines inherited from the parent (e.g. the gunicorn master)"""
+    for manager in list(_db_managers):
+        manager.dispose_after_fork()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_managers_after_fork)
+
 def get_config() -> Dict[str, Any]:
     """Get all configuration as dictionary"""
     return {
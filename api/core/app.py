@@ -1,3 +1,4 @@
+import atexit
 import os
 import sys
 
@@ -11,7 +12,7 @@ os.environ.setdefault('MAX_MEMORY_USAGE_MB', '2048')
 os.environ.setdefault('SKIP_DB_INIT', 'True')
 os.environ.setdefault('GUNICORN_MODE', 'True')  # Enable Gunicorn optimizations
 
-from flask import Flask, jsonify, render_template_string
+from flask import Flask, Response, g, jsonify, render_template_string, request
 from flask_cors import CORS
 from flasgger import Swagger
 import pandas as pd
@@ -22,6 +23,8 @@ import logging
 from typing import Optional, Dict, Any
 import gc
 import psutil
+import shutil
+import tempfile
 import threading
 import time
 
@@ -31,19 +34,21 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from config.config import api_config, app_config, db_config, memory_config
-from core.exceptions import handle_exception, FraudDetectionError
-from config.config import get_db_manager
+from core.exceptions import handle_exception, FraudDetectionError, FeatureExtractionError
+from config.config import PROVIDER_NAME_EXPRESSION, get_db_manager
 from services.prediction_service import PredictionService
 from services.chart_service import ChartService
 from routes.prediction_routes import prediction_bp, init_prediction_service
 from routes.chart_routes import chart_bp, init_chart_services
-from routes.services_routes import services_bp
+from routes.services_routes import services_bp, get_catalog_service
+from routes.profiling_routes import profiling_bp
+from services import metrics
 
 # Import custom functions
 from functions.age_calculate_function import calculate_age
-from functions.shamsi_to_miladi_function import shamsi_to_miladi
+from functions.shamsi_to_miladi_function import shamsi_to_miladi, shamsi_year_month
 from functions.add_one_month_function import add_one_month
-from core.utils import clean_numeric_column, memory_usage_optimizer
+from core.utils import clean_key_column, clean_numeric_column, memory_usage_optimizer
 
 # Configure logging
 logging.basicConfig(
@@ -61,6 +66,13 @@ warnings.filterwarnings('ignore')
 pd.set_option('display.max_column', 50)
 pd.set_option('display.max_rows', 100)
 
+# Columns needed by chunk processing, feature extraction and chart metadata
+SOURCE_COLUMNS = [
+    'ID', 'provider_name', 'Service', 'provider_specialty', 'cost_amount',
+    'Adm_date', 'jalali_date', 'gender', 'province', 'Ins_Cover',
+    'Invice-type', 'Type_Medical_Record'
+]
+
 class LazyDataLoader:
     """Lazy data loader that streams data from database"""
     
@@ -69,6 +81,28 @@ class LazyDataLoader:
         self.db_manager = get_db_manager()
         self._data_cache = {}
         self._cache_lock = threading.Lock()
+        self._projection = None
+    
+    def _get_projection(self) -> Dict[str, Any]:
+        """Resolve the column projection against the columns the table actually has"""
+        if self._projection is None:
+            table_columns = self.db_manager.get_column_names('Prescriptions')
+            if not table_columns:
+                # Table metadata unavailable, select everything
+                return {'columns': None, 'column_expressions': None}
+            
+            columns = [col for col in SOURCE_COLUMNS if col in table_columns]
+            column_expressions = None
+            if {'Ref_code', 'Ref_name'}.issubset(table_columns):
+                column_expressions = {'provider_name': PROVIDER_NAME_EXPRESSION}
+            self._projection = {'columns': columns, 'column_expressions': column_expressions}
+            logger.info(f"Loading {len(columns)} of {len(table_columns)} Prescriptions columns")
+        return self._projection
+        
+    def get_provider_expression(self) -> str:
+        """SQL expression the provider_name of the loaded rows is selected with"""
+        column_expressions = self._get_projection()['column_expressions'] or {}
+        return column_expressions.get('provider_name', '`provider_name`')
         
     def get_data_chunk(self, chunk_id: int) -> Optional[pd.DataFrame]:
         """Get a specific chunk of data"""
@@ -76,10 +110,12 @@ class LazyDataLoader:
             if chunk_id in self._data_cache:
                 return self._data_cache[chunk_id]
             
-            # Load chunk from database
+            # Load chunk from database, shipping only the columns that are used
             offset = chunk_id * self.chunk_size
-            query = f"SELECT * FROM Prescriptions LIMIT {self.chunk_size} OFFSET {offset}"
-            chunk = self.db_manager.load_data_from_db('Prescriptions', query)
+            query, params = self.db_manager.build_select_query(
+                'Prescriptions', limit=self.chunk_size, offset=offset, **self._get_projection()
+            )
+            chunk = self.db_manager.load_data_from_db('Prescriptions', query, params=params)
             
             if chunk is not None and not chunk.empty:
                 # Process chunk
@@ -99,32 +135,36 @@ class LazyDataLoader:
         """Process a single chunk of data"""
         # Clean numeric columns
         chunk['cost_amount'] = clean_numeric_column(chunk['cost_amount'], 'cost_amount')
-        chunk['ded_amount'] = clean_numeric_column(chunk['ded_amount'], 'ded_amount')
-        chunk['confirmed_amount'] = clean_numeric_column(chunk['confirmed_amount'], 'confirmed_amount')
+        for col in ['ded_amount', 'confirmed_amount']:
+            if col in chunk.columns:
+                chunk[col] = clean_numeric_column(chunk[col], col)
         
-        # Fill missing provider names
-        chunk['provider_name'] = chunk['provider_name'].fillna(chunk['Ref_code'])
-        chunk['provider_name'] = chunk['provider_name'].fillna(chunk['Ref_name'])
+        # Fill missing provider names (already resolved in the query when projected)
+        for col in ['Ref_code', 'Ref_name']:
+            if col in chunk.columns:
+                chunk['provider_name'] = chunk['provider_name'].fillna(chunk[col])
         
         # Add age column
         chunk['age'] = chunk['jalali_date'].apply(calculate_age)
         
         # Convert dates
         chunk['Adm_date'] = chunk['Adm_date'].apply(shamsi_to_miladi)
-        chunk['confirm_date'] = chunk['confirm_date'].apply(shamsi_to_miladi)
-        chunk['confirm_date'] = chunk['confirm_date'].fillna(chunk['Adm_date'].apply(add_one_month))
+        if 'confirm_date' in chunk.columns:
+            chunk['confirm_date'] = chunk['confirm_date'].apply(shamsi_to_miladi)
+            chunk['confirm_date'] = chunk['confirm_date'].fillna(chunk['Adm_date'].apply(add_one_month))
         
         # Reset confirmed amount
-        chunk['confirmed_amount'] = chunk['confirmed_amount'].fillna(0)
+        if 'confirmed_amount' in chunk.columns:
+            chunk['confirmed_amount'] = chunk['confirmed_amount'].fillna(0)
         chunk['Adm_date'] = pd.to_datetime(chunk['Adm_date'])
         chunk['year_month'] = chunk['Adm_date'].dt.to_period('M')
         
-        # Ensure consistent data types
-        chunk['ID'] = chunk['ID'].astype(str)
-        chunk['provider_name'] = chunk['provider_name'].astype(str)
-        chunk['Service'] = chunk['Service'].astype(str)
-        chunk['provider_specialty'] = chunk['provider_specialty'].astype(str)
-        chunk['year_month'] = chunk['year_month'].astype(str)
+        # Ensure consistent data types; missing keys become 'None' and unconverted months 'NaT'
+        chunk['ID'] = clean_key_column(chunk['ID'])
+        chunk['provider_name'] = clean_key_column(chunk['provider_name'])
+        chunk['Service'] = clean_key_column(chunk['Service'])
+        chunk['provider_specialty'] = clean_key_column(chunk['provider_specialty'])
+        chunk['year_month'] = clean_key_column(chunk['year_month'], 'NaT')
         
         return chunk
     
@@ -155,6 +195,9 @@ class FraudDetectionApp:
         self._configure_app()
         self._register_blueprints()
         self._register_error_handlers()
+        self._register_metrics()
+        # Join the chart render workers when the process exits
+        atexit.register(self._close_chart_service)
         
         # Initialize services immediately (synchronous for Gunicorn compatibility)
         self._initialize_services_sync()
@@ -207,6 +250,7 @@ class FraudDetectionApp:
         self.app.register_blueprint(prediction_bp)
         self.app.register_blueprint(chart_bp)
         self.app.register_blueprint(services_bp)
+        self.app.register_blueprint(profiling_bp)
     
     def _register_error_handlers(self):
         """Register error handlers"""
@@ -226,6 +270,58 @@ class FraudDetectionApp:
             else:
                 return handle_exception(e)
     
+    def _register_metrics(self):
+        """Record request counts and latencies, and expose cache statistics as metrics"""
+        @self.app.before_request
+        def start_request_timer():
+            g.request_started = time.perf_counter()
+        
+        @self.app.after_request
+        def record_request_metrics(response):
+            started = g.pop('request_started', None)
+            if started is not None:
+                # Route templates rather than paths keep label cardinality bounded
+                route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+                metrics.http_requests.inc(method=request.method, route=route, status=str(response.status_code))
+                metrics.http_request_duration.observe(time.perf_counter() - started, method=request.method, route=route)
+                if response.status_code >= 500:
+                    metrics.http_request_errors.inc(method=request.method, route=route)
+            return response
+        
+        get_db_manager().instrument(metrics.db_query_duration, metrics.db_connection_wait)
+        
+        def cache_lookups():
+            lookups = {}
+            if self.chart_service is not None:
+                chart = self.chart_service.cache.get_stats()
+                lookups[('chart', 'hit')] = chart['hits']
+                lookups[('chart', 'miss')] = chart['misses']
+                shaping = self.chart_service.render_pool.get_stats()['text_shaping']
+                lookups[('text_shaping', 'hit')] = shaping['hits']
+                lookups[('text_shaping', 'miss')] = shaping['misses']
+            catalog = get_catalog_service().get_stats()
+            lookups[('catalog', 'hit')] = catalog['hits']
+            lookups[('catalog', 'miss')] = catalog['loads']
+            return lookups
+        
+        def cache_hit_ratios():
+            lookups = cache_lookups()
+            ratios = {}
+            for cache in {cache for cache, _ in lookups}:
+                total = lookups[(cache, 'hit')] + lookups[(cache, 'miss')]
+                ratios[(cache,)] = lookups[(cache, 'hit')] / total if total else 0.0
+            return ratios
+        
+        metrics.registry.callback(
+            'cache_lookups_total', 'Cache lookups by cache and outcome', ('cache', 'result'),
+            cache_lookups, type_name='counter'
+        )
+        metrics.registry.callback('cache_hit_ratio', 'Share of cache lookups that hit', ('cache',), cache_hit_ratios)
+        metrics.registry.callback(
+            'process_resident_memory_bytes', 'Resident memory of this worker', (),
+            lambda: {(): psutil.Process(os.getpid()).memory_info().rss}
+        )
+    
     def _log_memory_usage(self, stage: str):
         """Log current memory usage"""
         process = psutil.Process(os.getpid())
@@ -277,11 +373,21 @@ class FraudDetectionApp:
                     # Train model with streaming data
                     logger.info("Starting model training...")
                     self._train_model_with_streaming()
+                    # Catalog lists may predate the data just trained on
+                    get_catalog_service().invalidate()
             
             # Initialize chart service
             if self.prediction_service.is_ready():
                 logger.info("Initializing chart service...")
-                self.chart_service = ChartService(self.prediction_service.data_final)
+                self._close_chart_service()
+                self.chart_service = ChartService(
+                    self.prediction_service.data_final,
+                    model_version=self.prediction_service.model_version,
+                    cube=self.prediction_service.get_aggregate_cube(),
+                    entity_index=self.prediction_service.get_entity_index()
+                )
+                if memory_config.enable_chart_prerender:
+                    self.chart_service.prerender_static_charts(background=True)
                 
                 # Initialize route services
                 logger.info("Initializing route services...")
@@ -299,7 +405,13 @@ class FraudDetectionApp:
             logger.error(f"Error in synchronous service initialization: {str(e)}")
             logger.error("Application will continue without prediction services")
             self.prediction_service = None
-            self.chart_service = None
+            self._close_chart_service()
+    
+    def _close_chart_service(self):
+        """Stop the render pool of the current chart service before it is dropped or replaced"""
+        chart_service, self.chart_service = self.chart_service, None
+        if chart_service is not None:
+            chart_service.close()
     
     def _train_model_with_streaming(self):
         """Train model using streaming data to reduce memory usage"""
@@ -314,6 +426,21 @@ class FraudDetectionApp:
                 
             logger.info(f"Total chunks to process: {total_chunks}")
             
+            # The SQL backend computes the features over a snapshot of the whole table
+            if memory_config.feature_backend == 'duckdb':
+                self._train_model_from_snapshot(total_chunks)
+                return
+            
+            # Optionally compute the monthly group aggregates in the database
+            aggregates = None
+            if memory_config.enable_aggregate_pushdown:
+                logger.info("Loading feature aggregates from database (aggregate pushdown)...")
+                aggregates = self.data_loader.db_manager.load_feature_aggregates(
+                    shamsi_year_month, 'Prescriptions', provider_expression=self.data_loader.get_provider_expression()
+                )
+                if aggregates is None:
+                    logger.warning("Aggregate pushdown failed, falling back to per-chunk aggregation")
+            
             # Process chunks and collect features
             all_features = []
             all_metadata = []
@@ -326,12 +453,12 @@ class FraudDetectionApp:
                     
                     if chunk is not None and not chunk.empty:
                         # Extract features from chunk
-                        features = self._extract_features_from_chunk(chunk)
+                        features = self._extract_features_from_chunk(chunk, aggregates)
                         if features is not None:
                             all_features.append(features)
                             all_metadata.append(chunk[['Adm_date', 'gender', 'age', 'Service', 'province',
                                                      'Ins_Cover', 'Invice-type', 'Type_Medical_Record',
-                                                     'provider_name', 'ID']].copy())
+                                                     'provider_name', 'provider_specialty', 'ID']].copy())
                             processed_chunks += 1
                         
                         # Clear chunk from cache to save memory
@@ -376,16 +503,58 @@ class FraudDetectionApp:
             logger.error(f"Error training model with streaming data: {str(e)}")
             raise
     
-    def _extract_features_from_chunk(self, chunk: pd.DataFrame) -> Optional[pd.DataFrame]:
-        """Extract features from a single chunk"""
+    def _train_model_from_snapshot(self, total_chunks: int):
+        """Write the processed chunks to a Parquet snapshot and train on it out-of-core"""
+        from services.sql_feature_extractor import write_snapshot
+        
+        temp_dir = memory_config.sql_engine_temp_dir or None
+        if temp_dir:
+            os.makedirs(temp_dir, exist_ok=True)
+        snapshot_dir = tempfile.mkdtemp(prefix='prescriptions_snapshot_', dir=temp_dir)
         try:
-            from services.feature_extractor import FeatureExtractor
+            logger.info(f"Writing Prescriptions snapshot to {snapshot_dir}...")
+            rows = write_snapshot(self._iter_data_chunks(total_chunks), snapshot_dir)
+            if rows == 0:
+                raise Exception("No data available for training")
+            self._log_memory_usage("after_snapshot")
             
-            # Create feature extractor for this chunk
-            feature_extractor = FeatureExtractor(chunk)
+            logger.info("Training Isolation Forest model on snapshot features...")
+            self.prediction_service.train_model(snapshot_dir)
             
-            # Extract features
-            chunk_with_features = feature_extractor.extract_all_features()
+            logger.info("Model training from snapshot completed successfully")
+        finally:
+            shutil.rmtree(snapshot_dir, ignore_errors=True)
+    
+    def _iter_data_chunks(self, total_chunks: int):
+        """Yield the processed chunks one at a time, dropping each from the cache"""
+        for chunk_id in range(total_chunks):
+            logger.info(f"Processing chunk {chunk_id + 1}/{total_chunks}")
+            chunk = self.data_loader.get_data_chunk(chunk_id)
+            self.data_loader.clear_cache()
+            if chunk is None or chunk.empty:
+                logger.warning(f"Chunk {chunk_id + 1} is empty or None")
+                continue
+            yield chunk
+    
+    def _extract_features_from_chunk(self, chunk: pd.DataFrame,
+                                     aggregates: Optional[Dict[str, pd.DataFrame]] = None) -> Optional[pd.DataFrame]:
+        """Extract features from a single chunk, joining pushed-down aggregates if given"""
+        try:
+            from services.feature_extractor import FeatureExtractor, create_feature_extractor
+            
+            chunk_with_features = None
+            if aggregates is not None:
+                # Group statistics were computed in the database over the whole table
+                try:
+                    chunk_with_features = FeatureExtractor(chunk).extract_features_from_aggregates(aggregates)
+                except FeatureExtractionError as e:
+                    logger.warning(f"Aggregate pushdown does not cover this chunk, aggregating it in pandas: {e.message}")
+            if chunk_with_features is None:
+                # Create feature extractor for this chunk (pandas or SQL backend)
+                feature_extractor = create_feature_extractor(chunk)
+                
+                # Extract features
+                chunk_with_features = feature_extractor.extract_all_features()
             
             # Return only feature columns
             feature_columns = [
@@ -608,6 +777,8 @@ class FraudDetectionApp:
                 'memory_usage_mb': round(memory_mb, 2),
                 'services_initialized': self._services_initialized,
                 'cache_size': len(self.data_loader._data_cache),
+                'chart_cache': self.chart_service.get_cache_stats() if self.chart_service else None,
+                'catalog_cache': get_catalog_service().get_stats(),
                 'memory_config': {
                     'chunk_size': memory_config.chunk_size,
                     'max_cache_size': memory_config.max_cache_size,
@@ -618,13 +789,29 @@ class FraudDetectionApp:
                 'timestamp': datetime.now().isoformat()
             })
         
+        @self.app.route('/metrics')
+        def metrics_endpoint():
+            """Prometheus metrics of this worker process"""
+            return Response(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+        
+        @self.app.route('/db/pool')
+        def pool_status():
+            """Database connection pool statistics for this worker process"""
+            return jsonify({
+                'pool': self.data_loader.db_manager.get_pool_stats(),
+                'timestamp': datetime.now().isoformat()
+            })
+
         @self.app.route('/cache/clear')
         def clear_cache():
-            """Clear data cache endpoint"""
+            """Clear data, chart and catalog cache endpoint"""
             self.data_loader.clear_cache()
+            charts_cleared = self.chart_service.invalidate_cache() if self.chart_service else 0
+            get_catalog_service().invalidate()
             return jsonify({
                 'status': 'success',
                 'message': 'Cache cleared successfully',
+                'charts_cleared': charts_cleared,
                 'timestamp': datetime.now().isoformat()
             })
     
@@ -675,5 +862,7 @@ if __name__ == '__main__':
     
     fraud_app.run()
 
-application_instance = create_app()
-app = application_instance.app
\ No newline at end of file
+# Chart render workers import the entry script as __mp_main__; they must not build the app
+if __name__ != '__mp_main__':
+    application_instance = create_app()
+    app = application_instance.app
\ No newline at end of file
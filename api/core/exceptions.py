@@ -43,6 +43,19 @@ class ChartGenerationError(FraudDetectionError):
         super().__init__(message, status_code=500)
         self.chart_type = chart_type
 
+class ServiceOverloadedError(FraudDetectionError):
+    """Raised when a bounded resource is saturated and the request should be retried later"""
+    def __init__(self, message: str, retry_after: int = 1, resource: Optional[str] = None):
+        super().__init__(message, status_code=503, details={'retry_after': retry_after})
+        self.retry_after = retry_after
+        self.resource = resource
+
+class FeatureExtractionError(FraudDetectionError):
+    """Raised when features cannot be extracted from the data"""
+    def __init__(self, message: str, feature: Optional[str] = None):
+        super().__init__(message, status_code=500)
+        self.feature = feature
+
 def handle_exception(error: Exception):
     """Global exception handler"""
     if isinstance(error, FraudDetectionError):
@@ -51,6 +64,8 @@ def handle_exception(error: Exception):
             'status_code': error.status_code,
             'details': error.details
         }
+        if isinstance(error, ServiceOverloadedError):
+            return jsonify(response), error.status_code, {'Retry-After': str(error.retry_after)}
         return jsonify(response), error.status_code
     
     # Handle unexpected errors
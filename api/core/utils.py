@@ -242,6 +242,22 @@ def clean_numeric_column(series: pd.Series, column_name: str) -> pd.Series:
         logger.error(f"Error cleaning {column_name}: {str(e)}")
         raise
 
+def clean_key_column(series: pd.Series, missing: str = 'None') -> pd.Series:
+    """
+    Convert a group key column to strings with a placeholder for missing values
+    
+    Missing keys form their own group, as they do in the aggregate queries,
+    instead of being dropped by groupby.
+    
+    Args:
+        series: Pandas Series of keys
+        missing: String used for missing keys
+        
+    Returns:
+        String Series without missing values
+    """
+    return series.astype(object).where(series.notna(), missing).astype(str)
+
 def validate_date_range(date_series: pd.Series, min_year: int = 1300, 
                        max_year: int = 1500) -> pd.Series:
     """
@@ -7,6 +7,7 @@ import re
 from typing import Dict, Any, List, Optional
 from datetime import datetime
 from .exceptions import ValidationError
+from services.time_series import DATE_BUCKETS
 
 def validate_prescription_data(data: Dict[str, Any]) -> Dict[str, Any]:
     """
@@ -155,6 +156,10 @@ def validate_string_field(value: Any, field_name: str, max_length: int = 255, mi
     
     return value
 
+# Point limits accepted by the date series charts
+MIN_DATE_CHART_POINTS = 10
+MAX_DATE_CHART_POINTS = 5000
+
 def validate_chart_parameters(params: Dict[str, Any], chart_type: str) -> Dict[str, Any]:
     """
     Validate chart generation parameters
@@ -193,6 +198,22 @@ def validate_chart_parameters(params: Dict[str, Any], chart_type: str) -> Dict[s
         
         params['indicator'] = validate_string_field(params['indicator'], 'indicator')
     
+    elif chart_type in ('fraud_counts_by_date', 'fraud_ratio_by_date'):
+        if params.get('bucket') is not None:
+            params['bucket'] = str(params['bucket']).strip().lower()
+            if params['bucket'] not in DATE_BUCKETS:
+                raise ValidationError(f"bucket must be one of {', '.join(DATE_BUCKETS)}", field='bucket')
+        
+        if params.get('points') is not None:
+            try:
+                params['points'] = int(params['points'])
+            except (ValueError, TypeError):
+                raise ValidationError("points must be a valid integer", field='points')
+            if not MIN_DATE_CHART_POINTS <= params['points'] <= MAX_DATE_CHART_POINTS:
+                raise ValidationError(
+                    f"points must be between {MIN_DATE_CHART_POINTS} and {MAX_DATE_CHART_POINTS}", field='points'
+                )
+    
     elif chart_type == 'risk_indicators':
         if 'risk_values' not in params:
             raise ValidationError("risk_values are required for risk indicators chart")
@@ -214,6 +235,183 @@ def validate_chart_parameters(params: Dict[str, Any], chart_type: str) -> Dict[s
     
     return params
 
+# Chart filters selecting rows by category, keyed by query parameter name
+CHART_CATEGORY_FILTERS = ('province', 'service', 'specialty')
+
+def validate_chart_filters(params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Validate optional chart filters
+    
+    Args:
+        params: from/to admission dates (YYYY-MM-DD, inclusive) and lists of
+            province, service and specialty values
+        
+    Returns:
+        Filters that were given, with dates normalized and category values
+        deduplicated and sorted
+        
+    Raises:
+        ValidationError: If validation fails
+    """
+    filters = {}
+    for name in ('from', 'to'):
+        value = params.get(name)
+        if value is None or value == '':
+            continue
+        try:
+            filters[name] = datetime.strptime(str(value).strip(), '%Y-%m-%d').strftime('%Y-%m-%d')
+        except ValueError:
+            raise ValidationError(f"{name} must be a date in YYYY-MM-DD format", field=name)
+    if 'from' in filters and 'to' in filters and filters['from'] > filters['to']:
+        raise ValidationError("from must not be after to", field='from')
+    
+    for name in CHART_CATEGORY_FILTERS:
+        values = params.get(name)
+        if values is None or values == '' or values == []:
+            continue
+        if isinstance(values, str):
+            values = [values]
+        if not isinstance(values, list):
+            raise ValidationError(f"{name} must be a string or a list of strings", field=name)
+        cleaned = set()
+        for value in values:
+            if not isinstance(value, str) or not value.strip():
+                raise ValidationError(f"{name} values must be non-empty strings", field=name)
+            if len(value) > 255:
+                raise ValidationError(f"{name} values cannot exceed 255 characters", field=name)
+            cleaned.add(value.strip())
+        filters[name] = sorted(cleaned)
+    
+    return filters
+
+# Page sizes and response formats of the provider list
+DEFAULT_PROVIDER_PAGE_SIZE = 100
+MAX_PROVIDER_PAGE_SIZE = 1000
+PROVIDER_LIST_FORMATS = ('json', 'ndjson')
+
+def validate_provider_page(params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Validate provider list pagination parameters
+    
+    Args:
+        params: limit, cursor and format (json or ndjson)
+        
+    Returns:
+        Integer limit, cursor (None when not given) and format; the limit defaults to
+        DEFAULT_PROVIDER_PAGE_SIZE for json and is None (no limit) for a streamed ndjson list
+        
+    Raises:
+        ValidationError: If validation fails
+    """
+    limit = params.get('limit')
+    if limit is None or limit == '':
+        limit = None
+    else:
+        try:
+            limit = int(limit)
+        except (ValueError, TypeError):
+            raise ValidationError("limit must be a valid integer", field='limit')
+        if not 1 <= limit <= MAX_PROVIDER_PAGE_SIZE:
+            raise ValidationError(f"limit must be between 1 and {MAX_PROVIDER_PAGE_SIZE}", field='limit')
+    
+    cursor = params.get('cursor') or None
+    if cursor is not None and (not isinstance(cursor, str) or len(cursor) > 2048):
+        raise ValidationError("cursor is not a valid provider cursor", field='cursor')
+    
+    response_format = str(params.get('format') or 'json').strip().lower()
+    if response_format not in PROVIDER_LIST_FORMATS:
+        raise ValidationError(f"format must be one of {', '.join(PROVIDER_LIST_FORMATS)}", field='format')
+    
+    if limit is None and response_format != 'ndjson':
+        limit = DEFAULT_PROVIDER_PAGE_SIZE
+    
+    return {'limit': limit, 'cursor': cursor, 'format': response_format}
+
+# Result sizes of the provider typeahead search
+DEFAULT_PROVIDER_SEARCH_LIMIT = 20
+MAX_PROVIDER_SEARCH_LIMIT = 100
+MAX_PROVIDER_SEARCH_QUERY_LENGTH = 100
+
+def validate_provider_search(params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Validate provider search parameters
+    
+    Args:
+        params: q (typed text, may be empty) and limit
+        
+    Returns:
+        Query string and integer limit
+        
+    Raises:
+        ValidationError: If validation fails
+    """
+    query = params.get('q') or ''
+    if not isinstance(query, str):
+        raise ValidationError("q must be a string", field='q')
+    if len(query) > MAX_PROVIDER_SEARCH_QUERY_LENGTH:
+        raise ValidationError(f"q cannot exceed {MAX_PROVIDER_SEARCH_QUERY_LENGTH} characters", field='q')
+    
+    limit = params.get('limit')
+    if limit is None or limit == '':
+        limit = DEFAULT_PROVIDER_SEARCH_LIMIT
+    try:
+        limit = int(limit)
+    except (ValueError, TypeError):
+        raise ValidationError("limit must be a valid integer", field='limit')
+    if not 1 <= limit <= MAX_PROVIDER_SEARCH_LIMIT:
+        raise ValidationError(f"limit must be between 1 and {MAX_PROVIDER_SEARCH_LIMIT}", field='limit')
+    
+    return {'q': query, 'limit': limit}
+
+# Bounds of a continuous profiler run requested through /profiling/sampler/start
+MIN_PROFILER_INTERVAL_MS = 1.0
+MAX_PROFILER_INTERVAL_MS = 1000.0
+MAX_PROFILER_DURATION_S = 3600
+
+def validate_profiler_start(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Validate the options of a continuous profiler run
+    
+    Args:
+        data: Optional interval_ms, duration_s and include_idle
+        
+    Returns:
+        Interval and duration in seconds (None for the configured defaults) and include_idle
+        
+    Raises:
+        ValidationError: If validation fails
+    """
+    if not isinstance(data, dict):
+        raise ValidationError("Input must be a JSON object")
+    
+    interval = data.get('interval_ms')
+    if interval is not None:
+        try:
+            interval = float(interval)
+        except (ValueError, TypeError):
+            raise ValidationError("interval_ms must be a number", field='interval_ms')
+        if not MIN_PROFILER_INTERVAL_MS <= interval <= MAX_PROFILER_INTERVAL_MS:
+            raise ValidationError(
+                f"interval_ms must be between {MIN_PROFILER_INTERVAL_MS:g} and {MAX_PROFILER_INTERVAL_MS:g}",
+                field='interval_ms'
+            )
+        interval /= 1000
+    
+    duration = data.get('duration_s')
+    if duration is not None:
+        try:
+            duration = float(duration)
+        except (ValueError, TypeError):
+            raise ValidationError("duration_s must be a number", field='duration_s')
+        if not 0 < duration <= MAX_PROFILER_DURATION_S:
+            raise ValidationError(f"duration_s must be between 0 and {MAX_PROFILER_DURATION_S}", field='duration_s')
+    
+    include_idle = data.get('include_idle', False)
+    if not isinstance(include_idle, bool):
+        raise ValidationError("include_idle must be a boolean", field='include_idle')
+    
+    return {'interval': interval, 'duration': duration, 'include_idle': include_idle}
+
 def sanitize_input(data: Any) -> Any:
     """
     Basic input sanitization
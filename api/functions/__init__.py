@@ -8,7 +8,7 @@ Each function is designed to extract specific features from prescription data.
 # Import all feature functions for easy access
 from .age_calculate_function import calculate_age
 from .add_one_month_function import add_one_month
-from .shamsi_to_miladi_function import shamsi_to_miladi
+from .shamsi_to_miladi_function import shamsi_to_miladi, shamsi_year_month
 from .normalazation_function import normalize_features, normalize_single_record
 
 # Feature extraction functions
@@ -29,6 +29,7 @@ __all__ = [
     'calculate_age',
     'add_one_month',
     'shamsi_to_miladi',
+    'shamsi_year_month',
     'normalize_features',
     'normalize_single_record',
     
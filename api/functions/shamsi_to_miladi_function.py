@@ -73,6 +73,19 @@ def shamsi_to_miladi_batch(dates: pd.Series) -> pd.Series:
         print(f"Error in batch date conversion: {str(e)}")
         return pd.Series([None] * len(dates))
 
+def shamsi_year_month(dates: pd.Series) -> pd.Series:
+    """
+    Gregorian year-month keys of a series of Persian dates
+
+    Args:
+        dates: Series of Persian dates
+
+    Returns:
+        Series of 'YYYY-MM' strings, 'NaT' for missing or invalid dates
+    """
+    months = pd.to_datetime(dates.apply(shamsi_to_miladi)).dt.to_period('M')
+    return months.astype(object).where(months.notna(), 'NaT').astype(str)
+
 def miladi_to_shamsi(date_obj: Union[datetime, pd.Timestamp, None]) -> Optional[str]:
     """
     Convert Gregorian (Miladi) date to Persian (Shamsi) date
@@ -22,7 +22,7 @@ if __name__ == '__main__':
     # Create and run the application
     fraud_app = create_app()
     fraud_app.run()
-else:
-    # For WSGI servers like Gunicorn
+elif __name__ != '__mp_main__':
+    # For WSGI servers like Gunicorn (chart render workers import this file as __mp_main__)
     fraud_app = create_app()
     app = fraud_app.app
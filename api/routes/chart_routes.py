@@ -3,14 +3,22 @@ Chart routes for fraud detection API
 مسیرهای نمودار برای API تشخیص تقلب
 """
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context
 from flasgger import swag_from
 from services.chart_service import ChartService
+from services.chart_renderer import IMAGE_MIMETYPES
 from services.prediction_service import PredictionService
-from core.validators import validate_chart_parameters, validate_prescription_data, sanitize_input
-from core.exceptions import ValidationError, ChartGenerationError, ModelNotReadyError
+from core.validators import (
+    validate_chart_parameters, validate_chart_filters, validate_prescription_data, sanitize_input,
+    CHART_CATEGORY_FILTERS
+)
+from core.exceptions import ValidationError, ChartGenerationError, ModelNotReadyError, ServiceOverloadedError
 from config.config import app_config
+import hashlib
+import json
+import time
 import logging
+from typing import Any, Mapping
 
 logger = logging.getLogger(__name__)
 
@@ -21,16 +29,313 @@ chart_bp = Blueprint('charts', __name__, url_prefix='/charts')
 chart_service = None
 prediction_service = None
 
+# Query parameters selecting the response format and image resolution
+CHART_FORMAT_PARAMETER = {
+    'in': 'query',
+    'name': 'format',
+    'type': 'string',
+    'enum': ['image', 'data', 'png', 'svg', 'webp'],
+    'default': 'image',
+    'required': False,
+    'description': 'image returns a base64 PNG in JSON; data returns the aggregated series as JSON; png, svg and webp return raw image bytes'
+}
+
+# The risk indicator chart answers with the prediction alongside the chart, so it has no raw image formats
+RISK_INDICATOR_FORMATS = ('image', 'data')
+RISK_INDICATOR_FORMAT_PARAMETER = dict(
+    CHART_FORMAT_PARAMETER,
+    enum=list(RISK_INDICATOR_FORMATS),
+    description='image returns a base64 PNG in JSON; data returns the indicator values as JSON'
+)
+
+CHART_IMAGE_PARAMETERS = [
+    {
+        'in': 'query',
+        'name': 'dpi',
+        'type': 'integer',
+        'required': False,
+        'description': 'Resolution of raw image formats (defaults to the configured chart DPI)'
+    },
+    {
+        'in': 'query',
+        'name': 'width',
+        'type': 'integer',
+        'required': False,
+        'description': 'Approximate image width in pixels for raw image formats'
+    },
+    {
+        'in': 'query',
+        'name': 'height',
+        'type': 'integer',
+        'required': False,
+        'description': 'Approximate image height in pixels for raw image formats'
+    }
+]
+
+# Optional filters restricting the rows a chart is built from
+CHART_FILTER_PARAMETERS = [
+    {
+        'in': 'query',
+        'name': 'from',
+        'type': 'string',
+        'format': 'date',
+        'required': False,
+        'description': 'First admission date to include (YYYY-MM-DD)'
+    },
+    {
+        'in': 'query',
+        'name': 'to',
+        'type': 'string',
+        'format': 'date',
+        'required': False,
+        'description': 'Last admission date to include (YYYY-MM-DD)'
+    },
+    {
+        'in': 'query',
+        'name': 'province',
+        'type': 'array',
+        'items': {'type': 'string'},
+        'collectionFormat': 'multi',
+        'required': False,
+        'description': 'Provinces to include; repeat for several'
+    },
+    {
+        'in': 'query',
+        'name': 'service',
+        'type': 'array',
+        'items': {'type': 'string'},
+        'collectionFormat': 'multi',
+        'required': False,
+        'description': 'Services to include; repeat for several'
+    },
+    {
+        'in': 'query',
+        'name': 'specialty',
+        'type': 'array',
+        'items': {'type': 'string'},
+        'collectionFormat': 'multi',
+        'required': False,
+        'description': 'Provider specialties to include; repeat for several'
+    }
+]
+
+# Bucketing and point budget of the date series charts
+DATE_SERIES_PARAMETERS = [
+    {
+        'in': 'query',
+        'name': 'bucket',
+        'type': 'string',
+        'enum': ['auto', 'day', 'week', 'month'],
+        'default': 'auto',
+        'required': False,
+        'description': 'Date bucket; auto picks the finest one that fits the date range into points'
+    },
+    {
+        'in': 'query',
+        'name': 'points',
+        'type': 'integer',
+        'required': False,
+        'description': 'Maximum number of points, reached by downsampling with LTTB (defaults to the configured CHART_MAX_POINTS)'
+    }
+]
+
+MIN_CHART_DPI = 36
+SCREEN_DPI = 100
+MIN_CHART_PIXELS = 100
+MAX_CHART_PIXELS = 6000
+
+# Chart routes that can be requested through /charts/bundle, by route name
+BUNDLE_CHART_TYPES = {
+    'fraud-by-province': 'fraud_by_province',
+    'fraud-by-gender': 'fraud_by_gender',
+    'fraud-by-age': 'fraud_by_age_group',
+    'fraud-ratio-by-age-group': 'fraud_ratio_by_age_group',
+    'province-fraud-ratio': 'province_fraud_ratio',
+    'province-gender-fraud-percentage': 'province_gender_fraud_percentage',
+    'fraud-counts-by-date': 'fraud_counts_by_date',
+    'fraud-ratio-by-date': 'fraud_ratio_by_date',
+    'fraud-ratio-by-ins-cover': 'fraud_ratio_by_ins_cover',
+    'fraud-ratio-by-invoice-type': 'fraud_ratio_by_invoice_type',
+    'fraud-ratio-by-medical-record-type': 'fraud_ratio_by_medical_record_type',
+    'provider-risk-indicator': 'provider_risk_indicator_time_series',
+    'patient-risk-indicator': 'patient_risk_indicator_time_series',
+}
+
+# Query parameters each parameterized bundle chart accepts
+BUNDLE_CHART_PARAMETERS = {
+    'fraud_counts_by_date': ('bucket', 'points'),
+    'fraud_ratio_by_date': ('bucket', 'points'),
+    'provider_risk_indicator_time_series': ('provider_name', 'indicator'),
+    'patient_risk_indicator_time_series': ('patient_id', 'indicator'),
+}
+
 def init_chart_services(chart_svc: ChartService, pred_svc: PredictionService):
     """Initialize the chart services"""
     global chart_service, prediction_service
     chart_service = chart_svc
     prediction_service = pred_svc
 
+def _requested_format() -> str:
+    """Response format requested through the format query parameter"""
+    return request.args.get('format', 'image').lower()
+
+def _wants_alternate_format() -> bool:
+    """Check whether the client asked for anything other than the base64 JSON image"""
+    return _requested_format() != 'image'
+
+def _chart_filters_from_request() -> dict:
+    """
+    Parse chart filter query parameters
+    
+    Returns:
+        Empty dictionary without filters, otherwise a filters keyword argument
+        for ChartService so unfiltered charts keep their cache entries
+        
+    Raises:
+        ValidationError: If a filter is malformed
+    """
+    params = {'from': request.args.get('from'), 'to': request.args.get('to')}
+    for name in CHART_CATEGORY_FILTERS:
+        params[name] = request.args.getlist(name)
+    filters = validate_chart_filters(params)
+    return {'filters': filters} if filters else {}
+
+def _date_series_params_from_request(chart_type: str) -> dict:
+    """
+    Parse the bucket and points query parameters of a date series chart
+    
+    Only parameters that were given are returned, so default requests share
+    the prerendered cache entries.
+    
+    Raises:
+        ValidationError: If a parameter is invalid
+    """
+    params = {name: request.args.get(name) for name in ('bucket', 'points') if request.args.get(name)}
+    return validate_chart_parameters(params, chart_type)
+
+def _validation_error_response(e: ValidationError, context: str):
+    """JSON 400 response for a validation error"""
+    logger.warning(f"Validation error in {context}: {str(e)}")
+    return jsonify({
+        'error': e.message,
+        'field': getattr(e, 'field', None),
+        'details': e.details
+    }), 400
+
+def _image_options_from_request() -> dict:
+    """Parse dpi, width and height query parameters into render options"""
+    return _parse_image_options(request.args)
+
+def _parse_image_options(source: Mapping[str, Any]) -> dict:
+    """
+    Parse dpi, width and height values into render options
+    
+    Args:
+        source: Query arguments or a bundle chart spec
+    
+    Returns:
+        Dictionary with dpi and figsize (inches) entries
+        
+    Raises:
+        ValidationError: If a parameter is not an integer or out of range
+    """
+    values = {}
+    for name in ('dpi', 'width', 'height'):
+        raw = source.get(name)
+        if raw is None or raw == '':
+            values[name] = None
+            continue
+        try:
+            values[name] = int(raw)
+        except (TypeError, ValueError):
+            raise ValidationError(f"{name} must be an integer", field=name)
+    
+    if values['dpi'] is not None:
+        dpi = values['dpi']
+    elif values['width'] is not None or values['height'] is not None:
+        # Pixel sizes without an explicit dpi are laid out at screen resolution
+        dpi = min(SCREEN_DPI, app_config.chart_dpi)
+    else:
+        dpi = app_config.chart_dpi
+    if not MIN_CHART_DPI <= dpi <= app_config.chart_max_dpi:
+        raise ValidationError(f"dpi must be between {MIN_CHART_DPI} and {app_config.chart_max_dpi}", field='dpi')
+    for name in ('width', 'height'):
+        if values[name] is not None and not MIN_CHART_PIXELS <= values[name] <= MAX_CHART_PIXELS:
+            raise ValidationError(f"{name} must be between {MIN_CHART_PIXELS} and {MAX_CHART_PIXELS} pixels", field=name)
+    
+    default_width, default_height = app_config.chart_figsize
+    width, height = values['width'], values['height']
+    if width is None and height is None:
+        figsize = None
+    elif height is None:
+        figsize = (width / dpi, width / dpi * default_height / default_width)
+    elif width is None:
+        figsize = (height / dpi * default_width / default_height, height / dpi)
+    else:
+        figsize = (width / dpi, height / dpi)
+    
+    return {'dpi': dpi, 'figsize': figsize}
+
+def _chart_format_response(chart_type: str, **kwargs) -> Response:
+    """
+    Return chart data or a raw image depending on the format query parameter
+    
+    Raw images carry Content-Type, ETag and Cache-Control headers. The ETag is
+    derived from the request inputs and model version, so a matching
+    If-None-Match is answered with 304 before anything is rendered.
+    
+    Args:
+        chart_type: Type of chart
+        **kwargs: Additional parameters for specific chart types
+    """
+    image_format = _requested_format()
+    if image_format == 'data':
+        return _chart_data_response(chart_type, **kwargs)
+    if image_format not in IMAGE_MIMETYPES:
+        return jsonify({
+            'error': f"Unsupported format: {image_format}",
+            'field': 'format',
+            'supported_formats': ['image', 'data'] + list(IMAGE_MIMETYPES)
+        }), 400
+    
+    try:
+        options = _image_options_from_request()
+    except ValidationError as e:
+        return jsonify({'error': e.message, 'field': e.field}), 400
+    
+    etag = chart_service.image_etag(chart_type, image_format, **options, **kwargs)
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        image = chart_service.render_image(chart_type, image_format, **options, **kwargs)
+        response = Response(image, mimetype=IMAGE_MIMETYPES[image_format])
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = f'public, max-age={app_config.chart_data_max_age}'
+    return response.make_conditional(request)
+
+def _chart_data_response(chart_type: str, **kwargs) -> Response:
+    """
+    Return aggregated chart data as compact JSON with ETag and Cache-Control headers
+    
+    Args:
+        chart_type: Type of chart
+        **kwargs: Additional parameters for specific chart types
+        
+    Returns:
+        JSON response, or 304 Not Modified when the client's ETag matches
+    """
+    data = chart_service.get_chart_data(chart_type, **kwargs)
+    body = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+    response = Response(body, mimetype='application/json')
+    response.set_etag(hashlib.md5(body.encode('utf-8')).hexdigest())
+    response.headers['Cache-Control'] = f'public, max-age={app_config.chart_data_max_age}'
+    return response.make_conditional(request)
+
 @chart_bp.route('/fraud-by-province', methods=['GET'])
 @swag_from({
     'tags': ['Charts'],
-    'produces': ['application/json'],
+    'parameters': [CHART_FORMAT_PARAMETER] + CHART_IMAGE_PARAMETERS + CHART_FILTER_PARAMETERS,
+    'produces': ['application/json', 'image/png', 'image/svg+xml', 'image/webp'],
     'responses': {
         200: {
             'description': 'Base64-encoded PNG chart',
@@ -59,9 +364,20 @@ def fraud_by_province_chart():
                 'status': 'service_unavailable'
             }), 503
         
-        chart_data = chart_service.create_chart('fraud_by_province')
+        filters = _chart_filters_from_request()
+        
+        if _wants_alternate_format():
+            return _chart_format_response('fraud_by_province', **filters)
+        
+        chart_data = chart_service.create_chart('fraud_by_province', **filters)
         return jsonify({'chart': chart_data})
     
+    except ValidationError as e:
+        return _validation_error_response(e, 'fraud by province chart')
+    
+    except ServiceOverloadedError:
+        raise
+    
     except Exception as e:
         logger.error(f"Error creating fraud by province chart: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -69,7 +385,8 @@ def fraud_by_province_chart():
 @chart_bp.route('/fraud-by-gender', methods=['GET'])
 @swag_from({
     'tags': ['Charts'],
-    'produces': ['application/json'],
+    'parameters': [CHART_FORMAT_PARAMETER] + CHART_IMAGE_PARAMETERS + CHART_FILTER_PARAMETERS,
+    'produces': ['application/json', 'image/png', 'image/svg+xml', 'image/webp'],
     'responses': {
         200: {
             'description': 'Base64-encoded PNG chart',
@@ -94,9 +411,20 @@ def fraud_by_gender_chart():
         if chart_service is None:
             return jsonify({'error': 'Chart service not initialized'}), 500
         
-        chart_data = chart_service.create_chart('fraud_by_gender')
+        filters = _chart_filters_from_request()
+        
+        if _wants_alternate_format():
+            return _chart_format_response('fraud_by_gender', **filters)
+        
+        chart_data = chart_service.create_chart('fraud_by_gender', **filters)
         return jsonify({'chart': chart_data})
     
+    except ValidationError as e:
+        return _validation_error_response(e, 'fraud by gender chart')
+    
+    except ServiceOverloadedError:
+        raise
+    
     except Exception as e:
         logger.error(f"Error creating fraud by gender chart: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -104,7 +432,8 @@ def fraud_by_gender_chart():
 @chart_bp.route('/fraud-by-age', methods=['GET'])
 @swag_from({
     'tags': ['Charts'],
-    'produces': ['application/json'],
+    'parameters': [CHART_FORMAT_PARAMETER] + CHART_IMAGE_PARAMETERS + CHART_FILTER_PARAMETERS,
+    'produces': ['application/json', 'image/png', 'image/svg+xml', 'image/webp'],
     'responses': {
         200: {
             'description': 'Base64-encoded PNG chart',
@@ -129,9 +458,20 @@ def fraud_by_age_chart():
         if chart_service is None:
             return jsonify({'error': 'Chart service not initialized'}), 500
         
-        chart_data = chart_service.create_chart('fraud_by_age_group')
+        filters = _chart_filters_from_request()
+        
+        if _wants_alternate_format():
+            return _chart_format_response('fraud_by_age_group', **filters)
+        
+        chart_data = chart_service.create_chart('fraud_by_age_group', **filters)
         return jsonify({'chart': chart_data})
     
+    except ValidationError as e:
+        return _validation_error_response(e, 'fraud by age chart')
+    
+    except ServiceOverloadedError:
+        raise
+    
     except Exception as e:
         logger.error(f"Error creating fraud by age chart: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -141,7 +481,7 @@ def fraud_by_age_chart():
     'tags': ['Charts'],
     'consumes': ['application/json'],
     'produces': ['application/json'],
-    'parameters': [{
+    'parameters': [RISK_INDICATOR_FORMAT_PARAMETER, {
         'in': 'body',
         'name': 'body',
         'required': True,
@@ -187,6 +527,14 @@ def risk_indicators_chart():
         if chart_service is None or prediction_service is None:
             return jsonify({'error': 'Services not initialized'}), 500
         
+        chart_format = _requested_format()
+        if chart_format not in RISK_INDICATOR_FORMATS:
+            return jsonify({
+                'error': f"Unsupported format: {chart_format}",
+                'field': 'format',
+                'supported_formats': list(RISK_INDICATOR_FORMATS)
+            }), 400
+        
         # Get and validate prescription data
         prescription_data = request.get_json()
         if prescription_data is None:
@@ -198,6 +546,12 @@ def risk_indicators_chart():
         # Make prediction to get risk scores
         result = prediction_service.predict_new_prescription(validated_data)
         
+        if chart_format == 'data':
+            return jsonify({
+                'chart_data': chart_service.get_chart_data('risk_indicators', risk_values=result['risk_scores']),
+                'prediction': result
+            })
+        
         # Create chart with risk values
         chart_data = chart_service.create_chart('risk_indicators', risk_values=result['risk_scores'])
         
@@ -218,6 +572,9 @@ def risk_indicators_chart():
             'status': 'model_not_ready'
         }), 503
     
+    except ServiceOverloadedError:
+        raise
+    
     except Exception as e:
         logger.error(f"Error creating risk indicators chart: {str(e)}")
         return jsonify({
@@ -229,6 +586,7 @@ def risk_indicators_chart():
 @chart_bp.route('/fraud-ratio-by-age-group', methods=['GET'])
 @swag_from({
     'tags': ['Charts'],
+    'parameters': [CHART_FORMAT_PARAMETER] + CHART_IMAGE_PARAMETERS + CHART_FILTER_PARAMETERS,
     'responses': {
         200: {
             'description': 'Base64-encoded PNG chart',
@@ -247,9 +605,20 @@ def fraud_ratio_by_age_group_chart():
         if chart_service is None:
             return jsonify({'error': 'Chart service not initialized'}), 500
         
-        chart_data = chart_service.create_chart('fraud_ratio_by_age_group')
+        filters = _chart_filters_from_request()
+        
+        if _wants_alternate_format():
+            return _chart_format_response('fraud_ratio_by_age_group', **filters)
+        
+        chart_data = chart_service.create_chart('fraud_ratio_by_age_group', **filters)
         return jsonify({'chart': chart_data})
     
+    except ValidationError as e:
+        return _validation_error_response(e, 'fraud ratio by age group chart')
+    
+    except ServiceOverloadedError:
+        raise
+    
     except Exception as e:
         logger.error(f"Error creating fraud ratio by age group chart: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -257,6 +626,7 @@ def fraud_ratio_by_age_group_chart():
 @chart_bp.route('/province-fraud-ratio', methods=['GET'])
 @swag_from({
     'tags': ['Charts'],
+    'parameters': [CHART_FORMAT_PARAMETER] + CHART_IMAGE_PARAMETERS + CHART_FILTER_PARAMETERS,
     'responses': {
         200: {
             'description': 'Base64-encoded PNG chart',
@@ -275,9 +645,20 @@ def province_fraud_ratio_chart():
         if chart_service is None:
             return jsonify({'error': 'Chart service not initialized'}), 500
         
-        chart_data = chart_service.create_chart('province_fraud_ratio')
+        filters = _chart_filters_from_request()
+        
+        if _wants_alternate_format():
+            return _chart_format_response('province_fraud_ratio', **filters)
+        
+        chart_data = chart_service.create_chart('province_fraud_ratio', **filters)
         return jsonify({'chart': chart_data})
     
+    except ValidationError as e:
+        return _validation_error_response(e, 'province fraud ratio chart')
+    
+    except ServiceOverloadedError:
+        raise
+    
     except Exception as e:
         logger.error(f"Error creating province fraud ratio chart: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -285,6 +666,7 @@ def province_fraud_ratio_chart():
 @chart_bp.route('/province-gender-fraud-percentage', methods=['GET'])
 @swag_from({
     'tags': ['Charts'],
+    'parameters': [CHART_FORMAT_PARAMETER] + CHART_IMAGE_PARAMETERS + CHART_FILTER_PARAMETERS,
     'responses': {
         200: {
             'description': 'Base64-encoded PNG chart',
@@ -303,9 +685,20 @@ def province_gender_fraud_percentage_chart():
         if chart_service is None:
             return jsonify({'error': 'Chart service not initialized'}), 500
         
-        chart_data = chart_service.create_chart('province_gender_fraud_percentage')
+        filters = _chart_filters_from_request()
+        
+        if _wants_alternate_format():
+            return _chart_format_response('province_gender_fraud_percentage', **filters)
+        
+        chart_data = chart_service.create_chart('province_gender_fraud_percentage', **filters)
         return jsonify({'chart': chart_data})
     
+    except ValidationError as e:
+        return _validation_error_response(e, 'province gender fraud percentage chart')
+    
+    except ServiceOverloadedError:
+        raise
+    
     except Exception as e:
         logger.error(f"Error creating province gender fraud percentage chart: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -313,6 +706,7 @@ def province_gender_fraud_percentage_chart():
 @chart_bp.route('/fraud-counts-by-date', methods=['GET'])
 @swag_from({
     'tags': ['Charts'],
+    'parameters': [CHART_FORMAT_PARAMETER] + CHART_IMAGE_PARAMETERS + CHART_FILTER_PARAMETERS + DATE_SERIES_PARAMETERS,
     'responses': {
         200: {
             'description': 'Base64-encoded PNG chart',
@@ -331,9 +725,21 @@ def fraud_counts_by_date_chart():
         if chart_service is None:
             return jsonify({'error': 'Chart service not initialized'}), 500
         
-        chart_data = chart_service.create_chart('fraud_counts_by_date')
+        filters = _chart_filters_from_request()
+        params = _date_series_params_from_request('fraud_counts_by_date')
+        
+        if _wants_alternate_format():
+            return _chart_format_response('fraud_counts_by_date', **params, **filters)
+        
+        chart_data = chart_service.create_chart('fraud_counts_by_date', **params, **filters)
         return jsonify({'chart': chart_data})
     
+    except ValidationError as e:
+        return _validation_error_response(e, 'fraud counts by date chart')
+    
+    except ServiceOverloadedError:
+        raise
+    
     except Exception as e:
         logger.error(f"Error creating fraud counts by date chart: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -341,6 +747,7 @@ def fraud_counts_by_date_chart():
 @chart_bp.route('/fraud-ratio-by-date', methods=['GET'])
 @swag_from({
     'tags': ['Charts'],
+    'parameters': [CHART_FORMAT_PARAMETER] + CHART_IMAGE_PARAMETERS + CHART_FILTER_PARAMETERS + DATE_SERIES_PARAMETERS,
     'responses': {
         200: {
             'description': 'Base64-encoded PNG chart',
@@ -359,9 +766,21 @@ def fraud_ratio_by_date_chart():
         if chart_service is None:
             return jsonify({'error': 'Chart service not initialized'}), 500
         
-        chart_data = chart_service.create_chart('fraud_ratio_by_date')
+        filters = _chart_filters_from_request()
+        params = _date_series_params_from_request('fraud_ratio_by_date')
+        
+        if _wants_alternate_format():
+            return _chart_format_response('fraud_ratio_by_date', **params, **filters)
+        
+        chart_data = chart_service.create_chart('fraud_ratio_by_date', **params, **filters)
         return jsonify({'chart': chart_data})
     
+    except ValidationError as e:
+        return _validation_error_response(e, 'fraud ratio by date chart')
+    
+    except ServiceOverloadedError:
+        raise
+    
     except Exception as e:
         logger.error(f"Error creating fraud ratio by date chart: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -369,6 +788,7 @@ def fraud_ratio_by_date_chart():
 @chart_bp.route('/fraud-ratio-by-ins-cover', methods=['GET'])
 @swag_from({
     'tags': ['Charts'],
+    'parameters': [CHART_FORMAT_PARAMETER] + CHART_IMAGE_PARAMETERS + CHART_FILTER_PARAMETERS,
     'responses': {
         200: {
             'description': 'Base64-encoded PNG chart',
@@ -387,9 +807,20 @@ def fraud_ratio_by_ins_cover_chart():
         if chart_service is None:
             return jsonify({'error': 'Chart service not initialized'}), 500
         
-        chart_data = chart_service.create_chart('fraud_ratio_by_ins_cover')
+        filters = _chart_filters_from_request()
+        
+        if _wants_alternate_format():
+            return _chart_format_response('fraud_ratio_by_ins_cover', **filters)
+        
+        chart_data = chart_service.create_chart('fraud_ratio_by_ins_cover', **filters)
         return jsonify({'chart': chart_data})
     
+    except ValidationError as e:
+        return _validation_error_response(e, 'fraud ratio by ins cover chart')
+    
+    except ServiceOverloadedError:
+        raise
+    
     except Exception as e:
         logger.error(f"Error creating fraud ratio by ins cover chart: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -397,6 +828,7 @@ def fraud_ratio_by_ins_cover_chart():
 @chart_bp.route('/fraud-ratio-by-invoice-type', methods=['GET'])
 @swag_from({
     'tags': ['Charts'],
+    'parameters': [CHART_FORMAT_PARAMETER] + CHART_IMAGE_PARAMETERS + CHART_FILTER_PARAMETERS,
     'responses': {
         200: {
             'description': 'Base64-encoded PNG chart',
@@ -415,9 +847,20 @@ def fraud_ratio_by_invoice_type_chart():
         if chart_service is None:
             return jsonify({'error': 'Chart service not initialized'}), 500
         
-        chart_data = chart_service.create_chart('fraud_ratio_by_invoice_type')
+        filters = _chart_filters_from_request()
+        
+        if _wants_alternate_format():
+            return _chart_format_response('fraud_ratio_by_invoice_type', **filters)
+        
+        chart_data = chart_service.create_chart('fraud_ratio_by_invoice_type', **filters)
         return jsonify({'chart': chart_data})
     
+    except ValidationError as e:
+        return _validation_error_response(e, 'fraud ratio by invoice type chart')
+    
+    except ServiceOverloadedError:
+        raise
+    
     except Exception as e:
         logger.error(f"Error creating fraud ratio by invoice type chart: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -425,6 +868,7 @@ def fraud_ratio_by_invoice_type_chart():
 @chart_bp.route('/fraud-ratio-by-medical-record-type', methods=['GET'])
 @swag_from({
     'tags': ['Charts'],
+    'parameters': [CHART_FORMAT_PARAMETER] + CHART_IMAGE_PARAMETERS + CHART_FILTER_PARAMETERS,
     'responses': {
         200: {
             'description': 'Base64-encoded PNG chart',
@@ -443,9 +887,20 @@ def fraud_ratio_by_medical_record_type_chart():
         if chart_service is None:
             return jsonify({'error': 'Chart service not initialized'}), 500
         
-        chart_data = chart_service.create_chart('fraud_ratio_by_medical_record_type')
+        filters = _chart_filters_from_request()
+        
+        if _wants_alternate_format():
+            return _chart_format_response('fraud_ratio_by_medical_record_type', **filters)
+        
+        chart_data = chart_service.create_chart('fraud_ratio_by_medical_record_type', **filters)
         return jsonify({'chart': chart_data})
     
+    except ValidationError as e:
+        return _validation_error_response(e, 'fraud ratio by medical record type chart')
+    
+    except ServiceOverloadedError:
+        raise
+    
     except Exception as e:
         logger.error(f"Error creating fraud ratio by medical record type chart: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -453,7 +908,8 @@ def fraud_ratio_by_medical_record_type_chart():
 @chart_bp.route('/provider-risk-indicator', methods=['GET'])
 @swag_from({
     'tags': ['Charts'],
-    'parameters': [
+    'parameters': CHART_IMAGE_PARAMETERS + CHART_FILTER_PARAMETERS + [
+        CHART_FORMAT_PARAMETER,
         {
             'in': 'query',
             'name': 'provider_name',
@@ -495,11 +951,21 @@ def provider_risk_indicator_chart():
         }
         
         validated_params = validate_chart_parameters(params, 'provider_risk_indicator_time_series')
+        filters = _chart_filters_from_request()
+        
+        if _wants_alternate_format():
+            return _chart_format_response(
+                'provider_risk_indicator_time_series',
+                provider_name=validated_params['provider_name'],
+                indicator=validated_params['indicator'],
+                **filters
+            )
         
         chart_data = chart_service.create_chart(
             'provider_risk_indicator_time_series', 
             provider_name=validated_params['provider_name'], 
-            indicator=validated_params['indicator']
+            indicator=validated_params['indicator'],
+            **filters
         )
         return jsonify({'chart': chart_data})
     
@@ -511,6 +977,9 @@ def provider_risk_indicator_chart():
             'details': e.details
         }), 400
     
+    except ServiceOverloadedError:
+        raise
+    
     except Exception as e:
         logger.error(f"Error creating provider risk indicator chart: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -518,7 +987,8 @@ def provider_risk_indicator_chart():
 @chart_bp.route('/patient-risk-indicator', methods=['GET'])
 @swag_from({
     'tags': ['Charts'],
-    'parameters': [
+    'parameters': CHART_IMAGE_PARAMETERS + CHART_FILTER_PARAMETERS + [
+        CHART_FORMAT_PARAMETER,
         {
             'in': 'query',
             'name': 'patient_id',
@@ -560,11 +1030,21 @@ def patient_risk_indicator_chart():
         }
         
         validated_params = validate_chart_parameters(params, 'patient_risk_indicator_time_series')
+        filters = _chart_filters_from_request()
+        
+        if _wants_alternate_format():
+            return _chart_format_response(
+                'patient_risk_indicator_time_series',
+                patient_id=validated_params['patient_id'],
+                indicator=validated_params['indicator'],
+                **filters
+            )
         
         chart_data = chart_service.create_chart(
             'patient_risk_indicator_time_series', 
             patient_id=validated_params['patient_id'], 
-            indicator=validated_params['indicator']
+            indicator=validated_params['indicator'],
+            **filters
         )
         return jsonify({'chart': chart_data})
     
@@ -576,6 +1056,176 @@ def patient_risk_indicator_chart():
             'details': e.details
         }), 400
     
+    except ServiceOverloadedError:
+        raise
+    
     except Exception as e:
         logger.error(f"Error creating patient risk indicator chart: {str(e)}")
         return jsonify({'error': str(e)}), 500
+
+def _parse_bundle_spec(index: int, spec: Any) -> dict:
+    """
+    Validate one entry of a bundle request into a ChartService.render_bundle spec
+    
+    Args:
+        index: Position of the entry in the charts list
+        spec: Route name, or object with chart, id, format, dpi, width, height,
+            params and filters
+        
+    Returns:
+        Spec with id, chart_type, format, dpi, figsize and params entries
+        
+    Raises:
+        ValidationError: If the entry is malformed
+    """
+    if isinstance(spec, str):
+        spec = {'chart': spec}
+    if not isinstance(spec, dict):
+        raise ValidationError(f"charts[{index}] must be a chart name or an object", field='charts')
+    
+    chart_type = BUNDLE_CHART_TYPES.get(spec.get('chart'))
+    if chart_type is None:
+        raise ValidationError(
+            f"charts[{index}]: unknown chart {spec.get('chart')!r}",
+            field='charts',
+            details={'supported_charts': list(BUNDLE_CHART_TYPES)}
+        )
+    
+    chart_format = str(spec.get('format', 'image')).lower()
+    if chart_format not in ('image', 'data') and chart_format not in IMAGE_MIMETYPES:
+        raise ValidationError(f"charts[{index}]: unsupported format {chart_format}", field='format')
+    
+    params = spec.get('params') or {}
+    if not isinstance(params, dict):
+        raise ValidationError(f"charts[{index}]: params must be an object", field='params')
+    filters = spec.get('filters') or {}
+    if not isinstance(filters, dict):
+        raise ValidationError(f"charts[{index}]: filters must be an object", field='filters')
+    names = BUNDLE_CHART_PARAMETERS.get(chart_type, ())
+    try:
+        params = validate_chart_parameters(
+            {name: params[name] for name in names if params.get(name) is not None}, chart_type
+        )
+        filters = validate_chart_filters(filters)
+        if filters:
+            params['filters'] = filters
+        options = _parse_image_options(spec) if chart_format in IMAGE_MIMETYPES else {'dpi': None, 'figsize': None}
+    except ValidationError as e:
+        raise ValidationError(f"charts[{index}]: {e.message}", field=e.field)
+    
+    return {
+        'id': spec.get('id', index),
+        'name': spec['chart'],
+        'chart_type': chart_type,
+        'format': chart_format,
+        'params': params,
+        **options
+    }
+
+@chart_bp.route('/bundle', methods=['POST'])
+@swag_from({
+    'tags': ['Charts'],
+    'consumes': ['application/json'],
+    'produces': ['application/x-ndjson'],
+    'parameters': [{
+        'in': 'body',
+        'name': 'body',
+        'required': True,
+        'schema': {
+            'type': 'object',
+            'required': ['charts'],
+            'properties': {
+                'charts': {
+                    'type': 'array',
+                    'description': 'Route names (e.g. fraud-by-province) or chart specs',
+                    'items': {
+                        'type': 'object',
+                        'required': ['chart'],
+                        'properties': {
+                            'chart': {'type': 'string', 'description': 'Chart route name'},
+                            'id': {'type': 'string', 'description': 'Client identifier echoed in the result, defaults to the list position'},
+                            'format': {'type': 'string', 'enum': ['image', 'data', 'png', 'svg', 'webp'], 'default': 'image'},
+                            'dpi': {'type': 'integer'},
+                            'width': {'type': 'integer'},
+                            'height': {'type': 'integer'},
+                            'params': {
+                                'type': 'object',
+                                'description': 'provider_name/patient_id and indicator for the risk indicator charts'
+                            },
+                            'filters': {
+                                'type': 'object',
+                                'description': 'from/to admission dates and province, service or specialty lists, as in the chart query parameters'
+                            }
+                        }
+                    }
+                }
+            }
+        }
+    }],
+    'responses': {
+        200: {
+            'description': (
+                'Newline-delimited JSON, one line per chart in completion order with id, name, '
+                'chart_type and format plus chart (base64), data or error, followed by a summary line'
+            )
+        },
+        400: {
+            'description': 'Validation error'
+        },
+        503: {
+            'description': 'Chart service not initialized'
+        }
+    }
+})
+def chart_bundle():
+    """Render several charts in parallel and stream each one as soon as it is ready"""
+    try:
+        if chart_service is None:
+            return jsonify({'error': 'Chart service not initialized'}), 503
+        
+        body = request.get_json(silent=True)
+        charts = body.get('charts') if isinstance(body, dict) else None
+        if not isinstance(charts, list) or not charts:
+            raise ValidationError("charts must be a non-empty list", field='charts')
+        if len(charts) > app_config.chart_bundle_max_charts:
+            raise ValidationError(
+                f"A bundle may contain at most {app_config.chart_bundle_max_charts} charts", field='charts'
+            )
+        specs = [_parse_bundle_spec(index, spec) for index, spec in enumerate(charts)]
+    
+    except ValidationError as e:
+        logger.warning(f"Validation error in chart bundle: {str(e)}")
+        return jsonify({
+            'error': e.message,
+            'field': getattr(e, 'field', None),
+            'details': e.details
+        }), 400
+    
+    except ServiceOverloadedError:
+        raise
+    
+    except Exception as e:
+        logger.error(f"Error preparing chart bundle: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+    
+    def generate():
+        started = time.perf_counter()
+        errors = 0
+        for index, result in chart_service.render_bundle(specs):
+            spec = specs[index]
+            errors += 'error' in result
+            line = {'id': spec['id'], 'name': spec['name'], 'chart_type': spec['chart_type'],
+                    'format': spec['format'], **result}
+            yield json.dumps(line, ensure_ascii=False, separators=(',', ':')) + '\n'
+        yield json.dumps({
+            'done': True,
+            'charts': len(specs),
+            'errors': errors,
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)
+        }) + '\n'
+    
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    # Keep reverse proxies from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.headers['Cache-Control'] = 'no-store'
+    return response
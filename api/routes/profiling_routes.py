@@ -0,0 +1,428 @@
+"""
+Profiling routes for fraud detection API
+مسیرهای پروفایل برای API تشخیص تقلب
+"""
+
+from flask import Blueprint, request, jsonify, Response, g
+from flasgger import swag_from
+from config.config import app_config
+from core.exceptions import ValidationError
+from core.validators import validate_profiler_start
+from services.profiling import (
+    ContinuousProfiler, ProfileStore, RequestProfiler, PROFILE_MODES, render_collapsed, stack_top_functions
+)
+import hmac
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Header authenticating admin requests, and header asking for a request to be profiled
+ADMIN_TOKEN_HEADER = 'X-Admin-Token'
+PROFILE_HEADER = 'X-Profile'
+
+# Create blueprint
+profiling_bp = Blueprint('profiling', __name__, url_prefix='/profiling')
+
+# Request profiles of this worker process
+profile_store = ProfileStore(app_config.profile_history_size)
+
+# Whole-worker stack sampler controlled through /profiling/sampler
+continuous_profiler = ContinuousProfiler(
+    app_config.profiler_sample_interval_ms / 1000,
+    max_overhead=app_config.profiler_max_overhead,
+    max_duration=app_config.profiler_max_duration
+)
+
+def _is_admin() -> bool:
+    """Whether the request carries the configured admin token"""
+    token = app_config.profiling_admin_token
+    supplied = request.headers.get(ADMIN_TOKEN_HEADER, '')
+    return bool(token) and hmac.compare_digest(supplied.encode(), token.encode())
+
+def _admin_error(enabled: bool):
+    """Error response for requests that may not use a profiling route, None otherwise"""
+    if not enabled:
+        return jsonify({'error': 'Profiling is disabled'}), 404
+    if not _is_admin():
+        return jsonify({'error': 'Admin token required', 'header': ADMIN_TOKEN_HEADER}), 403
+    return None
+
+@profiling_bp.before_app_request
+def start_request_profile():
+    """Profile this request when an admin asks for it through the X-Profile header"""
+    mode = request.headers.get(PROFILE_HEADER)
+    if not mode or not app_config.enable_request_profiling or request.blueprint == profiling_bp.name:
+        return
+    if not _is_admin():
+        logger.warning(f"Ignoring {PROFILE_HEADER} header without a valid admin token on {request.path}")
+        return
+    mode = mode.strip().lower()
+    if mode not in PROFILE_MODES:
+        mode = 'deterministic'
+    profiler = RequestProfiler(mode, app_config.profile_sample_interval_ms / 1000)
+    if profiler.start():
+        g.request_profiler = profiler
+    else:
+        g.request_profile_skipped = 'busy'
+
+@profiling_bp.after_app_request
+def finish_request_profile(response):
+    """
+    Store the profile of this request and return its id in X-Profile-Id
+
+    A streamed response is profiled up to the point its body starts streaming.
+    """
+    profiler = g.pop('request_profiler', None)
+    if profiler is None:
+        if g.pop('request_profile_skipped', None):
+            response.headers['X-Profile-Skipped'] = 'another deterministic profile is running'
+        return response
+
+    profiler.stop()
+    profile = profiler.result(app_config.profile_top_functions)
+    profile.update({
+        'method': request.method,
+        'path': request.path,
+        'route': request.url_rule.rule if request.url_rule is not None else None,
+        'status': response.status_code
+    })
+    profile_id = profile_store.add(profile)
+    response.headers['X-Profile-Id'] = profile_id
+
+    top = ', '.join(f"{entry['function']}" for entry in profile['top_functions'][:5])
+    logger.info(f"Profiled {request.method} {request.path} ({profiler.mode}, {profile['duration_ms']} ms) "
+                f"as {profile_id}; top cumulative: {top}")
+    return response
+
+@profiling_bp.teardown_app_request
+def discard_request_profile(exc):
+    """Stop a profile left running when the request failed before its response"""
+    profiler = g.pop('request_profiler', None)
+    if profiler is not None:
+        profiler.stop()
+
+@profiling_bp.route('/requests', methods=['GET'])
+@swag_from({
+    'tags': ['Profiling'],
+    'produces': ['application/json'],
+    'parameters': [{
+        'in': 'header',
+        'name': 'X-Admin-Token',
+        'type': 'string',
+        'required': True
+    }],
+    'responses': {
+        200: {
+            'description': 'Request profiles stored by the answering worker, newest first',
+            'schema': {
+                'type': 'object',
+                'properties': {
+                    'profiles': {
+                        'type': 'array',
+                        'items': {
+                            'type': 'object',
+                            'properties': {
+                                'id': {'type': 'string'},
+                                'mode': {'type': 'string'},
+                                'method': {'type': 'string'},
+                                'path': {'type': 'string'},
+                                'route': {'type': 'string'},
+                                'status': {'type': 'integer'},
+                                'started_at': {'type': 'string'},
+                                'duration_ms': {'type': 'number'}
+                            }
+                        }
+                    },
+                    'count': {'type': 'integer'}
+                }
+            }
+        },
+        403: {
+            'description': 'Missing or invalid admin token'
+        },
+        404: {
+            'description': 'Profiling is disabled'
+        }
+    }
+})
+def list_request_profiles():
+    """List the request profiles of this worker"""
+    error = _admin_error(app_config.enable_request_profiling)
+    if error is not None:
+        return error
+    profiles = profile_store.list()
+    return jsonify({
+        'profiles': profiles,
+        'count': len(profiles)
+    })
+
+@profiling_bp.route('/requests/<profile_id>', methods=['GET'])
+@swag_from({
+    'tags': ['Profiling'],
+    'produces': ['application/json', 'text/plain', 'application/octet-stream'],
+    'parameters': [
+        {
+            'in': 'header',
+            'name': 'X-Admin-Token',
+            'type': 'string',
+            'required': True
+        },
+        {
+            'in': 'path',
+            'name': 'profile_id',
+            'type': 'string',
+            'required': True,
+            'description': 'X-Profile-Id returned with the profiled response'
+        },
+        {
+            'in': 'query',
+            'name': 'format',
+            'type': 'string',
+            'enum': ['json', 'collapsed', 'pstats'],
+            'default': 'json',
+            'required': False,
+            'description': 'collapsed: flamegraph stack file of a sampling profile; pstats: cProfile stats of a deterministic profile'
+        }
+    ],
+    'responses': {
+        200: {
+            'description': 'Profile summary with the top functions by cumulative time or samples'
+        },
+        400: {
+            'description': 'Format not available for the mode of this profile'
+        },
+        403: {
+            'description': 'Missing or invalid admin token'
+        },
+        404: {
+            'description': 'Profiling is disabled, or no such profile in the answering worker'
+        }
+    }
+})
+def get_request_profile(profile_id):
+    """Get one request profile as JSON or as an export file"""
+    error = _admin_error(app_config.enable_request_profiling)
+    if error is not None:
+        return error
+
+    profile = profile_store.get(profile_id)
+    if profile is None:
+        return jsonify({
+            'error': 'Profile not found',
+            'details': 'Profiles are kept in memory by the worker that served the request'
+        }), 404
+
+    export_format = request.args.get('format', 'json')
+    if export_format == 'json':
+        return jsonify({key: value for key, value in profile.items() if key not in ('pstats', 'stacks')})
+    if export_format == 'collapsed' and 'stacks' in profile:
+        response = Response(render_collapsed(profile['stacks']), mimetype='text/plain')
+        response.headers['Content-Disposition'] = f'attachment; filename=profile-{profile_id}.folded'
+        return response
+    if export_format == 'pstats' and 'pstats' in profile:
+        response = Response(profile['pstats'], mimetype='application/octet-stream')
+        response.headers['Content-Disposition'] = f'attachment; filename=profile-{profile_id}.prof'
+        return response
+    return jsonify({
+        'error': f"Format {export_format!r} is not available for a {profile['mode']} profile",
+        'field': 'format'
+    }), 400
+
+@profiling_bp.route('/sampler', methods=['GET'])
+@swag_from({
+    'tags': ['Profiling'],
+    'produces': ['application/json'],
+    'parameters': [{
+        'in': 'header',
+        'name': 'X-Admin-Token',
+        'type': 'string',
+        'required': True
+    }],
+    'responses': {
+        200: {
+            'description': 'State of the continuous profiler of the answering worker',
+            'schema': {
+                'type': 'object',
+                'properties': {
+                    'worker': {'type': 'integer'},
+                    'running': {'type': 'boolean'},
+                    'started_at': {'type': 'string'},
+                    'elapsed_s': {'type': 'number'},
+                    'samples': {'type': 'integer'},
+                    'distinct_stacks': {'type': 'integer'},
+                    'interval_ms': {'type': 'number'},
+                    'effective_interval_ms': {'type': 'number'},
+                    'overhead_percent': {'type': 'number'}
+                }
+            }
+        },
+        403: {
+            'description': 'Missing or invalid admin token'
+        },
+        404: {
+            'description': 'Continuous profiling is disabled'
+        }
+    }
+})
+def sampler_status():
+    """Get the state of this worker's continuous profiler"""
+    error = _admin_error(app_config.enable_continuous_profiling)
+    if error is not None:
+        return error
+    return jsonify(continuous_profiler.status())
+
+@profiling_bp.route('/sampler/start', methods=['POST'])
+@swag_from({
+    'tags': ['Profiling'],
+    'consumes': ['application/json'],
+    'produces': ['application/json'],
+    'parameters': [
+        {
+            'in': 'header',
+            'name': 'X-Admin-Token',
+            'type': 'string',
+            'required': True
+        },
+        {
+            'in': 'body',
+            'name': 'body',
+            'required': False,
+            'schema': {
+                'type': 'object',
+                'properties': {
+                    'interval_ms': {'type': 'number', 'description': 'Milliseconds between samples, 1 to 1000'},
+                    'duration_s': {'type': 'number', 'description': 'Seconds before sampling stops by itself, up to 3600'},
+                    'include_idle': {'type': 'boolean', 'default': False, 'description': 'Also count threads waiting for work'}
+                }
+            }
+        }
+    ],
+    'responses': {
+        200: {
+            'description': 'Sampling started; previous stacks of this worker are dropped'
+        },
+        400: {
+            'description': 'Invalid options'
+        },
+        403: {
+            'description': 'Missing or invalid admin token'
+        },
+        404: {
+            'description': 'Continuous profiling is disabled'
+        },
+        409: {
+            'description': 'The profiler of this worker is already running'
+        }
+    }
+})
+def start_sampler():
+    """Start sampling every thread of this worker"""
+    error = _admin_error(app_config.enable_continuous_profiling)
+    if error is not None:
+        return error
+    try:
+        options = validate_profiler_start(request.get_json(silent=True) or {})
+    except ValidationError as e:
+        return jsonify({
+            'error': e.message,
+            'field': getattr(e, 'field', None),
+            'details': e.details
+        }), 400
+
+    if not continuous_profiler.start(**options):
+        return jsonify({'error': 'Profiler is already running', **continuous_profiler.status()}), 409
+    logger.info(f"Continuous profiler started by admin request: {options}")
+    return jsonify(continuous_profiler.status())
+
+@profiling_bp.route('/sampler/stop', methods=['POST'])
+@swag_from({
+    'tags': ['Profiling'],
+    'produces': ['application/json'],
+    'parameters': [{
+        'in': 'header',
+        'name': 'X-Admin-Token',
+        'type': 'string',
+        'required': True
+    }],
+    'responses': {
+        200: {
+            'description': 'Sampling stopped; stacks stay available for export until the next start'
+        },
+        403: {
+            'description': 'Missing or invalid admin token'
+        },
+        404: {
+            'description': 'Continuous profiling is disabled'
+        },
+        409: {
+            'description': 'The profiler of this worker is not running'
+        }
+    }
+})
+def stop_sampler():
+    """Stop sampling this worker"""
+    error = _admin_error(app_config.enable_continuous_profiling)
+    if error is not None:
+        return error
+    if not continuous_profiler.stop():
+        return jsonify({'error': 'Profiler is not running', **continuous_profiler.status()}), 409
+    status = continuous_profiler.status()
+    logger.info(f"Continuous profiler stopped after {status['samples']} samples "
+                f"({status['overhead_percent']}% overhead)")
+    return jsonify(status)
+
+@profiling_bp.route('/sampler/stacks', methods=['GET'])
+@swag_from({
+    'tags': ['Profiling'],
+    'produces': ['text/plain', 'application/json'],
+    'parameters': [
+        {
+            'in': 'header',
+            'name': 'X-Admin-Token',
+            'type': 'string',
+            'required': True
+        },
+        {
+            'in': 'query',
+            'name': 'format',
+            'type': 'string',
+            'enum': ['collapsed', 'json'],
+            'default': 'collapsed',
+            'required': False,
+            'description': 'collapsed: stack file for flamegraph.pl or speedscope; json: status and top functions'
+        }
+    ],
+    'responses': {
+        200: {
+            'description': 'Stacks of the current or last run, rooted at a worker:<pid> frame'
+        },
+        400: {
+            'description': 'Invalid format'
+        },
+        403: {
+            'description': 'Missing or invalid admin token'
+        },
+        404: {
+            'description': 'Continuous profiling is disabled'
+        }
+    }
+})
+def export_sampler_stacks():
+    """Export the collapsed stacks of this worker's continuous profiler"""
+    error = _admin_error(app_config.enable_continuous_profiling)
+    if error is not None:
+        return error
+
+    stacks = continuous_profiler.stacks()
+    export_format = request.args.get('format', 'collapsed')
+    if export_format == 'collapsed':
+        response = Response(render_collapsed(stacks), mimetype='text/plain')
+        response.headers['Content-Disposition'] = f'attachment; filename=worker-{os.getpid()}.folded'
+        return response
+    if export_format == 'json':
+        return jsonify({
+            **continuous_profiler.status(),
+            'top_functions': stack_top_functions(stacks, app_config.profile_top_functions)
+        })
+    return jsonify({'error': f"Unknown format {export_format!r}", 'field': 'format'}), 400
@@ -3,18 +3,41 @@ Services and specialties routes for fraud detection API
 مسیرهای خدمات و تخصص‌ها برای API تشخیص تقلب
 """
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context
 from flasgger import swag_from
-from config.config import get_db_manager
+from config.config import get_db_manager, memory_config
 from core.exceptions import ValidationError
-from sqlalchemy import text
+from core.validators import validate_provider_page, validate_provider_search
+from services.catalog_service import CatalogService
+import json
+import threading
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Providers serialized per chunk of a streamed provider list
+PROVIDER_STREAM_BATCH_SIZE = 500
+
 # Create blueprint
 services_bp = Blueprint('services', __name__, url_prefix='/services')
 
+# Catalog of services, specialties and providers shared by the lookup routes
+catalog_service = None
+_catalog_lock = threading.Lock()
+
+def get_catalog_service() -> CatalogService:
+    """Get the catalog cache, creating it on first use"""
+    global catalog_service
+    if catalog_service is None:
+        with _catalog_lock:
+            if catalog_service is None:
+                catalog_service = CatalogService(
+                    get_db_manager(),
+                    ttl=memory_config.catalog_cache_ttl,
+                    watermark_column=memory_config.catalog_watermark_column
+                )
+    return catalog_service
+
 @services_bp.route('/list', methods=['GET'])
 @swag_from({
     'tags': ['Services'],
@@ -45,19 +68,7 @@ services_bp = Blueprint('services', __name__, url_prefix='/services')
 def get_services():
     """Get list of available services"""
     try:
-        db_manager = get_db_manager()
-        
-        # Query to get distinct services from Prescriptions table
-        query = """
-        SELECT DISTINCT Service 
-        FROM Prescriptions 
-        WHERE Service IS NOT NULL AND Service != ''
-        ORDER BY Service
-        """
-        
-        with db_manager.get_connection() as conn:
-            result = conn.execute(text(query))
-            services = [row[0] for row in result.fetchall()]
+        services = get_catalog_service().get_services()
         
         logger.info(f"Retrieved {len(services)} services")
         return jsonify({
@@ -102,19 +113,7 @@ def get_services():
 def get_specialties():
     """Get list of available specialties"""
     try:
-        db_manager = get_db_manager()
-        
-        # Query to get distinct specialties from Prescriptions table
-        query = """
-        SELECT DISTINCT provider_specialty 
-        FROM Prescriptions 
-        WHERE provider_specialty IS NOT NULL AND provider_specialty != ''
-        ORDER BY provider_specialty
-        """
-        
-        with db_manager.get_connection() as conn:
-            result = conn.execute(text(query))
-            specialties = [row[0] for row in result.fetchall()]
+        specialties = get_catalog_service().get_specialties()
         
         logger.info(f"Retrieved {len(specialties)} specialties")
         return jsonify({
@@ -147,11 +146,36 @@ def get_specialties():
             'type': 'string',
             'required': False,
             'description': 'Filter providers by service'
+        },
+        {
+            'in': 'query',
+            'name': 'limit',
+            'type': 'integer',
+            'required': False,
+            'minimum': 1,
+            'maximum': 1000,
+            'description': 'Page size, 100 by default; an ndjson stream without it returns every provider after the cursor'
+        },
+        {
+            'in': 'query',
+            'name': 'cursor',
+            'type': 'string',
+            'required': False,
+            'description': 'next_cursor of the previous page'
+        },
+        {
+            'in': 'query',
+            'name': 'format',
+            'type': 'string',
+            'enum': ['json', 'ndjson'],
+            'default': 'json',
+            'required': False,
+            'description': 'ndjson streams one provider per line followed by a {"done": true, "count", "next_cursor"} line'
         }
     ],
     'responses': {
         200: {
-            'description': 'List of providers with optional filtering',
+            'description': 'Providers ordered by total prescriptions (descending), then name and specialty',
             'schema': {
                 'type': 'object',
                 'properties': {
@@ -169,10 +193,17 @@ def get_specialties():
                     },
                     'count': {
                         'type': 'integer'
+                    },
+                    'next_cursor': {
+                        'type': 'string',
+                        'description': 'Cursor of the next page, null on the last page'
                     }
                 }
             }
         },
+        400: {
+            'description': 'Invalid limit, cursor or format'
+        },
         500: {
             'description': 'Server error'
         }
@@ -181,60 +212,30 @@ def get_specialties():
 def get_providers():
     """Get list of providers with optional filtering by specialty or service"""
     try:
-        db_manager = get_db_manager()
-        
-        # Build query with optional filters
-        base_query = """
-        SELECT 
-            provider_name,
-            provider_specialty,
-            COUNT(DISTINCT Service) as services_count,
-            COUNT(*) as total_prescriptions
-        FROM Prescriptions 
-        WHERE provider_name IS NOT NULL AND provider_name != ''
-        """
-        
-        params = []
-        conditions = []
-        
-        # Add specialty filter if provided
-        specialty = request.args.get('specialty')
-        if specialty:
-            conditions.append("provider_specialty = %s")
-            params.append(specialty)
-        
-        # Add service filter if provided
-        service = request.args.get('service')
-        if service:
-            conditions.append("Service = %s")
-            params.append(service)
-        
-        # Add conditions to query
-        if conditions:
-            base_query += " AND " + " AND ".join(conditions)
-        
-        base_query += """
-        GROUP BY provider_name, provider_specialty
-        ORDER BY total_prescriptions DESC, provider_name
-        """
-        
-        with db_manager.get_connection() as conn:
-            result = conn.execute(text(base_query), params)
-            providers = []
-            for row in result.fetchall():
-                providers.append({
-                    'provider_name': row[0],
-                    'provider_specialty': row[1],
-                    'services_count': row[2],
-                    'total_prescriptions': row[3]
-                })
+        page = validate_provider_page(request.args.to_dict())
+        providers, next_cursor = get_catalog_service().get_provider_page(
+            specialty=request.args.get('specialty'),
+            service=request.args.get('service'),
+            cursor=page['cursor'],
+            limit=page['limit']
+        )
         
         logger.info(f"Retrieved {len(providers)} providers")
+        if page['format'] == 'ndjson':
+            return _stream_providers(providers, next_cursor)
         return jsonify({
             'providers': providers,
-            'count': len(providers)
+            'count': len(providers),
+            'next_cursor': next_cursor
         })
     
+    except ValidationError as e:
+        logger.warning(f"Validation error in providers list: {str(e)}")
+        return jsonify({
+            'error': e.message,
+            'field': getattr(e, 'field', None),
+            'details': e.details
+        }), 400
     except Exception as e:
         logger.error(f"Error getting providers: {str(e)}")
         return jsonify({
@@ -242,6 +243,99 @@ def get_providers():
             'details': str(e)
         }), 500
 
+def _stream_providers(providers, next_cursor):
+    """NDJSON response writing the providers in batches rather than as one document"""
+    def generate():
+        for start in range(0, len(providers), PROVIDER_STREAM_BATCH_SIZE):
+            batch = providers[start:start + PROVIDER_STREAM_BATCH_SIZE]
+            yield ''.join(json.dumps(provider, ensure_ascii=False, separators=(',', ':')) + '\n' for provider in batch)
+        yield json.dumps({'done': True, 'count': len(providers), 'next_cursor': next_cursor}) + '\n'
+    
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@services_bp.route('/providers/search', methods=['GET'])
+@swag_from({
+    'tags': ['Services'],
+    'produces': ['application/json'],
+    'parameters': [
+        {
+            'in': 'query',
+            'name': 'q',
+            'type': 'string',
+            'required': False,
+            'description': 'Typed part of a provider name; Arabic/Persian letter variants, ZWNJ and diacritics are ignored'
+        },
+        {
+            'in': 'query',
+            'name': 'limit',
+            'type': 'integer',
+            'required': False,
+            'default': 20,
+            'minimum': 1,
+            'maximum': 100,
+            'description': 'Maximum number of providers returned'
+        }
+    ],
+    'responses': {
+        200: {
+            'description': 'Providers whose name starts with, or contains, the query, ordered by prescription volume',
+            'schema': {
+                'type': 'object',
+                'properties': {
+                    'query': {'type': 'string'},
+                    'providers': {
+                        'type': 'array',
+                        'items': {
+                            'type': 'object',
+                            'properties': {
+                                'provider_name': {'type': 'string'},
+                                'provider_specialty': {'type': 'string'},
+                                'services_count': {'type': 'integer'},
+                                'total_prescriptions': {'type': 'integer'}
+                            }
+                        }
+                    },
+                    'count': {
+                        'type': 'integer'
+                    }
+                }
+            }
+        },
+        400: {
+            'description': 'Invalid query or limit'
+        },
+        500: {
+            'description': 'Server error'
+        }
+    }
+})
+def search_providers():
+    """Typeahead search of providers by name"""
+    try:
+        params = validate_provider_search(request.args.to_dict())
+        providers = get_catalog_service().search_providers(params['q'], params['limit'])
+        return jsonify({
+            'query': params['q'],
+            'providers': providers,
+            'count': len(providers)
+        })
+    
+    except ValidationError as e:
+        logger.warning(f"Validation error in provider search: {str(e)}")
+        return jsonify({
+            'error': e.message,
+            'field': getattr(e, 'field', None),
+            'details': e.details
+        }), 400
+    except Exception as e:
+        logger.error(f"Error searching providers: {str(e)}")
+        return jsonify({
+            'error': 'Internal server error while searching providers',
+            'details': str(e)
+        }), 500
+
 @services_bp.route('/stats', methods=['GET'])
 @swag_from({
     'tags': ['Services'],
@@ -275,6 +369,10 @@ def get_providers():
                                 'count': {'type': 'integer'}
                             }
                         }
+                    },
+                    'updated_at': {
+                        'type': 'string',
+                        'description': 'When the summary behind these figures was last refreshed'
                     }
                 }
             }
@@ -287,45 +385,7 @@ def get_providers():
 def get_services_stats():
     """Get statistics about services and specialties"""
     try:
-        db_manager = get_db_manager()
-        
-        # Get basic counts
-        count_queries = {
-            'total_services': "SELECT COUNT(DISTINCT Service) FROM Prescriptions WHERE Service IS NOT NULL AND Service != ''",
-            'total_specialties': "SELECT COUNT(DISTINCT provider_specialty) FROM Prescriptions WHERE provider_specialty IS NOT NULL AND provider_specialty != ''",
-            'total_providers': "SELECT COUNT(DISTINCT provider_name) FROM Prescriptions WHERE provider_name IS NOT NULL AND provider_name != ''",
-            'total_prescriptions': "SELECT COUNT(*) FROM Prescriptions"
-        }
-        
-        stats = {}
-        with db_manager.get_connection() as conn:
-            for key, query in count_queries.items():
-                result = conn.execute(text(query))
-                stats[key] = result.fetchone()[0]
-            
-            # Get top services
-            top_services_query = """
-            SELECT Service, COUNT(*) as count
-            FROM Prescriptions 
-            WHERE Service IS NOT NULL AND Service != ''
-            GROUP BY Service
-            ORDER BY count DESC
-            LIMIT 10
-            """
-            result = conn.execute(text(top_services_query))
-            stats['top_services'] = [{'service': row[0], 'count': row[1]} for row in result.fetchall()]
-            
-            # Get top specialties
-            top_specialties_query = """
-            SELECT provider_specialty, COUNT(*) as count
-            FROM Prescriptions 
-            WHERE provider_specialty IS NOT NULL AND provider_specialty != ''
-            GROUP BY provider_specialty
-            ORDER BY count DESC
-            LIMIT 10
-            """
-            result = conn.execute(text(top_specialties_query))
-            stats['top_specialties'] = [{'specialty': row[0], 'count': row[1]} for row in result.fetchall()]
+        stats = get_catalog_service().get_service_stats()
         
         logger.info("Retrieved services and specialties statistics")
         return jsonify(stats)
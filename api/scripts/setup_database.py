@@ -1,16 +1,114 @@
 """
-Database setup script for MariaDB
-اسکریپت راه‌اندازی پایگاه داده برای MariaDB
+Database setup script for MariaDB (or the embedded SQLite backend)
+اسکریپت راه‌اندازی پایگاه داده برای MariaDB (یا پایگاه داده توکار SQLite)
 """
 
+import os
+import re
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 import pandas as pd
-from config.config import get_db_manager
+from typing import Any, Dict, List, Tuple
+from sqlalchemy import text
+from config.config import PROVIDER_NAME_EXPRESSION, get_db_manager
+from functions.shamsi_to_miladi_function import shamsi_year_month
 import logging
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Bulk CSV import: rows per batch, parallel loader threads and progress log interval
+IMPORT_CHUNK_SIZE = int(os.getenv('IMPORT_CHUNK_SIZE', '20000'))
+IMPORT_WORKERS = int(os.getenv('IMPORT_WORKERS', '4'))
+IMPORT_PROGRESS_ROWS = 500000
+
+# Composite indexes on Prescriptions. The feature aggregate queries of
+# config.FEATURE_AGGREGATE_QUERIES group on the leading (key, adm_month) columns, so the
+# groups are read in index order without a sort; the trailing columns make the indexes
+# covering, so neither the aggregates nor the per-provider and per-patient history
+# lookups touch the rows. idx_adm_month finds the rows whose feature keys are not filled
+# yet, and idx_catalog answers the catalog summary. Keyset scans over id use the
+# clustered primary key and need no extra index.
+PRESCRIPTION_INDEXES = {
+    'idx_provider_month': ['provider_key', 'adm_month', 'ID', 'Service', 'provider_specialty', 'cost_amount'],
+    'idx_patient_month': ['ID', 'adm_month', 'provider_key', 'Service', 'cost_amount'],
+    'idx_service_month': ['Service', 'adm_month', 'cost_amount'],
+    'idx_specialty_month': ['provider_specialty', 'adm_month', 'cost_amount'],
+    'idx_adm_month': ['adm_month'],
+    'idx_catalog': ['provider_name', 'provider_specialty', 'Service'],
+}
+
+# Tables of the embedded SQLite backend (DB_BACKEND=sqlite). Column names are
+# case-insensitive in SQLite, so the surrogate key is the implicit rowid rather
+# than an id column next to the ID patient column.
+SQLITE_TABLES = {
+    'Prescriptions': """
+        CREATE TABLE IF NOT EXISTS Prescriptions (
+            ID VARCHAR(50),
+            provider_name VARCHAR(255),
+            Ref_code VARCHAR(100),
+            Ref_name VARCHAR(255),
+            Service VARCHAR(100),
+            provider_specialty VARCHAR(255),
+            cost_amount DECIMAL(15,2),
+            ded_amount DECIMAL(15,2),
+            confirmed_amount DECIMAL(15,2),
+            Adm_date VARCHAR(20),
+            confirm_date VARCHAR(20),
+            jalali_date VARCHAR(20),
+            record_id INT,
+            year_month VARCHAR(10),
+            age INT,
+            adm_month VARCHAR(16),
+            provider_key VARCHAR(255),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """,
+    'specialties': """
+        CREATE TABLE IF NOT EXISTS specialties (
+            Service VARCHAR(100) UNIQUE,
+            specialty VARCHAR(255),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """
+}
+
+SQLITE_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_provider ON Prescriptions (provider_name)",
+    "CREATE INDEX IF NOT EXISTS idx_service ON Prescriptions (Service)",
+    "CREATE INDEX IF NOT EXISTS idx_date ON Prescriptions (Adm_date)",
+    "CREATE INDEX IF NOT EXISTS idx_year_month ON Prescriptions (year_month)",
+]
+
+# Queries whose plans are reported before and after the index migration;
+# {row_key} is the surrogate key (id, or rowid on SQLite)
+INDEX_PLAN_QUERIES = {
+    'keyset_scan': "SELECT * FROM Prescriptions WHERE {row_key} > :last_id ORDER BY {row_key} LIMIT 10000",
+    'catalog_summary': (
+        "SELECT provider_name, provider_specialty, Service, COUNT(*) FROM Prescriptions "
+        "GROUP BY provider_name, provider_specialty, Service"
+    ),
+}
+
+# History lookups on the stored feature keys, reported once the table has them
+FEATURE_KEY_PLAN_QUERIES = {
+    'provider_history': (
+        "SELECT adm_month, ID, cost_amount FROM Prescriptions "
+        "WHERE provider_key = :provider_name AND adm_month >= :year_month"
+    ),
+    'patient_history': (
+        "SELECT adm_month, provider_key, cost_amount FROM Prescriptions "
+        "WHERE ID = :patient_id AND adm_month >= :year_month"
+    ),
+}
+
+# Feature aggregate queries whose plans are reported as well (formatted by
+# DatabaseManager.feature_aggregate_queries, once the table has the stored feature keys)
+AGGREGATE_PLAN_NAMES = ('patient_month', 'provider_month', 'service_month', 'specialty_month')
+
 def create_tables():
     """Create necessary tables in the database"""
     db_manager = get_db_manager()
@@ -21,6 +119,19 @@ def create_tables():
         return False
     
     try:
+        if db_manager.is_embedded:
+            for table_name, table_sql in SQLITE_TABLES.items():
+                logger.info(f"Creating {table_name} table...")
+                if not db_manager.execute_query(table_sql):
+                    logger.error(f"Failed to create {table_name} table")
+                    return False
+            for index_sql in SQLITE_INDEXES:
+                if not db_manager.execute_query(index_sql):
+                    logger.error("Failed to create Prescriptions indexes")
+                    return False
+            logger.info("Tables created successfully!")
+            return True
+        
         # Create main fraud data table
         fraud_data_table_sql = """
         CREATE TABLE IF NOT EXISTS Prescriptions (
@@ -40,6 +151,8 @@ def create_tables():
             record_id INT,
             year_month VARCHAR(10),
             age INT,
+            adm_month VARCHAR(16),
+            provider_key VARCHAR(255),
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
             INDEX idx_provider (provider_name),
@@ -79,35 +192,394 @@ def create_tables():
         logger.error(f"Error creating tables: {str(e)}")
         return False
 
-def import_csv_to_db(csv_file_path: str, table_name: str):
+def import_csv_to_db(csv_file_path: str, table_name: str, chunk_size: int = IMPORT_CHUNK_SIZE,
+                     workers: int = IMPORT_WORKERS) -> bool:
     """
     Import CSV data to database table
     
+    The file is streamed in chunks into a staging copy of the table, inserted
+    with batched executemany by parallel loader threads, and swapped in with
+    one atomic RENAME TABLE. Readers see the old data until the swap, and a
+    failed import leaves the table untouched. Secondary indexes are dropped on
+    the staging table and rebuilt once after loading.
+    
     Args:
         csv_file_path: Path to the CSV file
         table_name: Name of the target table
+        chunk_size: Rows read and inserted per batch
+        workers: Number of parallel loader threads
+        
+    Returns:
+        True if successful, False otherwise
+        
+    Raises:
+        FileNotFoundError: If the CSV file does not exist
     """
+    if not os.path.exists(csv_file_path):
+        raise FileNotFoundError(csv_file_path)
+    
+    db_manager = get_db_manager()
+    staging_table = f"{table_name}_staging"
+    previous_table = f"{table_name}_previous"
+    if db_manager.is_embedded:
+        # SQLite has a single writer; more loader threads would only wait on its lock
+        workers = 1
+    
     try:
-        logger.info(f"Loading CSV file: {csv_file_path}")
-        df = pd.read_csv(csv_file_path)
+        if db_manager.is_embedded:
+            index_sql = _create_sqlite_staging_table(db_manager, table_name, staging_table)
+            indexes = []
+        else:
+            index_sql = []
+            indexes = _create_staging_table(db_manager, table_name, staging_table, previous_table)
+        
+        table_columns = db_manager.get_column_names(staging_table) or []
+        started = time.perf_counter()
+        total_rows = 0
+        next_report = IMPORT_PROGRESS_ROWS
+        logger.info(f"Streaming {csv_file_path} into {staging_table} "
+                    f"({chunk_size} rows per batch, {workers} loader threads)...")
         
-        db_manager = get_db_manager()
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='csv-loader') as executor:
+            pending = set()
+            columns = None
+            for chunk in pd.read_csv(csv_file_path, chunksize=chunk_size, dtype=str):
+                if columns is None:
+                    columns = [column for column in chunk.columns if column in table_columns]
+                    skipped = [column for column in chunk.columns if column not in table_columns]
+                    if skipped:
+                        logger.warning(f"Skipping CSV columns not in {table_name}: {', '.join(skipped)}")
+                    keys = [f"c{i}" for i in range(len(columns))]
+                    statement = text(
+                        f"INSERT INTO {staging_table} ({', '.join(f'`{column}`' for column in columns)}) "
+                        f"VALUES ({', '.join(f':{key}' for key in keys)})"
+                    )
+                
+                values = chunk[columns].to_numpy(dtype=object)
+                values[pd.isna(values)] = None
+                rows = [dict(zip(keys, row)) for row in values.tolist()]
+                # Bound the chunks held in memory to what the loaders can work on
+                if len(pending) >= workers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    total_rows += sum(future.result() for future in done)
+                    if total_rows >= next_report:
+                        next_report += IMPORT_PROGRESS_ROWS
+                        logger.info(f"Imported {total_rows:,} rows "
+                                    f"({total_rows / (time.perf_counter() - started):,.0f} rows/sec)")
+                pending.add(executor.submit(_insert_rows, db_manager, statement, rows))
+            
+            total_rows += sum(future.result() for future in pending)
         
-        # Clear existing data
-        clear_sql = f"DELETE FROM {table_name}"
-        db_manager.execute_query(clear_sql)
+        if db_manager.is_embedded:
+            # DDL in one explicit transaction, so WAL readers keep seeing the old table until commit
+            with db_manager.get_connection() as conn:
+                conn.connection.dbapi_connection.executescript(
+                    "BEGIN IMMEDIATE;\n"
+                    f"DROP TABLE {table_name};\n"
+                    f"ALTER TABLE {staging_table} RENAME TO {table_name};\n"
+                    + ''.join(f"{sql};\n" for sql in index_sql)
+                    + "COMMIT;"
+                )
+        else:
+            _swap_staging_table(db_manager, table_name, staging_table, previous_table, indexes)
+        
+        elapsed = time.perf_counter() - started
+        logger.info(f"Successfully imported {total_rows} records to {table_name} in {elapsed:.1f}s "
+                    f"({total_rows / elapsed if elapsed > 0 else 0:,.0f} rows/sec)")
+        return True
+        
+    except Exception as e:
+        logger.error(f"Error importing CSV to database: {str(e)}")
+        try:
+            with db_manager.get_connection() as conn:
+                conn.execute(text(f"DROP TABLE IF EXISTS {staging_table}"))
+                conn.commit()
+        except Exception:
+            pass
+        return False
+
+def _create_staging_table(db_manager, table_name: str, staging_table: str,
+                          previous_table: str) -> List[Tuple[str, str]]:
+    """Create an index-free copy of a MariaDB table, returning the indexes to rebuild"""
+    with db_manager.get_connection() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {staging_table}, {previous_table}"))
+        conn.execute(text(f"CREATE TABLE {staging_table} LIKE {table_name}"))
+        indexes = _secondary_indexes(conn, staging_table)
+        if indexes:
+            conn.execute(text(
+                f"ALTER TABLE {staging_table} " + ', '.join(f"DROP INDEX `{name}`" for name, _ in indexes)
+            ))
+        conn.commit()
+    return indexes
+
+def _swap_staging_table(db_manager, table_name: str, staging_table: str, previous_table: str,
+                        indexes: List[Tuple[str, str]]):
+    """Rebuild the indexes of a loaded MariaDB staging table and swap it in"""
+    with db_manager.get_connection() as conn:
+        if indexes:
+            logger.info(f"Rebuilding {len(indexes)} index(es) on {staging_table}...")
+            conn.execute(text(
+                f"ALTER TABLE {staging_table} " + ', '.join(f"ADD {definition}" for _, definition in indexes)
+            ))
+        # Both renames happen atomically, so readers never see a missing or partial table
+        conn.execute(text(
+            f"RENAME TABLE {table_name} TO {previous_table}, {staging_table} TO {table_name}"
+        ))
+        conn.execute(text(f"DROP TABLE {previous_table}"))
+        conn.commit()
+
+def _create_sqlite_staging_table(db_manager, table_name: str, staging_table: str) -> List[str]:
+    """
+    Create an index-free copy of a SQLite table from its stored schema
+    
+    Returns:
+        CREATE INDEX statements of the table, replayed after the swap (index
+        names are database-wide in SQLite, so they cannot coexist on the copy)
+    """
+    with db_manager.get_connection() as conn:
+        table_sql = conn.execute(text(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :table COLLATE NOCASE"
+        ), {'table': table_name}).scalar()
+        if table_sql is None:
+            raise ValueError(f"Table {table_name} does not exist")
+        index_sql = conn.execute(text(
+            "SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = :table COLLATE NOCASE AND sql IS NOT NULL"
+        ), {'table': table_name}).scalars().all()
         
-        # Insert data
-        logger.info(f"Importing {len(df)} records to {table_name}...")
+        staging_sql = re.sub(
+            r'^\s*CREATE TABLE\s+(IF NOT EXISTS\s+)?["`\[]?\w+["`\]]?',
+            f"CREATE TABLE {staging_table}", table_sql, count=1, flags=re.IGNORECASE
+        )
+        conn.execute(text(f"DROP TABLE IF EXISTS {staging_table}"))
+        conn.execute(text(staging_sql))
+        conn.commit()
+    return list(index_sql)
+
+def _secondary_indexes(conn, table_name: str) -> List[Tuple[str, str]]:
+    """
+    (name, definition) of every index of a table except the primary key
+    
+    The definition recreates the index as it was, with its kind (UNIQUE,
+    FULLTEXT or SPATIAL), prefix lengths, descending columns and index type,
+    e.g. "UNIQUE INDEX `idx` (`provider_name`(100), `Service`) USING BTREE".
+    """
+    query = """
+    SELECT INDEX_NAME, NON_UNIQUE, COLUMN_NAME, SUB_PART, COLLATION, INDEX_TYPE
+    FROM INFORMATION_SCHEMA.STATISTICS
+    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND INDEX_NAME != 'PRIMARY'
+    ORDER BY INDEX_NAME, SEQ_IN_INDEX
+    """
+    indexes: Dict[str, Dict[str, Any]] = {}
+    for index_name, non_unique, column_name, sub_part, collation, index_type in conn.execute(
+            text(query), {'table': table_name}):
+        index = indexes.setdefault(index_name, {'unique': not int(non_unique), 'type': index_type, 'columns': []})
+        column = f"`{column_name}`"
+        if sub_part is not None:
+            column += f"({int(sub_part)})"
+        if collation == 'D':
+            column += " DESC"
+        index['columns'].append(column)
+    
+    definitions = []
+    for name, index in indexes.items():
+        if index['type'] in ('FULLTEXT', 'SPATIAL'):
+            # These kinds have no USING clause
+            prefix, using = f"{index['type']} ", ''
+        else:
+            prefix, using = 'UNIQUE ' if index['unique'] else '', f" USING {index['type']}"
+        definitions.append((name, f"{prefix}INDEX `{name}` ({', '.join(index['columns'])}){using}"))
+    return definitions
+
+def _insert_rows(db_manager, statement, rows: List[Dict[str, Any]]) -> int:
+    """Insert one batch in its own connection and transaction"""
+    with db_manager.get_connection() as conn:
+        conn.execute(statement, rows)
+        conn.commit()
+    return len(rows)
+
+def get_existing_indexes(table_name: str = 'Prescriptions') -> Dict[str, List[str]]:
+    """
+    Get the indexes of a table with their columns in key order
+    
+    Args:
+        table_name: Name of the table
         
+    Returns:
+        Mapping of index name to its columns
+    """
+    db_manager = get_db_manager()
+    if db_manager.is_embedded:
         with db_manager.get_connection() as conn:
-            df.to_sql(table_name, conn, if_exists='append', index=False, method='multi')
+            names = conn.execute(text(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :table COLLATE NOCASE"
+            ), {'table': table_name}).scalars().all()
+            return {
+                name: [row[2] for row in conn.execute(text(f'PRAGMA index_info("{name}")'))]
+                for name in names
+            }
+    
+    query = """
+    SELECT INDEX_NAME, COLUMN_NAME
+    FROM INFORMATION_SCHEMA.STATISTICS
+    WHERE TABLE_SCHEMA = :schema AND TABLE_NAME = :table
+    ORDER BY INDEX_NAME, SEQ_IN_INDEX
+    """
+    indexes: Dict[str, List[str]] = {}
+    with db_manager.get_connection() as conn:
+        for index_name, column_name in conn.execute(text(query), {'schema': db_manager.config.database, 'table': table_name}):
+            indexes.setdefault(index_name, []).append(column_name)
+    return indexes
+
+def explain_access_paths() -> Dict[str, List[Dict[str, Any]]]:
+    """
+    EXPLAIN the queries of INDEX_PLAN_QUERIES, FEATURE_KEY_PLAN_QUERIES and AGGREGATE_PLAN_NAMES
+    against the current indexes
+    
+    Returns:
+        Plan rows (table, type, key, rows, Extra; detail on SQLite) per query name
+    """
+    db_manager = get_db_manager()
+    row_key = 'rowid' if db_manager.is_embedded else 'id'
+    has_keys = db_manager.has_feature_key_columns('Prescriptions')
+    plans = {}
+    with db_manager.get_connection() as conn:
+        queries = {name: query.format(row_key=row_key) for name, query in INDEX_PLAN_QUERIES.items()}
+        params = {'last_id': 0}
+        if has_keys:
+            # Bind the point lookups to values that exist so the plans reflect real selectivity
+            sample = conn.execute(text(
+                f"SELECT provider_key, ID, adm_month FROM Prescriptions ORDER BY {row_key} LIMIT 1"
+            )).fetchone()
+            params.update({
+                'provider_name': sample[0] if sample and sample[0] else '',
+                'patient_id': sample[1] if sample and sample[1] else '',
+                'year_month': sample[2] if sample and sample[2] else ''
+            })
+            queries.update(FEATURE_KEY_PLAN_QUERIES)
+            aggregate_queries = db_manager.feature_aggregate_queries('Prescriptions')
+            queries.update((name, aggregate_queries[name]) for name in AGGREGATE_PLAN_NAMES)
+        for name, query in queries.items():
+            if db_manager.is_embedded:
+                rows = conn.execute(text(f"EXPLAIN QUERY PLAN {query}"), params).mappings().all()
+                plans[name] = [{'detail': row['detail']} for row in rows]
+                continue
+            rows = conn.execute(text(f"EXPLAIN {query}"), params).mappings().all()
+            plans[name] = [
+                {key: row.get(key) for key in ('table', 'type', 'key', 'rows', 'Extra')}
+                for row in rows
+            ]
+    return plans
+
+def _format_plan(plan: List[Dict[str, Any]]) -> str:
+    """One-line summary of a query plan"""
+    if plan and 'detail' in plan[0]:
+        return '; '.join(row['detail'] for row in plan)
+    return '; '.join(
+        f"type={row['type']} key={row['key'] or '-'} rows={row['rows']} ({row['Extra'] or ''})"
+        for row in plan
+    )
+
+def fill_feature_keys(table_name: str = 'Prescriptions') -> int:
+    """
+    Add the stored feature key columns if missing and fill the rows without them
+    
+    Args:
+        table_name: Name of the table
         
-        logger.info(f"Successfully imported {len(df)} records to {table_name}")
+    Returns:
+        Number of rows filled
+    """
+    db_manager = get_db_manager()
+    db_manager.add_feature_key_columns(table_name)
+    columns = db_manager.get_column_names(table_name) or []
+    provider_expression = PROVIDER_NAME_EXPRESSION if {'Ref_code', 'Ref_name'}.issubset(columns) else '`provider_name`'
+    with db_manager.get_connection() as conn:
+        filled = db_manager.fill_feature_keys(conn, table_name, shamsi_year_month, provider_expression)
+    logger.info(f"Filled feature keys (adm_month, provider_key) of {filled} rows in {table_name}")
+    return filled
+
+def migrate_indexes(table_name: str = 'Prescriptions', dry_run: bool = False) -> bool:
+    """
+    Add the composite indexes of PRESCRIPTION_INDEXES that are missing
+    
+    The stored feature key columns are added and filled first (see
+    fill_feature_keys), since the aggregate indexes are keyed on them.
+    Safe to run repeatedly: existing indexes are left alone. On MariaDB indexes
+    are built online (ALGORITHM=INPLACE, LOCK=NONE) so the table stays readable
+    and writable, and EXPLAIN plans of the main access paths are logged before
+    and after.
+    
+    Args:
+        table_name: Name of the table to migrate
+        dry_run: Only report the plans and the indexes that would be added
+        
+    Returns:
+        True if successful, False otherwise
+    """
+    db_manager = get_db_manager()
+    if not db_manager.test_connection():
+        logger.error("Cannot connect to database. Please check your configuration.")
+        return False
+    
+    try:
+        if dry_run:
+            if not db_manager.has_feature_key_columns(table_name):
+                logger.info(f"Would add and fill the feature key columns of {table_name}")
+        else:
+            fill_feature_keys(table_name)
+        
+        before = explain_access_paths()
+        existing = get_existing_indexes(table_name)
+        
+        added = []
+        for index_name, columns in PRESCRIPTION_INDEXES.items():
+            if index_name in existing:
+                if existing[index_name] != columns:
+                    logger.warning(
+                        f"Index {index_name} exists on ({', '.join(existing[index_name])}) instead of "
+                        f"({', '.join(columns)}); drop it to have it recreated"
+                    )
+                else:
+                    logger.info(f"Index {index_name} already exists")
+                continue
+            
+            column_list = ', '.join(f"`{column}`" for column in columns)
+            if dry_run:
+                logger.info(f"Would add index {index_name} ({column_list})")
+                continue
+            
+            logger.info(f"Adding index {index_name} ({column_list})...")
+            if db_manager.is_embedded:
+                statement = f"CREATE INDEX IF NOT EXISTS {index_name} ON {table_name} ({column_list})"
+            else:
+                statement = f"ALTER TABLE {table_name} ADD INDEX `{index_name}` ({column_list}), ALGORITHM=INPLACE, LOCK=NONE"
+            with db_manager.get_connection() as conn:
+                conn.execute(text(statement))
+                conn.commit()
+            added.append(index_name)
+        
+        if added:
+            # Refresh statistics so the optimizer costs the new indexes
+            with db_manager.get_connection() as conn:
+                if db_manager.is_embedded:
+                    conn.execute(text(f"ANALYZE {table_name}"))
+                    conn.commit()
+                else:
+                    conn.execute(text(f"ANALYZE TABLE {table_name}")).fetchall()
+            after = explain_access_paths()
+        else:
+            after = before
+        
+        logger.info(f"Added {len(added)} index(es) to {table_name}")
+        for name in before:
+            logger.info(f"--- Plan: {name} ---")
+            logger.info(f"  before: {_format_plan(before[name])}")
+            if added:
+                logger.info(f"  after:  {_format_plan(after[name])}")
         return True
         
     except Exception as e:
-        logger.error(f"Error importing CSV to database: {str(e)}")
+        logger.error(f"Error migrating indexes: {str(e)}")
         return False
 
 def setup_database_with_csv():
@@ -131,6 +603,9 @@ def setup_database_with_csv():
     except FileNotFoundError:
         logger.warning("specialties.csv not found. Please import data manually.")
     
+    # Build the composite indexes once the data is loaded rather than maintaining them per insert
+    migrate_indexes()
+    
     logger.info("Database setup completed!")
     return True
 
@@ -163,16 +638,25 @@ if __name__ == "__main__":
             setup_database_with_csv()
         elif command == "info":
             show_table_info()
+        elif command == "migrate_indexes":
+            migrate_indexes(dry_run="--dry-run" in sys.argv[2:])
         elif command == "import" and len(sys.argv) >= 4:
             csv_file = sys.argv[2]
             table_name = sys.argv[3]
-            import_csv_to_db(csv_file, table_name)
+            try:
+                imported = import_csv_to_db(csv_file, table_name)
+            except FileNotFoundError:
+                logger.error(f"{csv_file} not found")
+                imported = False
+            if not imported:
+                sys.exit(1)
         else:
-            logger.error("Invalid command. Use: create_tables, setup, info, or import <csv_file> <table_name>")
+            logger.error("Invalid command. Use: create_tables, setup, info, migrate_indexes [--dry-run], or import <csv_file> <table_name>")
     else:
         logger.info("Database setup script")
         logger.info("Usage:")
         logger.info("  python setup_database.py create_tables  - Create tables only")
         logger.info("  python setup_database.py setup          - Complete setup with CSV import")
         logger.info("  python setup_database.py info           - Show table information")
+        logger.info("  python setup_database.py migrate_indexes [--dry-run] - Add composite indexes, report EXPLAIN plans")
         logger.info("  python setup_database.py import <csv> <table> - Import specific CSV to table")
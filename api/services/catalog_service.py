@@ -0,0 +1,452 @@
+"""
+In-process catalog of services, specialties and providers
+کاتالوگ درون‌حافظه‌ای خدمات، تخصص‌ها و پزشکان
+"""
+
+import base64
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+import pandas as pd
+from sqlalchemy import text
+from core.exceptions import ValidationError
+import logging
+from .metrics import db_query_duration
+from .provider_search import ProviderSearchIndex
+
+logger = logging.getLogger(__name__)
+
+# One pass over Prescriptions yields every catalog list, provider count and service statistic
+CATALOG_SUMMARY_QUERY = """
+SELECT provider_name, provider_specialty, Service, COUNT(*) AS prescriptions
+FROM Prescriptions
+{where}
+GROUP BY provider_name, provider_specialty, Service
+"""
+
+SUMMARY_COLUMNS = ['provider_name', 'provider_specialty', 'Service', 'prescriptions']
+
+# Entries in the top services and top specialties of the service statistics
+TOP_STATS_SIZE = 10
+
+# Provider lists of recently requested specialty/service filters kept per build
+PROVIDER_LIST_MEMO_SIZE = 256
+
+def _provider_sort_key(provider: Dict[str, Any]) -> Tuple:
+    """Total order of provider lists: volume descending, then name and specialty (missing last)"""
+    specialty = provider['provider_specialty']
+    return (-provider['total_prescriptions'], provider['provider_name'], specialty is None, specialty or '')
+
+class CatalogService:
+    """
+    Catalog lookups answered from a summary of the Prescriptions table.
+
+    The summary is loaded with a single grouped query and kept for ttl seconds.
+    Once expired it is refreshed in a background thread while the previous
+    catalog keeps serving, and invalidate() forces a reload after a data refresh.
+    Without a watermark column (the default) every refresh reruns the full
+    query. With one, refreshes only aggregate rows whose key is past the
+    previous load and add them to the summary; updated or deleted rows are
+    picked up by the next full load after invalidate(). The column must be a
+    strictly increasing integer key such as the auto-increment id (rowid on
+    SQLite): an insert timestamp repeats within its resolution, so rows sharing
+    the watermark's value that land after a load would never be counted.
+    """
+
+    def __init__(self, db_manager, ttl: float, watermark_column: Optional[str] = None):
+        if watermark_column and not re.fullmatch(r'[A-Za-z_][A-Za-z0-9_]*', watermark_column):
+            raise ValueError(f"Invalid catalog watermark column: {watermark_column}")
+        self.db_manager = db_manager
+        self.ttl = ttl
+        # Strictly increasing integer key bounding incremental refreshes, checked on first load
+        self.watermark_column = watermark_column or None
+        self._watermark_checked = False
+        self._watermark = None
+        self._service_stats: Dict[str, Any] = {}
+        # Guards the installed catalog only; database loads run outside it
+        self._lock = threading.Lock()
+        # Serializes first loads so concurrent lookups share one query
+        self._load_lock = threading.Lock()
+        # Bumped by invalidate() so a load that started earlier is not installed
+        self._generation = 0
+        self._summary: Optional[pd.DataFrame] = None
+        self._services: List[str] = []
+        self._specialties: List[str] = []
+        self._providers: 'OrderedDict[Tuple, List[Dict[str, Any]]]' = OrderedDict()
+        self._search_index: Optional[ProviderSearchIndex] = None
+        self._loaded_at: Optional[float] = None
+        self._loaded_at_wall: Optional[datetime] = None
+        self._refresh_thread: Optional[threading.Thread] = None
+        self.hits = 0
+        self.loads = 0
+        self.incremental_refreshes = 0
+
+    def get_services(self) -> List[str]:
+        """Distinct non-empty services, sorted"""
+        self._ensure_loaded()
+        return self._services
+
+    def get_specialties(self) -> List[str]:
+        """Distinct non-empty provider specialties, sorted"""
+        self._ensure_loaded()
+        return self._specialties
+
+    def get_providers(self, specialty: Optional[str] = None, service: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Providers with their distinct service count and prescription total
+
+        Args:
+            specialty: Only count prescriptions of this specialty
+            service: Only count prescriptions of this service
+
+        Returns:
+            Providers ordered by total prescriptions (descending), then name and specialty
+        """
+        summary = self._ensure_loaded()
+        key = (specialty or None, service or None)
+        with self._lock:
+            providers = self._providers.get(key)
+            if providers is not None and summary is self._summary:
+                self._providers.move_to_end(key)
+                return providers
+
+        providers = self._provider_list(summary, *key)
+        with self._lock:
+            if summary is self._summary:
+                self._providers[key] = providers
+                while len(self._providers) > PROVIDER_LIST_MEMO_SIZE:
+                    self._providers.popitem(last=False)
+        return providers
+
+    def get_provider_page(self, specialty: Optional[str] = None, service: Optional[str] = None,
+                          cursor: Optional[str] = None, limit: Optional[int] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        One page of the provider list, addressed by a keyset cursor
+
+        The cursor records the (total_prescriptions, provider_name,
+        provider_specialty) key of the last provider returned, so pages stay
+        consistent when a refresh shifts positions in the list.
+
+        Args:
+            specialty: Only count prescriptions of this specialty
+            service: Only count prescriptions of this service
+            cursor: next_cursor of the previous page, or None for the first page
+            limit: Page size, or None for every remaining provider
+
+        Returns:
+            Providers of the page and the cursor of the next one (None on the last page)
+
+        Raises:
+            ValidationError: If the cursor is malformed
+        """
+        providers = self.get_providers(specialty, service)
+        start = self._seek(providers, self.decode_cursor(cursor)) if cursor else 0
+        end = len(providers) if limit is None else min(start + limit, len(providers))
+        page = providers[start:end]
+        next_cursor = self.encode_cursor(page[-1]) if page and end < len(providers) else None
+        return page, next_cursor
+
+    @staticmethod
+    def encode_cursor(provider: Dict[str, Any]) -> str:
+        """Opaque cursor pointing just past a provider"""
+        key = [provider['total_prescriptions'], provider['provider_name'], provider['provider_specialty']]
+        raw = json.dumps(key, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> Tuple:
+        """Sort key of the provider a cursor points past"""
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            total, name, specialty = json.loads(raw.decode('utf-8'))
+            if not isinstance(total, int) or not isinstance(name, str) or not (specialty is None or isinstance(specialty, str)):
+                raise ValueError(cursor)
+        except (ValueError, TypeError, UnicodeDecodeError):
+            raise ValidationError("cursor is not a valid provider cursor", field='cursor')
+        return _provider_sort_key({'total_prescriptions': total, 'provider_name': name, 'provider_specialty': specialty})
+
+    @staticmethod
+    def _seek(providers: List[Dict[str, Any]], key: Tuple) -> int:
+        """Position of the first provider ordered after key"""
+        lo, hi = 0, len(providers)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if _provider_sort_key(providers[mid]) <= key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def search_providers(self, query: str, limit: int) -> List[Dict[str, Any]]:
+        """
+        Providers whose name matches a typed query, by prescription volume
+
+        The search index is built once per summary from the unfiltered provider list.
+
+        Args:
+            query: Typed text, matched after Persian normalization
+            limit: Maximum number of providers
+
+        Returns:
+            Up to limit providers, name-prefix matches first
+        """
+        summary = self._ensure_loaded()
+        with self._lock:
+            index = self._search_index if summary is self._summary else None
+        if index is None:
+            index = ProviderSearchIndex(self.get_providers())
+            with self._lock:
+                if summary is self._summary:
+                    self._search_index = index
+        return index.search(query, limit)
+
+    def get_service_stats(self) -> Dict[str, Any]:
+        """
+        Totals and top services/specialties, precomputed from the summary
+
+        Returns:
+            Statistics with an updated_at timestamp of the summary they come from
+        """
+        self._ensure_loaded()
+        return self._service_stats
+
+    def invalidate(self):
+        """Drop the catalog so the next lookup reloads it from the database"""
+        with self._lock:
+            self._generation += 1
+            self._summary = None
+            self._watermark = None
+            self._providers.clear()
+            self._search_index = None
+            self._loaded_at = None
+        logger.info("Catalog cache invalidated")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get catalog cache statistics"""
+        with self._lock:
+            age = time.monotonic() - self._loaded_at if self._loaded_at is not None else None
+            return {
+                'loaded': self._summary is not None,
+                'loaded_at': self._loaded_at_wall.isoformat() if self._loaded_at_wall else None,
+                'age_seconds': round(age, 1) if age is not None else None,
+                'ttl_seconds': self.ttl,
+                'summary_rows': len(self._summary) if self._summary is not None else 0,
+                'services': len(self._services),
+                'specialties': len(self._specialties),
+                'provider_lists_cached': len(self._providers),
+                'search_index_entries': len(self._search_index) if self._search_index is not None else 0,
+                'hits': self.hits,
+                'loads': self.loads,
+                'incremental_refreshes': self.incremental_refreshes,
+                'watermark_column': self.watermark_column,
+                'watermark': str(self._watermark) if self._watermark is not None else None,
+                'refreshing': self._refresh_thread is not None and self._refresh_thread.is_alive()
+            }
+
+    def _ensure_loaded(self) -> pd.DataFrame:
+        """Return the current summary, loading it on first use and refreshing it when stale"""
+        with self._lock:
+            if self._summary is not None:
+                self.hits += 1
+                if time.monotonic() - self._loaded_at > self.ttl:
+                    self._start_background_refresh()
+                return self._summary
+        
+        # Concurrent first lookups wait here for a single load, without blocking get_stats()
+        with self._load_lock:
+            with self._lock:
+                if self._summary is not None:
+                    return self._summary
+                generation = self._generation
+            return self._load(generation)
+
+    def _start_background_refresh(self):
+        """Reload the summary off the request path; caller holds the lock"""
+        if self._refresh_thread is not None and self._refresh_thread.is_alive():
+            return
+        self._refresh_thread = threading.Thread(target=self._refresh, name='catalog-refresh', daemon=True)
+        self._refresh_thread.start()
+
+    def _refresh(self):
+        """Background refresh that keeps the old catalog on failure"""
+        with self._lock:
+            summary, watermark = self._summary, self._watermark
+        try:
+            if summary is not None and watermark is not None:
+                # Only rows added since the last load are read and merged in
+                delta, new_watermark = self._query_summary(since=watermark)
+                merged = self._merge(summary, delta)
+            else:
+                merged, new_watermark = self._query_summary()
+        except Exception as e:
+            logger.error(f"Catalog refresh failed, keeping the previous catalog: {str(e)}")
+            return
+        catalog = self._build_catalog(merged)
+        with self._lock:
+            if self._summary is not summary:
+                # Invalidated or replaced while refreshing; the delta no longer applies
+                return
+            if watermark is not None and summary is not None:
+                self.incremental_refreshes += 1
+            self._install(merged, new_watermark, catalog)
+
+    def _load(self, generation: int) -> pd.DataFrame:
+        """
+        Synchronous full load; caller holds _load_lock but not _lock
+
+        Args:
+            generation: Invalidation count when the load started
+
+        Returns:
+            The loaded summary, installed unless invalidate() ran meanwhile
+        """
+        self._check_watermark_column()
+        summary, watermark = self._query_summary()
+        catalog = self._build_catalog(summary)
+        with self._lock:
+            if self._generation == generation:
+                self._install(summary, watermark, catalog)
+        return summary
+
+    def _check_watermark_column(self):
+        """Fall back to full reloads unless the watermark column is an integer key"""
+        if self.watermark_column is None or self._watermark_checked:
+            return
+        self._watermark_checked = True
+        if self.db_manager.is_embedded and self.watermark_column.lower() == 'rowid':
+            return
+        table_info = self.db_manager.get_table_info('Prescriptions') or {'columns': []}
+        types = {col['name']: str(col['type']).lower() for col in table_info['columns']}
+        column_type = types.get(self.watermark_column)
+        if column_type is None or 'int' not in column_type:
+            logger.warning(
+                f"Catalog watermark column {self.watermark_column} is not an integer key of Prescriptions "
+                f"({column_type or 'missing'}), refreshing the catalog with full reloads"
+            )
+            self.watermark_column = None
+
+    def _query_summary(self, since: Any = None) -> Tuple[pd.DataFrame, Any]:
+        """
+        Run the summary query, optionally over rows past a watermark only
+
+        The watermark is read before the summary and bounds it, so rows landing
+        while the query runs are picked up by the next refresh instead of twice.
+
+        Args:
+            since: Watermark of the previous load
+
+        Returns:
+            Summary rows and the watermark they extend to (None without a watermark column)
+        """
+        started = time.perf_counter()
+        watermark, where, params = None, '', {}
+        with self.db_manager.get_connection() as conn:
+            if self.watermark_column:
+                column = f"`{self.watermark_column}`"
+                watermark = conn.execute(text(f"SELECT MAX({column}) FROM Prescriptions")).scalar()
+                if watermark is None:
+                    watermark = since
+                conditions = [f"{column} <= :upper"]
+                params['upper'] = watermark
+                if since is not None:
+                    conditions.append(f"{column} > :lower")
+                    params['lower'] = since
+                where = 'WHERE ' + ' AND '.join(conditions)
+            if since is not None and watermark == since:
+                rows = []
+            else:
+                with db_query_duration.time(operation='catalog_summary'):
+                    rows = conn.execute(text(CATALOG_SUMMARY_QUERY.format(where=where)), params).fetchall()
+        summary = pd.DataFrame([tuple(row) for row in rows], columns=SUMMARY_COLUMNS)
+        kind = 'catalog delta' if since is not None else 'catalog summary'
+        logger.info(f"Loaded {kind} with {len(summary)} rows in {time.perf_counter() - started:.2f}s")
+        return summary, watermark
+
+    @staticmethod
+    def _merge(summary: pd.DataFrame, delta: pd.DataFrame) -> pd.DataFrame:
+        """Add the counts of newly landed rows to the summary"""
+        if delta.empty:
+            return summary
+        return (
+            pd.concat([summary, delta], ignore_index=True)
+            .groupby(SUMMARY_COLUMNS[:-1], dropna=False, sort=False)['prescriptions'].sum()
+            .reset_index()
+        )
+
+    @classmethod
+    def _build_catalog(cls, summary: pd.DataFrame) -> Dict[str, Any]:
+        """Lists and statistics derived from a summary, computed before taking the lock"""
+        loaded_at_wall = datetime.now()
+        return {
+            'services': cls._distinct(summary['Service']),
+            'specialties': cls._distinct(summary['provider_specialty']),
+            'loaded_at_wall': loaded_at_wall,
+            'service_stats': cls._build_service_stats(summary, loaded_at_wall)
+        }
+
+    def _install(self, summary: pd.DataFrame, watermark: Any, catalog: Dict[str, Any]):
+        """Replace the catalog with a freshly loaded summary; caller holds the lock"""
+        self._summary = summary
+        self._watermark = watermark
+        self._services = catalog['services']
+        self._specialties = catalog['specialties']
+        self._providers.clear()
+        self._search_index = None
+        self._loaded_at = time.monotonic()
+        self._loaded_at_wall = catalog['loaded_at_wall']
+        self._service_stats = catalog['service_stats']
+        self.loads += 1
+
+    @classmethod
+    def _build_service_stats(cls, summary: pd.DataFrame, updated_at: datetime) -> Dict[str, Any]:
+        """Compute the /services/stats figures from the summary"""
+        def top(column: str, name: str) -> List[Dict[str, Any]]:
+            rows = summary[summary[column].notna() & (summary[column] != '')]
+            totals = rows.groupby(column)['prescriptions'].sum().sort_values(ascending=False, kind='stable')
+            return [{name: label, 'count': int(count)} for label, count in totals.head(TOP_STATS_SIZE).items()]
+
+        return {
+            'total_services': len(cls._distinct(summary['Service'])),
+            'total_specialties': len(cls._distinct(summary['provider_specialty'])),
+            'total_providers': len(cls._distinct(summary['provider_name'])),
+            'total_prescriptions': int(summary['prescriptions'].sum()),
+            'top_services': top('Service', 'service'),
+            'top_specialties': top('provider_specialty', 'specialty'),
+            'updated_at': updated_at.isoformat()
+        }
+
+    @staticmethod
+    def _distinct(values: pd.Series) -> List[str]:
+        """Sorted distinct values, excluding missing and empty ones"""
+        values = values.dropna()
+        return sorted(set(values[values != '']))
+
+    @staticmethod
+    def _provider_list(summary: pd.DataFrame, specialty: Optional[str], service: Optional[str]) -> List[Dict[str, Any]]:
+        """Group the summary rows matching the filters per provider and specialty"""
+        rows = summary[summary['provider_name'].notna() & (summary['provider_name'] != '')]
+        if specialty:
+            rows = rows[rows['provider_specialty'] == specialty]
+        if service:
+            rows = rows[rows['Service'] == service]
+
+        grouped = (
+            rows.groupby(['provider_name', 'provider_specialty'], dropna=False)
+            .agg(services_count=('Service', 'nunique'), total_prescriptions=('prescriptions', 'sum'))
+            .reset_index()
+        )
+        providers = [
+            {
+                'provider_name': row.provider_name,
+                'provider_specialty': None if pd.isna(row.provider_specialty) else row.provider_specialty,
+                'services_count': int(row.services_count),
+                'total_prescriptions': int(row.total_prescriptions)
+            }
+            for row in grouped.itertuples(index=False)
+        ]
+        providers.sort(key=_provider_sort_key)
+        return providers
@@ -0,0 +1,128 @@
+"""
+Rendered chart cache for fraud detection API
+کش نمودارهای رندر شده برای API تشخیص تقلب
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+class ChartCache:
+    """
+    Thread-safe LRU cache for rendered charts bounded by total payload size.
+
+    Entries are keyed by chart type, model version and chart parameters so a
+    retrained model never serves charts rendered from the previous data.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max(0, int(max_bytes))
+        self._entries: 'OrderedDict[Tuple, Any]' = OrderedDict()
+        self._sizes: Dict[Tuple, int] = {}
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(chart_type: str, model_version: Optional[str], params: Dict[str, Any]) -> Tuple:
+        """Build a hashable cache key from chart type, model version and parameters"""
+        return (chart_type, model_version, tuple(sorted((k, ChartCache._freeze(v)) for k, v in params.items())))
+
+    @staticmethod
+    def _freeze(value: Any) -> Hashable:
+        """Convert parameter values into hashable equivalents"""
+        if isinstance(value, dict):
+            return tuple(sorted((k, ChartCache._freeze(v)) for k, v in value.items()))
+        if isinstance(value, (list, tuple, set)):
+            return tuple(ChartCache._freeze(v) for v in value)
+        return value
+
+    @staticmethod
+    def _sizeof(value: Any) -> int:
+        """Approximate the memory held by a cached payload"""
+        if isinstance(value, (str, bytes, bytearray)):
+            return len(value)
+        if isinstance(value, dict):
+            return sum(ChartCache._sizeof(k) + ChartCache._sizeof(v) for k, v in value.items())
+        if isinstance(value, (list, tuple)):
+            return sum(ChartCache._sizeof(v) for v in value)
+        return 8
+
+    def get(self, key: Tuple) -> Optional[Any]:
+        """Return the cached payload for key, or None on a miss"""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def contains(self, key: Tuple) -> bool:
+        """Check for a cached entry without touching hit statistics or LRU order"""
+        with self._lock:
+            return key in self._entries
+
+    def put(self, key: Tuple, value: Any) -> bool:
+        """
+        Store a payload, evicting least recently used entries to stay within budget
+
+        Args:
+            key: Cache key from make_key
+            value: Rendered chart payload
+
+        Returns:
+            True if the payload was cached, False if it exceeds the whole budget
+        """
+        size = self._sizeof(value)
+        with self._lock:
+            if size > self.max_bytes:
+                return False
+            if key in self._entries:
+                self.current_bytes -= self._sizes.pop(key)
+                del self._entries[key]
+            while self._entries and self.current_bytes + size > self.max_bytes:
+                old_key, _ = self._entries.popitem(last=False)
+                self.current_bytes -= self._sizes.pop(old_key)
+                self.evictions += 1
+            self._entries[key] = value
+            self._sizes[key] = size
+            self.current_bytes += size
+            return True
+
+    def invalidate(self, keep_version: Optional[str] = None) -> int:
+        """
+        Drop cached charts, optionally keeping those rendered for one model version
+
+        Args:
+            keep_version: Model version whose entries should survive
+
+        Returns:
+            Number of entries removed
+        """
+        with self._lock:
+            stale = [key for key in self._entries if keep_version is None or key[1] != keep_version]
+            for key in stale:
+                del self._entries[key]
+                self.current_bytes -= self._sizes.pop(key)
+            return len(stale)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache occupancy and hit statistics"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'size_bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+            }
@@ -0,0 +1,267 @@
+"""
+Process pool for chart rendering
+استخر پردازه برای رندر نمودارها
+"""
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, InvalidStateError, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set, Union
+from core.exceptions import ChartGenerationError, ServiceOverloadedError
+from .chart_renderer import init_worker, render_chart_with_stats, shaping_memo
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Module the forkserver imports once so each worker it forks starts with matplotlib loaded
+RENDERER_MODULE = 'services.chart_renderer'
+
+def _settle(future: Future, result: Any = None, error: Optional[BaseException] = None):
+    """Complete a render future unless it was already failed by a pool restart"""
+    try:
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+    except InvalidStateError:
+        pass
+
+class ChartRenderPool:
+    """
+    Renders chart data in dedicated worker processes.
+
+    Rendering never runs on request threads, so CPU-heavy matplotlib work does
+    not hold the GIL of the serving process. Submissions are bounded: when
+    queue_size renders are already pending the request is rejected instead of
+    queueing indefinitely, and each render is abandoned after timeout seconds.
+    A pool with processes=0 renders inline, serialized by a lock.
+
+    Workers are started by the first render of the serving process (after the
+    gunicorn fork) through a forkserver, or spawn where forkserver is not
+    available, so they are never forked from a process that runs threads.
+    """
+
+    def __init__(self, processes: int, queue_size: int, timeout: float,
+                 dpi: int, figsize: Sequence[float], font_path: Optional[str] = None,
+                 vocabulary: Union[List[str], Callable[[], List[str]], None] = None, shaping_memo_size: int = 4096,
+                 retry_after: int = 2):
+        """
+        Args:
+            vocabulary: Labels shaped ahead of the first render, or a callable producing them
+                        that is only called when the first worker (or inline render) starts
+            retry_after: Seconds clients are told to wait when a render is rejected or times out
+        """
+        self.processes = max(0, int(processes))
+        self.queue_size = max(1, int(queue_size))
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.dpi = dpi
+        self.figsize = tuple(figsize)
+        self.font_path = font_path
+        self._vocabulary_source = vocabulary if callable(vocabulary) else None
+        self._vocabulary_lock = threading.Lock()
+        self.vocabulary: List[str] = [] if callable(vocabulary) else list(vocabulary or [])
+        self._inline_ready = False
+        self.shaping_memo_size = shaping_memo_size
+
+        self._pool = None
+        self._pool_pid = None
+        self._pool_lock = threading.Lock()
+        # Unfinished renders per pool, failed at once when their pool is restarted
+        self._pending: Dict[Any, Set[Future]] = {}
+        self._inline_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.queue_size)
+        self._stats_lock = threading.Lock()
+        self._in_flight = 0
+        self.renders = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.failures = 0
+        # Latest shaping memo statistics reported by each worker process
+        self._shaping_stats: Dict[int, Dict[str, Any]] = {}
+
+    def _resolve_vocabulary(self) -> List[str]:
+        """
+        Labels to pre-shape, computed on first use when given as a callable
+
+        Computing them aggregates chart data, so callers must not hold
+        _pool_lock or _inline_lock; concurrent first renders wait on a
+        lock of its own until the labels are ready.
+        """
+        if self._vocabulary_source is None:
+            return self.vocabulary
+        with self._vocabulary_lock:
+            source, self._vocabulary_source = self._vocabulary_source, None
+            if source is not None:
+                try:
+                    self.vocabulary = list(source())
+                except Exception as e:
+                    logger.warning(f"Could not collect chart labels to pre-shape: {str(e)}")
+        return self.vocabulary
+
+    def _get_pool(self, vocabulary: List[str]):
+        """Worker pool of this process, created on first use; call with _pool_lock held"""
+        if self._pool is not None and self._pool_pid != os.getpid():
+            # Pool inherited across fork; its workers belong to the parent
+            self._pool = None
+            self._pending.clear()
+        if self._pool is None:
+            if 'forkserver' in multiprocessing.get_all_start_methods():
+                method = 'forkserver'
+                context = multiprocessing.get_context(method)
+                context.set_forkserver_preload([RENDERER_MODULE])
+            else:
+                method = 'spawn'
+                context = multiprocessing.get_context(method)
+            self._pool = context.Pool(
+                processes=self.processes,
+                initializer=init_worker,
+                initargs=(self.font_path, vocabulary, self.shaping_memo_size)
+            )
+            with self._stats_lock:
+                self._shaping_stats.clear()
+            self._pool_pid = os.getpid()
+            logger.info(f"Started chart render pool with {self.processes} {method} workers")
+        return self._pool
+
+    def _submit(self, args: tuple):
+        """Queue a render on the pool; returns the pool and the future of its result"""
+        future = Future()
+        vocabulary = self._resolve_vocabulary()
+        with self._pool_lock:
+            pool = self._get_pool(vocabulary)
+            self._pending.setdefault(pool, set()).add(future)
+        pool.apply_async(
+            render_chart_with_stats, args,
+            callback=lambda result: _settle(future, result),
+            error_callback=lambda error: _settle(future, error=error)
+        )
+        return pool, future
+
+    def _restart_pool(self, pool):
+        """
+        Terminate a pool with a stuck worker so the next render starts a fresh one
+
+        Renders still pending on the terminated pool are failed right away
+        rather than left to run into their own timeouts.
+        """
+        with self._pool_lock:
+            if self._pool is pool:
+                self._pool = None
+            pending = self._pending.pop(pool, set())
+        for future in pending:
+            _settle(future, error=ServiceOverloadedError(
+                "Chart render pool was restarted after another render timed out",
+                retry_after=self.retry_after, resource='chart_render_pool'
+            ))
+        pool.terminate()
+        logger.warning(f"Chart render pool terminated after a render timeout ({len(pending)} pending renders failed)")
+
+    def render(self, data: Dict[str, Any], image_format: str = 'png', dpi: Optional[int] = None,
+               figsize: Optional[Sequence[float]] = None) -> bytes:
+        """
+        Render chart data to image bytes
+
+        Args:
+            data: Chart data from ChartService.get_chart_data
+            image_format: Output format (png, svg or webp)
+            dpi: Output resolution, defaults to the pool's dpi
+            figsize: Figure size in inches, defaults to the pool's figsize
+
+        Returns:
+            Encoded image bytes
+
+        Raises:
+            ServiceOverloadedError: If the queue is full or the render times out
+            ChartGenerationError: If the render fails
+        """
+        chart_type = data.get('chart_type')
+        args = (data, dpi or self.dpi, tuple(figsize or self.figsize), image_format)
+        if not self._slots.acquire(blocking=False):
+            with self._stats_lock:
+                self.rejected += 1
+            raise ServiceOverloadedError(
+                f"Chart render queue is full ({self.queue_size} pending), try again shortly",
+                retry_after=self.retry_after, resource='chart_render_pool'
+            )
+
+        with self._stats_lock:
+            self._in_flight += 1
+        try:
+            if self.processes == 0:
+                vocabulary = self._resolve_vocabulary()
+                with self._inline_lock:
+                    if not self._inline_ready:
+                        init_worker(self.font_path, vocabulary, self.shaping_memo_size)
+                        self._inline_ready = True
+                    chart, pid, shaping_stats = render_chart_with_stats(*args)
+            else:
+                pool, future = self._submit(args)
+                try:
+                    chart, pid, shaping_stats = future.result(timeout=self.timeout)
+                except FutureTimeoutError:
+                    with self._stats_lock:
+                        self.timeouts += 1
+                    self._restart_pool(pool)
+                    raise ServiceOverloadedError(
+                        f"Chart rendering timed out after {self.timeout} seconds",
+                        retry_after=self.retry_after, resource='chart_render_pool'
+                    )
+                finally:
+                    with self._pool_lock:
+                        self._pending.get(pool, set()).discard(future)
+            with self._stats_lock:
+                self.renders += 1
+                self._shaping_stats[pid] = shaping_stats
+            return chart
+
+        except (ChartGenerationError, ServiceOverloadedError):
+            raise
+        except Exception as e:
+            with self._stats_lock:
+                self.failures += 1
+            raise ChartGenerationError(f"Failed to render chart: {str(e)}", chart_type=chart_type)
+        finally:
+            with self._stats_lock:
+                self._in_flight -= 1
+            self._slots.release()
+
+    def close(self):
+        """Stop the worker processes"""
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+            self._pending.clear()
+        if pool is not None and self._pool_pid == os.getpid():
+            pool.close()
+            pool.join()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get render pool statistics"""
+        with self._stats_lock:
+            if self.processes == 0:
+                worker_stats = [shaping_memo.get_stats()]
+            else:
+                worker_stats = list(self._shaping_stats.values())
+            hits = sum(stats['hits'] for stats in worker_stats)
+            misses = sum(stats['misses'] for stats in worker_stats)
+            return {
+                'processes': self.processes,
+                'running': self._pool is not None and self._pool_pid == os.getpid(),
+                'queue_size': self.queue_size,
+                'in_flight': self._in_flight,
+                'timeout_seconds': self.timeout,
+                'renders': self.renders,
+                'timeouts': self.timeouts,
+                'rejected': self.rejected,
+                'failures': self.failures,
+                'text_shaping': {
+                    'workers_reporting': len(worker_stats),
+                    'memo_entries': sum(stats['size'] for stats in worker_stats),
+                    'memo_size_per_worker': self.shaping_memo_size,
+                    'vocabulary_size': len(self.vocabulary),
+                    'hits': hits,
+                    'misses': misses,
+                    'hit_rate': round(hits / (hits + misses), 4) if hits + misses else 0.0
+                }
+            }
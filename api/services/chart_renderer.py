@@ -0,0 +1,276 @@
+"""
+Matplotlib chart renderer for fraud detection API
+رندرکننده نمودار matplotlib برای API تشخیص تقلب
+
+Draws chart data produced by ChartService.get_chart_data onto a private
+Figure/Axes pair. Nothing here touches the pyplot state machine, so renders
+are independent of each other and can run in worker processes. This module
+must stay free of application imports (config, core) because it is loaded
+by the render pool workers.
+"""
+
+import matplotlib
+# Set backend to Agg before importing anything that may pull in pyplot
+matplotlib.use('Agg')
+import matplotlib.dates as mdates
+import matplotlib.font_manager as fm
+from matplotlib import rcParams
+from matplotlib.figure import Figure
+import pandas as pd
+import seaborn as sns
+import io
+import os
+import threading
+import logging
+from collections import OrderedDict
+from typing import Dict, Any, Iterable, Optional, Sequence, Tuple
+import arabic_reshaper
+from bidi.algorithm import get_display
+
+logger = logging.getLogger(__name__)
+
+# Output formats supported by the Agg backend (WebP through Pillow)
+IMAGE_MIMETYPES = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+    'webp': 'image/webp',
+}
+
+FONT_PATHS = [
+    'assets/Vazir-Medium-FD.ttf',  # Primary Vazir font
+    'api/assets/Vazir-Medium-FD.ttf',  # Alternative path
+    'assets/Estedad-Medium.ttf',  # Fallback Estedad font
+    'api/assets/Estedad-Medium.ttf',  # Alternative Estedad path
+]
+
+def find_font_path() -> Optional[str]:
+    """Locate the bundled Persian font, relative to the working directory"""
+    for path in FONT_PATHS:
+        if os.path.exists(path):
+            return os.path.abspath(path)
+    return None
+
+def configure_fonts(font_path: Optional[str] = None):
+    """
+    Configure matplotlib for Persian text rendering
+
+    Called once in the serving process and once per render worker.
+
+    Args:
+        font_path: Font file to register, or None to use the fallback font
+    """
+    try:
+        if font_path and os.path.exists(font_path):
+            # Register the font
+            fm.fontManager.addfont(font_path)
+            font_name = fm.FontProperties(fname=font_path).get_name()
+            rcParams['font.family'] = font_name
+            logger.info(f"Persian font configured: {font_name} from {font_path}")
+        else:
+            # Fallback to default font with Unicode support
+            rcParams['font.family'] = 'DejaVu Sans'
+            logger.warning("Vazir font not found in assets directory, using fallback font")
+
+        # Configure matplotlib for better text rendering
+        rcParams['axes.unicode_minus'] = False
+        rcParams['figure.autolayout'] = True
+
+    except Exception as e:
+        logger.error(f"Error configuring Persian fonts: {str(e)}")
+        # Fallback configuration
+        rcParams['font.family'] = 'DejaVu Sans'
+        rcParams['axes.unicode_minus'] = False
+
+class ShapingMemo:
+    """Bounded LRU memo of shaped (reshaped and bidi-reordered) strings"""
+
+    def __init__(self, max_size: int = 4096):
+        self.max_size = max(1, int(max_size))
+        self._entries: 'OrderedDict[str, str]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def shape(self, text: str) -> str:
+        """Return the shaped form of text, shaping it on a miss"""
+        with self._lock:
+            shaped = self._entries.get(text)
+            if shaped is not None:
+                self._entries.move_to_end(text)
+                self.hits += 1
+                return shaped
+            self.misses += 1
+        shaped = _shape_persian_text(text)
+        self._store(text, shaped)
+        return shaped
+
+    def prepopulate(self, texts: Iterable[str]):
+        """Shape texts ahead of time without counting them as misses"""
+        for text in texts:
+            if text and isinstance(text, str) and text not in self._entries:
+                self._store(text, _shape_persian_text(text))
+
+    def resize(self, max_size: int):
+        """Change the capacity, evicting least recently used entries if needed"""
+        with self._lock:
+            self.max_size = max(1, int(max_size))
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def _store(self, text: str, shaped: str):
+        """Insert a shaped string, evicting the least recently used beyond capacity"""
+        with self._lock:
+            self._entries[text] = shaped
+            self._entries.move_to_end(text)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get memo occupancy and hit statistics"""
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+# Shared by all renders in this process (the serving process or one pool worker)
+shaping_memo = ShapingMemo()
+
+def init_worker(font_path: Optional[str] = None, vocabulary: Sequence[str] = (), memo_size: int = 4096):
+    """
+    Prepare a render process: fonts plus a shaping memo seeded with known labels
+
+    Args:
+        font_path: Font file to register
+        vocabulary: Titles and category names to shape ahead of the first render
+        memo_size: Capacity of the shaping memo
+    """
+    configure_fonts(font_path)
+    shaping_memo.resize(memo_size)
+    shaping_memo.prepopulate(vocabulary)
+
+def prepare_persian_text(text: str) -> str:
+    """Prepare Persian text for matplotlib rendering, memoized per process"""
+    if not text or not isinstance(text, str):
+        return text
+    return shaping_memo.shape(text)
+
+def _shape_persian_text(text: str) -> str:
+    """Reshape and reorder Persian text for display"""
+    try:
+        # Reshape Arabic/Persian text
+        reshaped_text = arabic_reshaper.reshape(text)
+        # Apply bidirectional algorithm
+        bidi_text = get_display(reshaped_text)
+        return bidi_text
+    except Exception as e:
+        logger.warning(f"Error processing Persian text '{text}': {str(e)}")
+        return text
+
+def render_chart(data: Dict[str, Any], dpi: int, figsize: Sequence[float], image_format: str = 'png') -> bytes:
+    """
+    Render chart data to image bytes
+
+    Args:
+        data: Chart data from ChartService.get_chart_data
+        dpi: Output resolution
+        figsize: Figure size in inches
+        image_format: One of IMAGE_MIMETYPES
+
+    Returns:
+        Encoded image bytes
+    """
+    if image_format not in IMAGE_MIMETYPES:
+        raise ValueError(f"Unsupported image format: {image_format}")
+
+    fig = Figure(figsize=tuple(figsize))
+    ax = fig.add_subplot()
+
+    kind = data['kind']
+    if kind == 'bar':
+        if data['chart_type'] == 'risk_indicators':
+            _draw_bar(ax, data, color='skyblue', rotation=90, ha='center')
+        else:
+            _draw_bar(ax, data)
+    elif kind == 'pie':
+        _draw_pie(ax, data)
+    elif kind == 'grouped_bar':
+        _draw_grouped_bar(ax, data)
+    elif kind == 'line' and data['chart_type'].endswith('_time_series'):
+        _draw_time_series(ax, data)
+    elif kind == 'line':
+        _draw_date_line(ax, data)
+    else:
+        raise ValueError(f"Unknown chart kind: {kind}")
+
+    fig.tight_layout()
+    img = io.BytesIO()
+    fig.savefig(img, format=image_format, bbox_inches='tight', dpi=dpi)
+    return img.getvalue()
+
+def render_chart_with_stats(data: Dict[str, Any], dpi: int, figsize: Sequence[float],
+                            image_format: str = 'png') -> Tuple[bytes, int, Dict[str, Any]]:
+    """Render chart data and report this process's shaping memo statistics alongside"""
+    image = render_chart(data, dpi, figsize, image_format)
+    return image, os.getpid(), shaping_memo.get_stats()
+
+def _set_titles(ax, data: Dict[str, Any]):
+    """Apply the chart title and axis labels"""
+    ax.set_title(prepare_persian_text(data['title']))
+    if data.get('x_label'):
+        ax.set_xlabel(prepare_persian_text(data['x_label']))
+    if data.get('y_label'):
+        ax.set_ylabel(prepare_persian_text(data['y_label']))
+
+def _draw_bar(ax, data: Dict[str, Any], color: Optional[str] = None, rotation: int = 45, ha: Optional[str] = None):
+    """Draw a bar chart"""
+    labels_persian = [prepare_persian_text(str(label)) for label in data['labels']]
+
+    ax.bar(labels_persian, data['values'], color=color)
+    _set_titles(ax, data)
+    ax.tick_params(axis='x', labelrotation=rotation)
+    if ha:
+        for label in ax.get_xticklabels():
+            label.set_horizontalalignment(ha)
+
+def _draw_pie(ax, data: Dict[str, Any]):
+    """Draw a pie chart"""
+    labels_persian = [prepare_persian_text(str(label)) for label in data['labels']]
+
+    ax.pie(data['values'], labels=labels_persian, autopct='%.2f%%', startangle=90)
+    _set_titles(ax, data)
+
+def _draw_grouped_bar(ax, data: Dict[str, Any]):
+    """Draw one bar per series within each label group"""
+    frame = pd.DataFrame(
+        data['series'],
+        index=[prepare_persian_text(str(label)) for label in data['labels']]
+    )
+    frame.columns = [prepare_persian_text(str(name)) for name in frame.columns]
+
+    frame.plot(kind='bar', ax=ax)
+    _set_titles(ax, data)
+    ax.tick_params(axis='x', labelrotation=45)
+
+def _draw_date_line(ax, data: Dict[str, Any]):
+    """Draw a line chart over admission dates"""
+    series = pd.Series(data['values'], index=pd.to_datetime(data['labels']), dtype=float)
+
+    ax.plot(series.index, series.values)
+    _set_titles(ax, data)
+    ax.xaxis.set_major_locator(mdates.MonthLocator())
+    ax.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m'))
+    ax.grid(True)
+
+def _draw_time_series(ax, data: Dict[str, Any]):
+    """Draw a marked risk value time series"""
+    df = pd.DataFrame({
+        'Adm_date': pd.to_datetime(data['labels']),
+        'risk_value': pd.Series(data['values'], dtype=float)
+    })
+
+    sns.lineplot(data=df, x='Adm_date', y='risk_value', marker='o', ax=ax)
+    _set_titles(ax, data)
+    ax.tick_params(axis='x', labelrotation=45)
@@ -3,93 +3,176 @@ Chart generation service for fraud detection API
 سرویس تولید نمودار برای API تشخیص تقلب
 """
 
-import matplotlib
-# Set backend to Agg before importing pyplot to avoid tkinter issues in server environment
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
-import matplotlib.font_manager as fm
 import pandas as pd
 import numpy as np
-import seaborn as sns
-import io
 import base64
-from typing import Dict, Any, List, Optional
-from scipy.stats import zscore, norm
-from config.config import app_config
-from core.exceptions import ChartGenerationError
-import logging
-import arabic_reshaper
-from bidi.algorithm import get_display
+import hashlib
 import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+from config.config import app_config, memory_config
+from core.exceptions import ChartGenerationError, ServiceOverloadedError, ValidationError
+from .chart_cache import ChartCache
+from .aggregate_cube import AggregateCube
+from .entity_index import EntityTimeSeriesIndex
+from .row_filter_index import RowFilterIndex
+from .time_series import choose_date_bucket, downsample_series, resample_counts
+from .chart_render_pool import ChartRenderPool
+from .chart_renderer import IMAGE_MIMETYPES, configure_fonts, find_font_path
+from .metrics import chart_render_duration
+import logging
+from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+# Charts that depend only on data_final and take no parameters
+STATIC_CHART_TYPES = [
+    'fraud_by_province',
+    'fraud_by_gender',
+    'fraud_by_age_group',
+    'fraud_ratio_by_age_group',
+    'province_fraud_ratio',
+    'province_gender_fraud_percentage',
+    'fraud_counts_by_date',
+    'fraud_ratio_by_date',
+    'fraud_ratio_by_ins_cover',
+    'fraud_ratio_by_invoice_type',
+    'fraud_ratio_by_medical_record_type',
+]
+
+# Persian names of the 11 risk indicators, in feature order
+RISK_INDICATOR_LABELS = [
+    'نسبت منحصر به فرد ارائه‌دهنده', 'نسبت منحصر به فرد بیمار', 'درصد تغییر ارائه‌دهنده',
+    'درصد تغییر بیمار', 'درصد تفاوت', 'درصد تفاوت خدمت',
+    'درصد تفاوت تخصص', 'درصد تفاوت تخصص 2', 'درصد تفاوت خدمت بیمار',
+    'درصد تفاوت خدمات', 'نسبت'
+]
+
+# Count cubes of recently requested filter combinations kept for reuse across charts
+FILTERED_CUBE_MEMO_SIZE = 16
+
+# Charts built from request payloads rather than data_final are never cached
+UNCACHED_CHART_TYPES = {'risk_indicators'}
+
 class ChartService:
     """Service for generating various charts and visualizations"""
     
-    def __init__(self, data_final: pd.DataFrame):
+    def __init__(self, data_final: pd.DataFrame, model_version: Optional[str] = None,
+                 cache: Optional[ChartCache] = None, cube: Optional[AggregateCube] = None,
+                 entity_index: Optional[EntityTimeSeriesIndex] = None):
         self.data_final = data_final
-        plt.style.use('default')  # Reset to default style
-        self._configure_persian_fonts()
+        self.model_version = model_version
+        self._cube = cube
+        self._entity_index = entity_index
+        self._index_lock = threading.Lock()
+        self._filter_index = None
+        self._filtered_cubes: 'OrderedDict[Tuple, AggregateCube]' = OrderedDict()
+        self.cache = cache if cache is not None else ChartCache(memory_config.chart_cache_max_mb * 1024 * 1024)
+        self._prerender_thread = None
+        self._bundle_executor = None
+        self._bundle_executor_pid = None
+        self._bundle_lock = threading.Lock()
+        
+        font_path = find_font_path()
+        configure_fonts(font_path)
+        self.render_pool = ChartRenderPool(
+            processes=app_config.chart_render_processes,
+            queue_size=app_config.chart_render_queue_size,
+            timeout=app_config.chart_render_timeout,
+            retry_after=app_config.chart_render_retry_after,
+            dpi=app_config.chart_dpi,
+            figsize=app_config.chart_figsize,
+            font_path=font_path,
+            vocabulary=self._shaping_vocabulary,
+            shaping_memo_size=app_config.chart_shaping_memo_size
+        )
     
-    def _configure_persian_fonts(self):
-        """Configure matplotlib for Persian text rendering"""
-        try:
-            # Use Vazir font from assets directory
-            font_paths = [
-                'assets/Vazir-Medium-FD.ttf',  # Primary Vazir font
-                'api/assets/Vazir-Medium-FD.ttf',  # Alternative path
-                'assets/Estedad-Medium.ttf',  # Fallback Estedad font
-                'api/assets/Estedad-Medium.ttf',  # Alternative Estedad path
-            ]
-            
-            font_path = None
-            for path in font_paths:
-                if os.path.exists(path):
-                    font_path = path
-                    break
-            
-            if font_path:
-                # Register the font
-                fm.fontManager.addfont(font_path)
-                font_name = fm.FontProperties(fname=font_path).get_name()
-                plt.rcParams['font.family'] = font_name
-                logger.info(f"Persian font configured: {font_name} from {font_path}")
-            else:
-                # Fallback to default font with Unicode support
-                plt.rcParams['font.family'] = 'DejaVu Sans'
-                logger.warning("Vazir font not found in assets directory, using fallback font")
-                
-            # Configure matplotlib for better text rendering
-            plt.rcParams['axes.unicode_minus'] = False
-            plt.rcParams['figure.autolayout'] = True
+    def _shaping_vocabulary(self) -> List[str]:
+        """
+        Titles, axis labels and category names drawn by the static and risk indicator charts
+
+        Called by the render pool when its first worker starts, which is the
+        background prerender when enabled, not during construction.
+        """
+        vocabulary = set()
+        for chart_type in STATIC_CHART_TYPES + ['risk_indicators']:
+            try:
+                if chart_type == 'risk_indicators':
+                    data = self._risk_indicators_data([0.0] * len(RISK_INDICATOR_LABELS))
+                else:
+                    data = self.get_chart_data(chart_type)
+            except Exception as e:
+                logger.warning(f"Could not collect labels of chart {chart_type}: {str(e)}")
+                continue
             
-        except Exception as e:
-            logger.error(f"Error configuring Persian fonts: {str(e)}")
-            # Fallback configuration
-            plt.rcParams['font.family'] = 'DejaVu Sans'
-            plt.rcParams['axes.unicode_minus'] = False
+            vocabulary.update(data[field] for field in ('title', 'x_label', 'y_label') if isinstance(data.get(field), str))
+            vocabulary.update(str(name) for name in data.get('series', {}))
+            if data['kind'] != 'line':  # date axes are not shaped
+                vocabulary.update(str(label) for label in data['labels'])
+        return sorted(vocabulary)
     
-    def _prepare_persian_text(self, text: str) -> str:
-        """Prepare Persian text for matplotlib rendering"""
-        try:
-            if not text or not isinstance(text, str):
-                return text
-            
-            # Reshape Arabic/Persian text
-            reshaped_text = arabic_reshaper.reshape(text)
-            # Apply bidirectional algorithm
-            bidi_text = get_display(reshaped_text)
-            return bidi_text
-        except Exception as e:
-            logger.warning(f"Error processing Persian text '{text}': {str(e)}")
-            return text
+    @property
+    def cube(self) -> AggregateCube:
+        """Prediction count cube backing the aggregate charts, built on first use"""
+        if self._cube is None:
+            with self._index_lock:
+                if self._cube is None:
+                    self._cube = AggregateCube(self.data_final)
+        return self._cube
+    
+    @property
+    def entity_index(self) -> EntityTimeSeriesIndex:
+        """Provider/patient time-series index backing the risk indicator charts, built on first use"""
+        if self._entity_index is None:
+            with self._index_lock:
+                if self._entity_index is None:
+                    self._entity_index = EntityTimeSeriesIndex(self.data_final)
+        return self._entity_index
+    
+    @property
+    def filter_index(self) -> RowFilterIndex:
+        """Date and category row index backing filtered charts, built on first use"""
+        if self._filter_index is None:
+            with self._index_lock:
+                if self._filter_index is None:
+                    self._filter_index = RowFilterIndex(self.data_final)
+        return self._filter_index
+    
+    def _cube_for(self, filters: Optional[Dict[str, Any]]) -> AggregateCube:
+        """Count cube over the rows matching filters, or the full cube without filters"""
+        if not filters:
+            return self.cube
+        
+        key = ChartCache.make_key('filtered_cube', self.model_version, filters)
+        with self._index_lock:
+            cube = self._filtered_cubes.get(key)
+            if cube is not None:
+                self._filtered_cubes.move_to_end(key)
+                return cube
+        
+        rows = self.filter_index.select(filters)
+        cube = AggregateCube(self.data_final.take(rows))
+        with self._index_lock:
+            self._filtered_cubes[key] = cube
+            while len(self._filtered_cubes) > FILTERED_CUBE_MEMO_SIZE:
+                self._filtered_cubes.popitem(last=False)
+        return cube
+    
+    def _check_filters(self, filters: Dict[str, Any]):
+        """Reject category filters whose column is missing from the loaded data"""
+        for name, values in filters.items():
+            if name not in ('from', 'to') and values and not self.filter_index.available(name):
+                raise ValidationError(f"Filtering by {name} is not available for the loaded data", field=name)
     
     def create_chart(self, chart_type: str, **kwargs) -> str:
         """
         Create various charts and return as base64 string
         
+        Charts are served from the render cache when one was already rendered
+        for the same type, parameters and model version.
+        
         Args:
             chart_type: Type of chart to create
             **kwargs: Additional parameters for specific chart types
@@ -100,334 +183,536 @@ class ChartService:
         Raises:
             ChartGenerationError: If chart generation fails
         """
-        fig = None
-        try:
-            # Create figure with error handling
-            fig = plt.figure(figsize=app_config.chart_figsize)
+        if chart_type in UNCACHED_CHART_TYPES:
+            return base64.b64encode(self._render_chart(chart_type, **kwargs)).decode()
+        
+        model_version = self.model_version
+        key = self.cache.make_key(chart_type, model_version, kwargs)
+        chart_data = self.cache.get(key)
+        if chart_data is not None:
+            return chart_data
+        
+        chart_data = base64.b64encode(self._render_chart(chart_type, **kwargs)).decode()
+        if self.model_version == model_version:
+            self.cache.put(key, chart_data)
+        return chart_data
+    
+    def render_image(self, chart_type: str, image_format: str = 'png', dpi: Optional[int] = None,
+                     figsize: Optional[Tuple[float, float]] = None, **kwargs) -> bytes:
+        """
+        Render a chart to raw image bytes in the requested format and resolution
+        
+        Args:
+            chart_type: Type of chart to create
+            image_format: Output format (png, svg or webp)
+            dpi: Output resolution, defaults to the configured chart DPI
+            figsize: Figure size in inches, defaults to the configured chart size
+            **kwargs: Additional parameters for specific chart types
             
-            if chart_type == 'risk_indicators':
-                return self._create_risk_indicators_chart(**kwargs)
-            elif chart_type == 'fraud_by_province':
-                return self._create_fraud_by_province_chart()
-            elif chart_type == 'fraud_by_gender':
-                return self._create_fraud_by_gender_chart()
-            elif chart_type == 'fraud_by_age_group':
-                return self._create_fraud_by_age_group_chart()
-            elif chart_type == 'fraud_ratio_by_age_group':
-                return self._create_fraud_ratio_by_age_group_chart()
-            elif chart_type == 'province_fraud_ratio':
-                return self._create_province_fraud_ratio_chart()
-            elif chart_type == 'province_gender_fraud_percentage':
-                return self._create_province_gender_fraud_percentage_chart()
-            elif chart_type == 'fraud_counts_by_date':
-                return self._create_fraud_counts_by_date_chart()
-            elif chart_type == 'fraud_ratio_by_date':
-                return self._create_fraud_ratio_by_date_chart()
-            elif chart_type == 'fraud_ratio_by_ins_cover':
-                return self._create_fraud_ratio_by_ins_cover_chart()
-            elif chart_type == 'fraud_ratio_by_invoice_type':
-                return self._create_fraud_ratio_by_invoice_type_chart()
-            elif chart_type == 'fraud_ratio_by_medical_record_type':
-                return self._create_fraud_ratio_by_medical_record_type_chart()
-            elif chart_type == 'provider_risk_indicator_time_series':
-                return self._create_provider_risk_indicator_time_series_chart(**kwargs)
-            elif chart_type == 'patient_risk_indicator_time_series':
-                return self._create_patient_risk_indicator_time_series_chart(**kwargs)
-            else:
-                raise ChartGenerationError(f"Unknown chart type: {chart_type}", chart_type=chart_type)
-                
-        except Exception as e:
-            logger.error(f"Error creating chart {chart_type}: {str(e)}")
-            raise ChartGenerationError(f"Failed to create chart: {str(e)}", chart_type=chart_type)
+        Returns:
+            Encoded image bytes
+            
+        Raises:
+            ChartGenerationError: If chart generation fails
+        """
+        image_options = self._image_options(image_format, dpi, figsize)
+        if chart_type in UNCACHED_CHART_TYPES:
+            return self._render_chart(chart_type, **image_options, **kwargs)
+        
+        model_version = self.model_version
+        key = self._image_key(chart_type, model_version, image_options, kwargs)
+        image = self.cache.get(key)
+        if image is not None:
+            return image
+        
+        image = self._render_chart(chart_type, **image_options, **kwargs)
+        if self.model_version == model_version:
+            self.cache.put(key, image)
+        return image
+    
+    def image_etag(self, chart_type: str, image_format: str = 'png', dpi: Optional[int] = None,
+                   figsize: Optional[Tuple[float, float]] = None, **kwargs) -> str:
+        """
+        Entity tag for a rendered image, derived from its inputs
+        
+        The tag only depends on chart type, parameters, output options and model
+        version, so conditional requests can be answered without rendering.
+        """
+        key = self._image_key(chart_type, self.model_version, self._image_options(image_format, dpi, figsize), kwargs)
+        return hashlib.md5(repr(key).encode('utf-8')).hexdigest()
+    
+    def _image_options(self, image_format: str, dpi: Optional[int],
+                       figsize: Optional[Tuple[float, float]]) -> Dict[str, Any]:
+        """Resolve output options against the configured defaults"""
+        return {
+            'image_format': image_format,
+            'dpi': int(dpi or app_config.chart_dpi),
+            'figsize': tuple(round(float(v), 3) for v in (figsize or app_config.chart_figsize))
+        }
+    
+    def _image_key(self, chart_type: str, model_version: Optional[str],
+                   image_options: Dict[str, Any], kwargs: Dict[str, Any]) -> Tuple:
+        """Cache key for raw image bytes"""
+        return self.cache.make_key(f"{chart_type}:{image_options['image_format']}", model_version,
+                                   dict(kwargs, _dpi=image_options['dpi'], _figsize=image_options['figsize']))
+    
+    def render_bundle(self, specs: List[Dict[str, Any]]) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """
+        Produce several charts concurrently, yielding each one as soon as it is ready
+        
+        Cached charts come back immediately while the rest render in parallel in
+        the render pool. A failing chart is reported in its result instead of
+        aborting the bundle.
+        
+        Args:
+            specs: Chart specs with chart_type, format ('image', 'data' or a raw
+                image format), dpi, figsize and params entries
+            
+        Yields:
+            (spec index, result) pairs in completion order; a result holds chart
+            (base64), data or error
+        """
+        executor = self._get_bundle_executor()
+        futures = {executor.submit(self._bundle_item, spec): index for index, spec in enumerate(specs)}
+        try:
+            for future in as_completed(futures):
+                yield futures[future], future.result()
         finally:
-            # Ensure all plots are closed properly
-            if fig is not None:
-                plt.close(fig)
-            plt.close('all')  # Close any remaining figures
+            # The client may stop reading mid-bundle; drop work that has not started
+            for future in futures:
+                future.cancel()
+    
+    def _get_bundle_executor(self) -> ThreadPoolExecutor:
+        """Thread pool shared by bundle requests, recreated after a fork"""
+        with self._bundle_lock:
+            if self._bundle_executor is None or self._bundle_executor_pid != os.getpid():
+                self._bundle_executor = ThreadPoolExecutor(
+                    max_workers=max(1, app_config.chart_bundle_threads),
+                    thread_name_prefix='chart-bundle'
+                )
+                self._bundle_executor_pid = os.getpid()
+            return self._bundle_executor
     
-    def _create_risk_indicators_chart(self, risk_values: List[float]) -> str:
-        """Create risk indicators bar chart"""
+    def _bundle_item(self, spec: Dict[str, Any]) -> Dict[str, Any]:
+        """Produce one chart of a bundle from the cache or the render pool"""
+        chart_type = spec['chart_type']
+        chart_format = spec.get('format', 'image')
+        params = spec.get('params', {})
         try:
-            risk_indices = [
-                'نسبت منحصر به فرد ارائه‌دهنده', 'نسبت منحصر به فرد بیمار', 'درصد تغییر ارائه‌دهنده',
-                'درصد تغییر بیمار', 'درصد تفاوت', 'درصد تفاوت خدمت',
-                'درصد تفاوت تخصص', 'درصد تفاوت تخصص 2', 'درصد تفاوت خدمت بیمار',
-                'درصد تفاوت خدمات', 'نسبت'
-            ]
+            if chart_format == 'data':
+                return {'data': self.get_chart_data(chart_type, **params)}
+            if chart_format == 'image':
+                return {'chart': self.create_chart(chart_type, **params)}
+            image = self.render_image(chart_type, chart_format, dpi=spec.get('dpi'), figsize=spec.get('figsize'), **params)
+            return {'chart': base64.b64encode(image).decode(), 'mimetype': IMAGE_MIMETYPES[chart_format]}
+        except ServiceOverloadedError as e:
+            return {'error': e.message, 'retry_after': e.retry_after}
+        except ChartGenerationError as e:
+            return {'error': e.message}
+        except Exception as e:
+            logger.error(f"Error creating bundled chart {chart_type}: {str(e)}")
+            return {'error': str(e)}
+    
+    def prerender_static_charts(self, background: bool = True) -> Optional[threading.Thread]:
+        """
+        Render all static charts into the cache
+        
+        Args:
+            background: Run in a daemon thread instead of blocking the caller
             
-            # Validate risk_values
-            if not risk_values or len(risk_values) == 0:
-                logger.warning("No risk values provided for risk indicators chart")
-                risk_values = [0] * len(risk_indices)
-            elif len(risk_values) != len(risk_indices):
-                logger.warning(f"Risk values length ({len(risk_values)}) doesn't match indices length ({len(risk_indices)})")
-                # Pad or truncate to match
-                if len(risk_values) < len(risk_indices):
-                    risk_values.extend([0] * (len(risk_indices) - len(risk_values)))
+        Returns:
+            The prerender thread when running in the background, otherwise None
+        """
+        if not background:
+            self._prerender()
+            return None
+        
+        if self._prerender_thread is not None and self._prerender_thread.is_alive():
+            return self._prerender_thread
+        
+        self._prerender_thread = threading.Thread(target=self._prerender, name='chart-prerender', daemon=True)
+        self._prerender_thread.start()
+        return self._prerender_thread
+    
+    def _prerender(self):
+        """Render static charts that are not cached yet for the current model version"""
+        rendered = 0
+        # Build the entity and filter indexes off the request path as well
+        _ = self.entity_index
+        _ = self.filter_index
+        for chart_type in STATIC_CHART_TYPES:
+            if self.cache.contains(self.cache.make_key(chart_type, self.model_version, {})):
+                continue
+            try:
+                self.create_chart(chart_type)
+                rendered += 1
+            except Exception as e:
+                logger.warning(f"Prerendering chart {chart_type} failed: {str(e)}")
+        logger.info(f"Prerendered {rendered} static charts for model version {self.model_version}")
+    
+    def invalidate_cache(self) -> int:
+        """Drop all cached charts"""
+        return self.cache.invalidate()
+    
+    def close(self):
+        """Stop the render workers and the bundle threads of this service"""
+        self.render_pool.close()
+        with self._bundle_lock:
+            executor, self._bundle_executor = self._bundle_executor, None
+        if executor is not None and self._bundle_executor_pid == os.getpid():
+            executor.shutdown(wait=False)
+    
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """Get chart cache statistics"""
+        stats = self.cache.get_stats()
+        stats['model_version'] = self.model_version
+        stats['prerendering'] = self._prerender_thread is not None and self._prerender_thread.is_alive()
+        stats['render_pool'] = self.render_pool.get_stats()
+        return stats
+    
+    def _render_chart(self, chart_type: str, image_format: str = 'png', dpi: Optional[int] = None,
+                      figsize: Optional[Tuple[float, float]] = None, **kwargs) -> bytes:
+        """Render a chart in the render pool without consulting the image cache"""
+        try:
+            with chart_render_duration.time(chart_type=chart_type):
+                if chart_type in UNCACHED_CHART_TYPES:
+                    data = self._data_builders()[chart_type](**kwargs)
                 else:
-                    risk_values = risk_values[:len(risk_indices)]
-            
-            # Ensure all values are numeric and within reasonable range
-            risk_values = [float(val) if val is not None else 0.0 for val in risk_values]
-            risk_values = [max(0, min(100, val)) for val in risk_values]  # Clamp between 0 and 100
-            
-            # Prepare Persian text for labels
-            risk_indices_persian = [self._prepare_persian_text(idx) for idx in risk_indices]
-            
-            plt.bar(risk_indices_persian, risk_values, color='skyblue')
-            plt.xlabel(self._prepare_persian_text('شاخص‌های ریسک'))
-            plt.ylabel(self._prepare_persian_text('مقدار شاخص ریسک (0 تا 100)'))
-            plt.title(self._prepare_persian_text('مقدار هر یک از شاخص‌های ریسک نسخه پزشکی'))
-            plt.xticks(rotation=90, ha='center')
-            plt.tight_layout()
+                    data = self.get_chart_data(chart_type, **kwargs)
+                return self.render_pool.render(data, image_format=image_format, dpi=dpi, figsize=figsize)
+        except (ValidationError, ServiceOverloadedError):
+            raise
+        except ChartGenerationError as e:
+            logger.error(f"Error creating chart {chart_type}: {e.message}")
+            raise
+        except Exception as e:
+            logger.error(f"Error creating chart {chart_type}: {str(e)}")
+            raise ChartGenerationError(f"Failed to create chart: {str(e)}", chart_type=chart_type)
+    
+    def get_chart_data(self, chart_type: str, **kwargs) -> Dict[str, Any]:
+        """
+        Get the aggregated series behind a chart without rendering it
+        
+        Args:
+            chart_type: Type of chart
+            **kwargs: Additional parameters for specific chart types, plus
+                optional filters restricting the rows the chart is built from
             
-            return self._figure_to_base64()
+        Returns:
+            JSON-serializable dictionary with chart kind, titles, labels and values
             
+        Raises:
+            ValidationError: If a filter cannot be applied to the loaded data
+            ChartGenerationError: If the chart data cannot be computed
+        """
+        builder = self._data_builders().get(chart_type)
+        if builder is None:
+            raise ChartGenerationError(f"Unknown chart type: {chart_type}", chart_type=chart_type)
+        
+        if chart_type in UNCACHED_CHART_TYPES:
+            return builder(**kwargs)
+        if kwargs.get('filters'):
+            self._check_filters(kwargs['filters'])
+        
+        model_version = self.model_version
+        key = self.cache.make_key(f'{chart_type}:data', model_version, kwargs)
+        data = self.cache.get(key)
+        if data is not None:
+            return data
+        
+        try:
+            data = builder(**kwargs)
+        except ChartGenerationError:
+            raise
         except Exception as e:
-            logger.error(f"Error creating risk indicators chart: {str(e)}")
-            raise ChartGenerationError(f"Failed to create risk indicators chart: {str(e)}", chart_type="risk_indicators")
+            logger.error(f"Error computing chart data {chart_type}: {str(e)}")
+            raise ChartGenerationError(f"Failed to compute chart data: {str(e)}", chart_type=chart_type)
+        
+        data['model_version'] = model_version
+        if kwargs.get('filters'):
+            data['filters'] = kwargs['filters']
+        if self.model_version == model_version:
+            self.cache.put(key, data)
+        return data
     
-    def _create_fraud_by_province_chart(self) -> str:
-        """Create fraud by province bar chart"""
-        fraud_data = self.data_final[self.data_final['prediction'] == -1]
-        fraud_counts_by_province = fraud_data['province'].value_counts()
+    def _data_builders(self) -> Dict[str, Any]:
+        """Map chart types to their data builders"""
+        return {
+            'risk_indicators': self._risk_indicators_data,
+            'fraud_by_province': self._fraud_by_province_data,
+            'fraud_by_gender': self._fraud_by_gender_data,
+            'fraud_by_age_group': self._fraud_by_age_group_data,
+            'fraud_ratio_by_age_group': self._fraud_ratio_by_age_group_data,
+            'province_fraud_ratio': self._province_fraud_ratio_data,
+            'province_gender_fraud_percentage': self._province_gender_fraud_percentage_data,
+            'fraud_counts_by_date': self._fraud_counts_by_date_data,
+            'fraud_ratio_by_date': self._fraud_ratio_by_date_data,
+            'fraud_ratio_by_ins_cover': self._fraud_ratio_by_ins_cover_data,
+            'fraud_ratio_by_invoice_type': self._fraud_ratio_by_invoice_type_data,
+            'fraud_ratio_by_medical_record_type': self._fraud_ratio_by_medical_record_type_data,
+            'provider_risk_indicator_time_series': self._provider_risk_indicator_time_series_data,
+            'patient_risk_indicator_time_series': self._patient_risk_indicator_time_series_data,
+        }
+    
+    # Chart data builders
+    
+    def _risk_indicators_data(self, risk_values: List[float]) -> Dict[str, Any]:
+        """Risk indicator values clamped to 0-100"""
+        risk_indices = RISK_INDICATOR_LABELS
         
-        # Prepare Persian text for province names
-        province_names_persian = [self._prepare_persian_text(name) for name in fraud_counts_by_province.index]
+        # Validate risk_values
+        if not risk_values or len(risk_values) == 0:
+            logger.warning("No risk values provided for risk indicators chart")
+            risk_values = [0] * len(risk_indices)
+        elif len(risk_values) != len(risk_indices):
+            logger.warning(f"Risk values length ({len(risk_values)}) doesn't match indices length ({len(risk_indices)})")
+            # Pad or truncate to match
+            if len(risk_values) < len(risk_indices):
+                risk_values = list(risk_values) + [0] * (len(risk_indices) - len(risk_values))
+            else:
+                risk_values = risk_values[:len(risk_indices)]
         
-        plt.bar(province_names_persian, fraud_counts_by_province.values)
-        plt.xlabel(self._prepare_persian_text('استان'))
-        plt.ylabel(self._prepare_persian_text('تعداد نسخه‌های تقلبی'))
-        plt.title(self._prepare_persian_text('تعداد نسخه‌های تقلبی بر اساس استان‌ها'))
-        plt.xticks(rotation=45)
-        plt.tight_layout()
+        # Ensure all values are numeric and within reasonable range
+        risk_values = [float(val) if val is not None else 0.0 for val in risk_values]
+        risk_values = [max(0, min(100, val)) for val in risk_values]  # Clamp between 0 and 100
         
-        return self._figure_to_base64()
+        return {
+            'chart_type': 'risk_indicators',
+            'kind': 'bar',
+            'title': 'مقدار هر یک از شاخص‌های ریسک نسخه پزشکی',
+            'x_label': 'شاخص‌های ریسک',
+            'y_label': 'مقدار شاخص ریسک (0 تا 100)',
+            'labels': risk_indices,
+            'values': risk_values
+        }
     
-    def _create_fraud_by_gender_chart(self) -> str:
-        """Create fraud by gender pie chart"""
-        counts = self.data_final.groupby(['gender', 'prediction']).size().unstack(fill_value=0)
-        if 1 not in counts.columns:
-            counts[1] = 0
-        if -1 not in counts.columns:
-            counts[-1] = 0
+    def _fraud_by_province_data(self, filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Fraudulent prescription counts per province"""
+        fraud_counts = self._cube_for(filters).counts_by(['province'])[-1]
+        fraud_counts_by_province = fraud_counts[fraud_counts > 0].sort_values(ascending=False)
+        return self._series_data(
+            'fraud_by_province', 'bar', fraud_counts_by_province,
+            title='تعداد نسخه‌های تقلبی بر اساس استان‌ها',
+            x_label='استان',
+            y_label='تعداد نسخه‌های تقلبی'
+        )
+    
+    def _fraud_by_gender_data(self, filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Fraud ratio per gender"""
+        counts = self._cube_for(filters).counts_by(['gender'])
         ratios = counts.apply(
             lambda row: row[-1] / (row[1] + row[-1]) if (row[1] + row[-1]) != 0 else 0, axis=1
         )
-        # Prepare Persian text for gender labels
-        gender_labels_persian = [self._prepare_persian_text(label) for label in ratios.index]
-        
-        plt.pie(ratios, labels=gender_labels_persian, autopct='%.2f%%', startangle=90)
-        plt.title(self._prepare_persian_text('نسبت نسخه‌های تقلبی به کل نسخه ها بر اساس جنسیت'))
-        plt.tight_layout()
-        
-        return self._figure_to_base64()
-    
-    def _create_fraud_by_age_group_chart(self) -> str:
-        """Create fraud by age group pie chart"""
-        self.data_final['age_group'] = pd.cut(
-            self.data_final['age'], 
-            bins=app_config.age_bins, 
-            labels=app_config.age_labels, 
-            right=True
+        return self._series_data(
+            'fraud_by_gender', 'pie', ratios,
+            title='نسبت نسخه‌های تقلبی به کل نسخه ها بر اساس جنسیت',
+            counts=counts
         )
-        counts = self.data_final.groupby(['age_group', 'prediction']).size().unstack(fill_value=0)
-        if 1 not in counts.columns:
-            counts[1] = 0
-        if -1 not in counts.columns:
-            counts[-1] = 0
+    
+    def _fraud_by_age_group_data(self, filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Fraud ratio per age group, including empty groups"""
+        counts = self._age_group_counts(filters)
         ratios = counts.apply(
             lambda row: row[-1] / (row[1] + row[-1]) if (row[1] + row[-1]) != 0 else 0, axis=1
         )
-        # Prepare Persian text for age group labels
-        age_labels_persian = [self._prepare_persian_text(label) for label in ratios.index]
-        
-        plt.pie(ratios, labels=age_labels_persian, autopct='%.2f%%', startangle=90)
-        plt.title(self._prepare_persian_text('نسبت نسخه‌های تقلبی به نرمال بر اساس گروه سنی'))
-        plt.tight_layout()
-        
-        return self._figure_to_base64()
-    
-    def _create_fraud_ratio_by_age_group_chart(self) -> str:
-        """Create fraud ratio by age group bar chart"""
-        self.data_final['age_group'] = pd.cut(
-            self.data_final['age'], 
-            bins=app_config.age_bins, 
-            labels=app_config.age_labels, 
-            right=True
+        return self._series_data(
+            'fraud_by_age_group', 'pie', ratios,
+            title='نسبت نسخه‌های تقلبی به نرمال بر اساس گروه سنی',
+            counts=counts
         )
-        counts = self.data_final.groupby(['age_group', 'prediction']).size().unstack(fill_value=0)
+    
+    def _fraud_ratio_by_age_group_data(self, filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Fraud ratio per non-empty age group"""
+        counts = self._age_group_counts(filters)
         ratio = self._calculate_fraud_ratio(counts)
-        # Prepare Persian text for age group labels
-        age_group_labels_persian = [self._prepare_persian_text(label) for label in ratio.index]
-        
-        plt.bar(age_group_labels_persian, ratio.values)
-        plt.xlabel(self._prepare_persian_text('گروه سنی'))
-        plt.ylabel(self._prepare_persian_text('نسبت نسخه‌های تقلبی به کل نسخه‌ها'))
-        plt.title(self._prepare_persian_text('نسبت نسخه‌های تقلبی به کل در هر گروه سنی'))
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-        
-        return self._figure_to_base64()
-    
-    def _create_province_fraud_ratio_chart(self) -> str:
-        """Create province fraud ratio bar chart"""
-        counts = self.data_final.groupby(['province', 'prediction']).size().unstack(fill_value=0)
-        fraud_ratio = self._calculate_fraud_ratio(counts)
-        sorted_ratio = fraud_ratio.sort_values(ascending=True)
-        # Prepare Persian text for province names
-        province_names_persian = [self._prepare_persian_text(name) for name in sorted_ratio.index]
-        
-        plt.bar(province_names_persian, sorted_ratio.values)
-        plt.xlabel(self._prepare_persian_text('استان'))
-        plt.ylabel(self._prepare_persian_text('نسبت نسخه‌های تقلبی به کل نسخه‌ها'))
-        plt.title(self._prepare_persian_text('نسبت نسخه‌های تقلبی به کل در هر استان'))
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-        
-        return self._figure_to_base64()
+        return self._series_data(
+            'fraud_ratio_by_age_group', 'bar', ratio,
+            title='نسبت نسخه‌های تقلبی به کل در هر گروه سنی',
+            x_label='گروه سنی',
+            y_label='نسبت نسخه‌های تقلبی به کل نسخه‌ها',
+            counts=counts
+        )
     
-    def _create_province_gender_fraud_percentage_chart(self) -> str:
-        """Create province gender fraud percentage chart"""
-        total_counts = self.data_final.groupby(['province', 'gender']).size().unstack(fill_value=0)
-        fraud_counts = self.data_final[self.data_final['prediction'] == -1].groupby(['province', 'gender']).size().unstack(fill_value=0)
+    def _province_fraud_ratio_data(self, filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Fraud ratio per province in ascending order"""
+        counts = self._cube_for(filters).counts_by(['province'])
+        sorted_ratio = self._calculate_fraud_ratio(counts).sort_values(ascending=True)
+        return self._series_data(
+            'province_fraud_ratio', 'bar', sorted_ratio,
+            title='نسبت نسخه‌های تقلبی به کل در هر استان',
+            x_label='استان',
+            y_label='نسبت نسخه‌های تقلبی به کل نسخه‌ها',
+            counts=counts
+        )
+    
+    def _province_gender_fraud_percentage_data(self, filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Fraud percentage per province, one series per gender"""
+        counts = self._cube_for(filters).counts_by(['province', 'gender'])
+        total_counts = (counts[1] + counts[-1]).unstack(fill_value=0)
+        fraud_counts = counts[-1].unstack(fill_value=0)
         percentage_fraud = (fraud_counts / total_counts * 100).fillna(0)
-        # Prepare Persian text for province names
-        province_names_persian = [self._prepare_persian_text(name) for name in percentage_fraud.index]
-        
-        plt.bar(province_names_persian, percentage_fraud.values)
-        plt.title(self._prepare_persian_text('درصد نسخه‌های تقلبی در هر استان بر حسب جنسیت'))
-        plt.xlabel(self._prepare_persian_text('استان‌ها'))
-        plt.ylabel(self._prepare_persian_text('درصد نسخه‌های تقلبی (%)'))
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-        
-        return self._figure_to_base64()
-    
-    def _create_fraud_counts_by_date_chart(self) -> str:
-        """Create fraud counts by date line chart"""
-        df = self.data_final.copy()
-        df['Adm_date'] = pd.to_datetime(df['Adm_date'])
-        fraud_by_date = df[df['prediction'] == -1].groupby('Adm_date').size()
-        ax = fraud_by_date.plot()
-        ax.set_xlabel(self._prepare_persian_text('تاریخ پذیرش نسخه'))
-        ax.set_ylabel(self._prepare_persian_text('تعداد نسخه تقلبی'))
-        ax.set_title(self._prepare_persian_text('تعداد نسخه‌های تقلبی بر حسب تاریخ پذیرش'))
-        ax.xaxis.set_major_locator(mdates.MonthLocator())
-        ax.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m'))
-        plt.grid(True)
-        plt.tight_layout()
-        
-        return self._figure_to_base64()
-    
-    def _create_fraud_ratio_by_date_chart(self) -> str:
-        """Create fraud ratio by date line chart"""
-        df = self.data_final.copy()
-        df['Adm_date'] = pd.to_datetime(df['Adm_date'])
-        fraud_counts = df[df['prediction'] == -1].groupby('Adm_date').size()
-        total_counts = df.groupby('Adm_date').size()
-        fraud_ratio = (fraud_counts / total_counts).fillna(0)
-        ax = fraud_ratio.plot()
-        ax.set_xlabel(self._prepare_persian_text('تاریخ پذیرش نسخه'))
-        ax.set_ylabel(self._prepare_persian_text('نسبت نسخه تقلبی به کل نسخه‌ها'))
-        ax.set_title(self._prepare_persian_text('نسبت نسخه‌های تقلبی بر حسب تاریخ پذیرش'))
-        ax.xaxis.set_major_locator(mdates.MonthLocator())
-        ax.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m'))
-        plt.grid(True)
-        plt.tight_layout()
-        
-        return self._figure_to_base64()
+        return {
+            'chart_type': 'province_gender_fraud_percentage',
+            'kind': 'grouped_bar',
+            'title': 'درصد نسخه‌های تقلبی در هر استان بر حسب جنسیت',
+            'x_label': 'استان‌ها',
+            'y_label': 'درصد نسخه‌های تقلبی (%)',
+            'labels': [self._json_label(label) for label in percentage_fraud.index],
+            'series': {
+                self._json_label(gender): [float(value) for value in percentage_fraud[gender]]
+                for gender in percentage_fraud.columns
+            }
+        }
     
-    def _create_fraud_ratio_by_ins_cover_chart(self) -> str:
-        """Create fraud ratio by insurance cover chart"""
-        counts = self.data_final.groupby(['Ins_Cover', 'prediction']).size().unstack(fill_value=0)
-        ratio = self._calculate_fraud_ratio(counts)
-        sorted_ratio = ratio.sort_values()
-        # Prepare Persian text for insurance cover labels
-        cover_labels_persian = [self._prepare_persian_text(label) for label in sorted_ratio.index]
-        
-        plt.bar(cover_labels_persian, sorted_ratio.values)
-        plt.xlabel(self._prepare_persian_text('نوع پوشش'))
-        plt.ylabel(self._prepare_persian_text('نسبت نسخه‌های تقلبی به کل نسخه‌ها'))
-        plt.title(self._prepare_persian_text('نسبت نسخه‌های تقلبی به کل در هر پوشش'))
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-        
-        return self._figure_to_base64()
+    def _fraud_counts_by_date_data(self, filters: Optional[Dict[str, Any]] = None, bucket: str = 'auto',
+                                   points: Optional[int] = None) -> Dict[str, Any]:
+        """Fraudulent prescription counts per admission day, week or month"""
+        counts, bucket, points = self._date_counts(filters, bucket, points)
+        fraud_counts = counts[-1]
+        data = self._series_data(
+            'fraud_counts_by_date', 'line', downsample_series(fraud_counts[fraud_counts > 0], points),
+            title='تعداد نسخه‌های تقلبی بر حسب تاریخ پذیرش',
+            x_label='تاریخ پذیرش نسخه',
+            y_label='تعداد نسخه تقلبی'
+        )
+        data['bucket'] = bucket
+        return data
     
-    def _create_fraud_ratio_by_invoice_type_chart(self) -> str:
-        """Create fraud ratio by invoice type chart"""
-        col = 'Invice-type'
-        counts = self.data_final.groupby([col, 'prediction']).size().unstack(fill_value=0)
-        ratio = self._calculate_fraud_ratio(counts)
-        sorted_ratio = ratio.sort_values()
-        # Prepare Persian text for invoice type labels
-        invoice_labels_persian = [self._prepare_persian_text(label) for label in sorted_ratio.index]
-        
-        plt.bar(invoice_labels_persian, sorted_ratio.values)
-        plt.xlabel(self._prepare_persian_text('نوع فاکتور'))
-        plt.ylabel(self._prepare_persian_text('نسبت نسخه‌های تقلبی به کل نسخه‌ها'))
-        plt.title(self._prepare_persian_text('نسبت نسخه‌های تقلبی به کل در هر نوع فاکتور'))
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-        
-        return self._figure_to_base64()
+    def _fraud_ratio_by_date_data(self, filters: Optional[Dict[str, Any]] = None, bucket: str = 'auto',
+                                  points: Optional[int] = None) -> Dict[str, Any]:
+        """Fraud ratio per admission day, week or month"""
+        counts, bucket, points = self._date_counts(filters, bucket, points)
+        # Weeks and months without admissions have no ratio; plotting them as 0% would add false dips
+        counts = counts[counts.sum(axis=1) > 0]
+        fraud_ratio = counts[-1] / (counts[1] + counts[-1])
+        data = self._series_data(
+            'fraud_ratio_by_date', 'line', downsample_series(fraud_ratio, points),
+            title='نسبت نسخه‌های تقلبی بر حسب تاریخ پذیرش',
+            x_label='تاریخ پذیرش نسخه',
+            y_label='نسبت نسخه تقلبی به کل نسخه‌ها',
+            counts=counts
+        )
+        data['bucket'] = bucket
+        return data
     
-    def _create_fraud_ratio_by_medical_record_type_chart(self) -> str:
-        """Create fraud ratio by medical record type chart"""
-        col = 'Type_Medical_Record'
-        counts = self.data_final.groupby([col, 'prediction']).size().unstack(fill_value=0)
-        ratio = self._calculate_fraud_ratio(counts)
-        sorted_ratio = ratio.sort_values()
-        # Prepare Persian text for medical record type labels
-        record_labels_persian = [self._prepare_persian_text(label) for label in sorted_ratio.index]
-        
-        plt.bar(record_labels_persian, sorted_ratio.values)
-        plt.xlabel(self._prepare_persian_text('نوع پرونده پزشکی'))
-        plt.ylabel(self._prepare_persian_text('نسبت نسخه‌های تقلبی به کل نسخه‌ها'))
-        plt.title(self._prepare_persian_text('نسبت نسخه‌های تقلبی به کل در هر نوع پرونده'))
-        plt.xticks(rotation=45)
-        plt.tight_layout()
+    def _date_counts(self, filters: Optional[Dict[str, Any]], bucket: str,
+                     points: Optional[int]) -> Tuple[pd.DataFrame, str, int]:
+        """
+        Prediction counts per date bucket for the date series charts
         
-        return self._figure_to_base64()
+        Args:
+            filters: Optional chart filters
+            bucket: 'auto', 'day', 'week' or 'month'; auto picks the finest
+                bucket that fits the date range into the target point count
+            points: Target point count, defaults to the configured maximum
+            
+        Returns:
+            Counts indexed by bucket start, the bucket used and the point count
+        """
+        points = points or app_config.chart_max_points
+        counts = self._cube_for(filters).counts_by(['Adm_date'])
+        bucket = choose_date_bucket(counts.index, points, bucket)
+        return resample_counts(counts, bucket), bucket, points
     
-    def _create_provider_risk_indicator_time_series_chart(self, provider_name: str, indicator: str) -> str:
-        """Create provider risk indicator time series chart"""
-        if indicator not in self.data_final.columns:
-            raise ChartGenerationError(f"Indicator {indicator} not found", chart_type="provider_risk_indicator_time_series")
-        
-        df = self.data_final.copy()
-        df['risk_value'] = norm.cdf(zscore(df[indicator].astype(float))) * 100
-        df['Adm_date'] = pd.to_datetime(df['Adm_date'])
-        df = df[df['provider_name'] == provider_name].sort_values('Adm_date')
-        
-        sns.lineplot(data=df, x='Adm_date', y='risk_value', marker='o')
-        plt.title(self._prepare_persian_text(f'شاخص ریسک {indicator} برای پزشک {provider_name}'))
-        plt.xlabel(self._prepare_persian_text('تاریخ نسخه'))
-        plt.ylabel(self._prepare_persian_text('شاخص ریسک (0-100)'))
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-        
-        return self._figure_to_base64()
+    def _fraud_ratio_by_ins_cover_data(self, filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Fraud ratio per insurance cover"""
+        counts = self._cube_for(filters).counts_by(['Ins_Cover'])
+        return self._series_data(
+            'fraud_ratio_by_ins_cover', 'bar', self._calculate_fraud_ratio(counts).sort_values(),
+            title='نسبت نسخه‌های تقلبی به کل در هر پوشش',
+            x_label='نوع پوشش',
+            y_label='نسبت نسخه‌های تقلبی به کل نسخه‌ها',
+            counts=counts
+        )
     
-    def _create_patient_risk_indicator_time_series_chart(self, patient_id: int, indicator: str) -> str:
-        """Create patient risk indicator time series chart"""
+    def _fraud_ratio_by_invoice_type_data(self, filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Fraud ratio per invoice type"""
+        counts = self._cube_for(filters).counts_by(['Invice-type'])
+        return self._series_data(
+            'fraud_ratio_by_invoice_type', 'bar', self._calculate_fraud_ratio(counts).sort_values(),
+            title='نسبت نسخه‌های تقلبی به کل در هر نوع فاکتور',
+            x_label='نوع فاکتور',
+            y_label='نسبت نسخه‌های تقلبی به کل نسخه‌ها',
+            counts=counts
+        )
+    
+    def _fraud_ratio_by_medical_record_type_data(self, filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Fraud ratio per medical record type"""
+        counts = self._cube_for(filters).counts_by(['Type_Medical_Record'])
+        return self._series_data(
+            'fraud_ratio_by_medical_record_type', 'bar', self._calculate_fraud_ratio(counts).sort_values(),
+            title='نسبت نسخه‌های تقلبی به کل در هر نوع پرونده',
+            x_label='نوع پرونده پزشکی',
+            y_label='نسبت نسخه‌های تقلبی به کل نسخه‌ها',
+            counts=counts
+        )
+    
+    def _provider_risk_indicator_time_series_data(self, provider_name: str, indicator: str,
+                                                  filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Risk value of one indicator over time for a provider"""
+        series = self._risk_indicator_series('provider_risk_indicator_time_series', indicator,
+                                             'provider', provider_name, filters)
+        return self._series_data(
+            'provider_risk_indicator_time_series', 'line', series,
+            title=f'شاخص ریسک {indicator} برای پزشک {provider_name}',
+            x_label='تاریخ نسخه',
+            y_label='شاخص ریسک (0-100)'
+        )
+    
+    def _patient_risk_indicator_time_series_data(self, patient_id: int, indicator: str,
+                                                 filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Risk value of one indicator over time for a patient"""
+        series = self._risk_indicator_series('patient_risk_indicator_time_series', indicator,
+                                             'patient', int(patient_id), filters)
+        return self._series_data(
+            'patient_risk_indicator_time_series', 'line', series,
+            title=f'شاخص ریسک {indicator} برای بیمار {patient_id}',
+            x_label='تاریخ نسخه',
+            y_label='شاخص ریسک (0-100)'
+        )
+    
+    def _risk_indicator_series(self, chart_type: str, indicator: str, kind: str, key: Any,
+                               filters: Optional[Dict[str, Any]] = None) -> pd.Series:
+        """Risk values (0-100) of an indicator for one provider or patient, indexed by admission date"""
         if indicator not in self.data_final.columns:
-            raise ChartGenerationError(f"Indicator {indicator} not found", chart_type="patient_risk_indicator_time_series")
-        
-        df = self.data_final.copy()
-        df['risk_value'] = norm.cdf(zscore(df[indicator].astype(float))) * 100
-        df['Adm_date'] = pd.to_datetime(df['Adm_date'])
-        df = df[df['ID'] == int(patient_id)].sort_values('Adm_date')
-        
-        sns.lineplot(data=df, x='Adm_date', y='risk_value', marker='o')
-        plt.title(self._prepare_persian_text(f'شاخص ریسک {indicator} برای بیمار {patient_id}'))
-        plt.xlabel(self._prepare_persian_text('تاریخ نسخه'))
-        plt.ylabel(self._prepare_persian_text('شاخص ریسک (0-100)'))
-        plt.xticks(rotation=45)
-        plt.tight_layout()
+            raise ChartGenerationError(f"Indicator {indicator} not found", chart_type=chart_type)
         
-        return self._figure_to_base64()
+        if not filters:
+            return self.entity_index.series(kind, key, indicator)
+        return self.entity_index.series(kind, key, indicator,
+                                        row_filter=lambda rows: self.filter_index.narrow(rows, filters))
+    
+    def _series_data(self, chart_type: str, kind: str, series: pd.Series, title: str,
+                     x_label: Optional[str] = None, y_label: Optional[str] = None,
+                     counts: Optional[pd.DataFrame] = None) -> Dict[str, Any]:
+        """Build the JSON chart data for a labelled series, with prediction counts when available"""
+        data = {
+            'chart_type': chart_type,
+            'kind': kind,
+            'title': title,
+            'x_label': x_label,
+            'y_label': y_label,
+            'labels': [self._json_label(label) for label in series.index],
+            'values': [float(value) for value in series.values]
+        }
+        if counts is not None:
+            counts = counts.reindex(series.index, fill_value=0)
+            data['fraud_counts'] = [int(value) for value in counts[-1]]
+            data['total_counts'] = [int(value) for value in counts[1] + counts[-1]]
+        return data
+    
+    @staticmethod
+    def _json_label(label: Any) -> Any:
+        """Convert an index label into a JSON-friendly value"""
+        if isinstance(label, (pd.Timestamp, datetime)):
+            return label.strftime('%Y-%m-%d')
+        if isinstance(label, np.generic):
+            return label.item()
+        return label if isinstance(label, (str, int, float)) else str(label)
+    
+    def _age_group_counts(self, filters: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
+        """Prediction counts per age group in configured age order, including empty groups"""
+        return self._cube_for(filters).counts_by(['age_group']).reindex(app_config.age_labels, fill_value=0)
     
     def _calculate_fraud_ratio(self, counts: pd.DataFrame) -> pd.Series:
         """Calculate fraud ratio from prediction counts"""
@@ -436,10 +721,3 @@ class ChartService:
         if -1 not in counts.columns:
             counts[-1] = 0
         return (counts[-1] / (counts[1] + counts[-1])).dropna()
-    
-    def _figure_to_base64(self) -> str:
-        """Convert matplotlib figure to base64 string"""
-        img = io.BytesIO()
-        plt.savefig(img, format='png', bbox_inches='tight', dpi=app_config.chart_dpi)
-        img.seek(0)
-        return base64.b64encode(img.getvalue()).decode()
@@ -0,0 +1,122 @@
+"""
+Per-entity time-series index for provider and patient risk charts
+نمایه سری زمانی هر موجودیت برای نمودارهای ریسک پزشک و بیمار
+"""
+
+import threading
+import numpy as np
+import pandas as pd
+from typing import Any, Callable, Dict, Optional, Sequence
+from scipy.stats import zscore, norm
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Entity kinds and the data_final column identifying them
+ENTITY_COLUMNS = {
+    'provider': 'provider_name',
+    'patient': 'ID',
+}
+
+class EntityIndex:
+    """Row positions of each entity's prescriptions, ordered by admission date"""
+
+    def __init__(self, keys: pd.Series, dates: np.ndarray, normalize_key=None):
+        codes, uniques = pd.factorize(keys, use_na_sentinel=True)
+        # Order rows by (entity, date); lexsort is stable and sorts by the last key first
+        order = np.lexsort((dates, codes))
+        sorted_codes = codes[order]
+        valid = sorted_codes >= 0
+        self.positions = order[valid]
+        boundaries = np.searchsorted(sorted_codes[valid], np.arange(len(uniques) + 1))
+        self.starts = boundaries[:-1]
+        self.ends = boundaries[1:]
+        # Entity code of every row (-1 for missing keys), for narrowing other row sets
+        self.row_codes = codes
+        normalize = normalize_key or (lambda key: key)
+        self.codes = {normalize(key): code for code, key in enumerate(uniques)}
+
+    def rows(self, key: Any) -> np.ndarray:
+        """Positions of the entity's rows sorted by date, empty if unknown"""
+        code = self.codes.get(key)
+        if code is None:
+            return self.positions[:0]
+        return self.positions[self.starts[code]:self.ends[code]]
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+class EntityTimeSeriesIndex:
+    """
+    Precomputed risk percentiles and per-entity row offsets over data_final.
+
+    Built once per model version. A provider or patient chart then reads only
+    the entity's own rows instead of rescoring and filtering every row.
+    """
+
+    def __init__(self, data_final: pd.DataFrame, indicators: Optional[Sequence[str]] = None):
+        self.data_final = data_final
+        self.dates = pd.to_datetime(data_final['Adm_date']).to_numpy()
+        # NaT sorts as the smallest datetime; push it to the end like pandas does
+        sort_dates = self.dates.astype('datetime64[ns]').view('int64').copy()
+        sort_dates[np.isnat(self.dates)] = np.iinfo('int64').max
+
+        self.entities: Dict[str, EntityIndex] = {}
+        for kind, column in ENTITY_COLUMNS.items():
+            if column in data_final.columns:
+                normalize = self._normalize_patient_id if kind == 'patient' else None
+                self.entities[kind] = EntityIndex(data_final[column], sort_dates, normalize)
+
+        self._risk_values: Dict[str, np.ndarray] = {}
+        self._lock = threading.Lock()
+        for indicator in indicators or []:
+            if indicator in data_final.columns:
+                self.risk_values(indicator)
+
+        entity_counts = ', '.join(f"{len(index)} {kind}s" for kind, index in self.entities.items())
+        logger.info(f"Built entity time-series index with {entity_counts} and {len(self._risk_values)} indicators")
+
+    @staticmethod
+    def _normalize_patient_id(value: Any) -> Any:
+        """Store patient IDs as ints so lookups match regardless of column dtype"""
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return value
+
+    def risk_values(self, indicator: str) -> np.ndarray:
+        """
+        Risk percentile (0-100) of every row for an indicator, computed once
+
+        Args:
+            indicator: Feature column of data_final
+
+        Returns:
+            Array aligned with data_final rows
+        """
+        values = self._risk_values.get(indicator)
+        if values is None:
+            values = np.asarray(norm.cdf(zscore(self.data_final[indicator].astype(float))) * 100)
+            with self._lock:
+                self._risk_values[indicator] = values
+        return values
+
+    def series(self, kind: str, key: Any, indicator: str,
+               row_filter: Optional[Callable[[np.ndarray], np.ndarray]] = None) -> pd.Series:
+        """
+        Risk values of one indicator for one entity, indexed by admission date
+
+        Args:
+            kind: Entity kind ('provider' or 'patient')
+            key: Provider name or patient ID
+            indicator: Feature column of data_final
+            row_filter: Narrows the entity's date-ordered row positions, keeping their order
+
+        Returns:
+            Series sorted by admission date
+        """
+        index = self.entities.get(kind)
+        rows = index.rows(key) if index is not None else np.empty(0, dtype=np.intp)
+        if row_filter is not None:
+            rows = row_filter(rows)
+        return pd.Series(self.risk_values(indicator)[rows], index=pd.DatetimeIndex(self.dates[rows]))
@@ -5,9 +5,10 @@ Feature extraction service for fraud detection
 
 import pandas as pd
 import numpy as np
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Union
+from core.exceptions import FeatureExtractionError
 from core.utils import safe_division, calculate_percentage_change, performance_monitor
-from config.config import app_config
+from config.config import app_config, memory_config
 import logging
 import gc
 
@@ -259,6 +260,133 @@ class FeatureExtractor:
         del provider_service_count, provider_count, merged
         gc.collect()
     
+    @performance_monitor
+    def extract_features_from_aggregates(self, aggregates: Dict[str, pd.DataFrame]) -> pd.DataFrame:
+        """
+        Extract all features by joining precomputed group aggregates
+
+        Args:
+            aggregates: Aggregate tables keyed by name, as returned by
+                DatabaseManager.load_feature_aggregates()
+
+        Returns:
+            Data with feature columns attached
+
+        Raises:
+            FeatureExtractionError: If some rows have no matching aggregate group
+        """
+        try:
+            logger.info("Starting feature extraction from pushed-down aggregates...")
+
+            agg = {name: self._normalize_aggregate(frame) for name, frame in aggregates.items()}
+
+            # Features 1 & 4: patient monthly counts and cost change
+            patient_month = agg['patient_month'].sort_values(['ID', 'year_month'])
+            patient_month['unq_ratio_provider'] = patient_month.apply(
+                lambda row: safe_division(row['total_providers_monthly'], row['unique_providers']),
+                axis=1
+            )
+            patient_month['average_previous_mean_patient'] = self._average_previous(patient_month, 'ID', 'mean_amount_patient')
+            patient_month['percent_change_patient'] = patient_month.apply(
+                lambda row: calculate_percentage_change(
+                    row['mean_amount_patient'],
+                    row['average_previous_mean_patient'],
+                    app_config.max_percentage_change
+                ),
+                axis=1
+            )
+
+            # Features 2 & 3: provider monthly counts and cost change
+            provider_month = agg['provider_month'].sort_values(['provider_name', 'year_month'])
+            provider_month['unq_ratio_patient'] = provider_month.apply(
+                lambda row: safe_division(row['total_patients_monthly'], row['unique_patients']),
+                axis=1
+            )
+            provider_month['average_previous_mean_provider'] = self._average_previous(provider_month, 'provider_name', 'mean_amount_provider')
+            provider_month['percent_change_provider'] = provider_month.apply(
+                lambda row: calculate_percentage_change(
+                    row['mean_amount_provider'],
+                    row['average_previous_mean_provider'],
+                    app_config.max_percentage_change
+                ),
+                axis=1
+            )
+
+            # Previous month averages per service and specialty
+            service_month = agg['service_month'].sort_values(['Service', 'year_month'])
+            service_month['prev_avg_amount_serv'] = service_month.groupby('Service')['avg_amount'].shift(1)
+            specialty_month = agg['specialty_month'].sort_values(['provider_specialty', 'year_month'])
+            specialty_month['prev_avg_amount_spe'] = specialty_month.groupby('provider_specialty')['overall_avg_amount_spe'].shift(1)
+
+            # Feature 9: service ratio per provider
+            ratio = agg['provider_service'].merge(agg['provider_total'], on='provider_name')
+            ratio['Ratio'] = 1 - (ratio['Count'] / ratio['TotalCount'])
+            ratio.loc[ratio['TotalCount'] == 1, 'Ratio'] = 0
+
+            # Merge aggregates back to the rows
+            self.data = self.data.merge(patient_month[['year_month', 'ID', 'unq_ratio_provider', 'percent_change_patient']], on=['year_month', 'ID'], how='left')
+            self.data = self.data.merge(provider_month[['year_month', 'provider_name', 'unq_ratio_patient', 'percent_change_provider']], on=['year_month', 'provider_name'], how='left')
+            self.data = self.data.merge(service_month[['year_month', 'Service', 'avg_amount', 'prev_avg_amount_serv']], on=['year_month', 'Service'], how='left')
+            self.data = self.data.merge(agg['provider_service_month'], on=['year_month', 'provider_name', 'Service'], how='left')
+            self.data = self.data.merge(agg['patient_service_month'], on=['year_month', 'ID', 'Service'], how='left')
+            self.data = self.data.merge(specialty_month[['year_month', 'provider_specialty', 'prev_avg_amount_spe']], on=['year_month', 'provider_specialty'], how='left')
+            self.data = self.data.merge(agg['provider_specialty_month'], on=['year_month', 'provider_name', 'provider_specialty'], how='left')
+            self.data = self.data.merge(ratio[['provider_name', 'Service', 'Ratio']], on=['provider_name', 'Service'], how='left')
+
+            # Every row falls in its own patient and provider month groups; a row without
+            # them means the aggregate keys were derived differently from the row keys
+            unmatched = int((self.data['unq_ratio_provider'].isna() | self.data['unq_ratio_patient'].isna()).sum())
+            if unmatched:
+                raise FeatureExtractionError(
+                    f"{unmatched} of {len(self.data)} rows have no matching aggregate group",
+                    feature='unq_ratio_provider'
+                )
+
+            # Features 5-8: row-level cost differences
+            is_drug = self.data['Service'] == 'دارو و ملزومات دارویی'
+            row_features = {
+                'percent_difference': ('cost_amount', 'avg_amount', True),
+                'percent_diff_ser': ('avg_amount_ser', 'prev_avg_amount_serv', True),
+                'percent_diff_spe': ('avg_amount_spe', 'prev_avg_amount_spe', False),
+                'percent_diff_spe2': ('cost_amount', 'prev_avg_amount_spe', False),
+                'percent_diff_ser_patient': ('avg_amount_ser_patient', 'prev_avg_amount_serv', True),
+                'percent_diff_serv': ('cost_amount', 'prev_avg_amount_serv', True)
+            }
+            for feature, (value_col, reference_col, exclude_drug) in row_features.items():
+                diff = ((self.data[value_col] - self.data[reference_col]) / self.data[reference_col]) * 100
+                if exclude_drug:
+                    diff[is_drug] = 0
+                self.data[feature] = diff.apply(lambda x: 0 if (pd.isna(x) or x < 0) else x)
+
+            del agg, patient_month, provider_month, service_month, specialty_month, ratio
+            gc.collect()
+
+            logger.info("Feature extraction from aggregates completed successfully")
+            return self.data
+
+        except Exception as e:
+            logger.error(f"Error in feature extraction from aggregates: {str(e)}")
+            raise
+
+    @staticmethod
+    def _normalize_aggregate(frame: pd.DataFrame) -> pd.DataFrame:
+        """Align aggregate key and value dtypes with the processed row data"""
+        frame = frame.copy()
+        for col in frame.columns:
+            if col in ('year_month', 'ID', 'provider_name', 'Service', 'provider_specialty'):
+                frame[col] = frame[col].astype(str)
+            else:
+                # DECIMAL averages arrive as Decimal objects
+                frame[col] = pd.to_numeric(frame[col], errors='coerce').astype(float)
+        return frame
+
+    @staticmethod
+    def _average_previous(monthly: pd.DataFrame, key: str, value_col: str) -> pd.Series:
+        """Average of the previous two monthly values per key (frame sorted by key, year_month)"""
+        previous_1 = monthly.groupby(key)[value_col].shift(1)
+        previous_2 = monthly.groupby(key)[value_col].shift(2)
+        return pd.concat([previous_1, previous_2], axis=1).mean(axis=1)
+
     def get_feature_columns(self) -> List[str]:
         """Get list of feature column names"""
         return self.feature_columns
@@ -269,5 +397,20 @@ class FeatureExtractor:
         features_df.dropna(inplace=True)
         return features_df
 
+def create_feature_extractor(data: Union[pd.DataFrame, str]):
+    """
+    Create the feature extractor selected by memory_config.feature_backend
+    
+    Args:
+        data: Prescription data, or a snapshot path (always read by the SQL backend)
+        
+    Returns:
+        FeatureExtractor or SQLFeatureExtractor instance
+    """
+    if memory_config.feature_backend == 'duckdb' or not isinstance(data, pd.DataFrame):
+        from .sql_feature_extractor import SQLFeatureExtractor
+        return SQLFeatureExtractor(data)
+    return FeatureExtractor(data)
+
 # Alias for backward compatibility
 MemoryOptimizedFeatureExtractor = FeatureExtractor
@@ -0,0 +1,210 @@
+"""
+In-process metrics registry with Prometheus text exposition
+ثبت معیارهای درون‌فرایندی با خروجی متنی Prometheus
+"""
+
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Latency buckets in seconds, from sub-millisecond feature steps to slow chart renders
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelValues = Tuple[str, ...]
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    """Render a label set as {a="x",b="y"}"""
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+def _escape(value: str) -> str:
+    """Escape a label value for the text format"""
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_value(value: float) -> str:
+    """Render a sample value the way Prometheus parses it"""
+    if math.isnan(value):
+        return 'NaN'
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+class _Metric:
+    """Common state of a labelled metric family"""
+
+    type_name = 'untyped'
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, '')) for name in self.label_names)
+
+    def render(self) -> List[str]:
+        """Exposition lines of this family, HELP and TYPE first"""
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+class Counter(_Metric):
+    """Monotonic count per label set"""
+
+    type_name = 'counter'
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        super().__init__(name, documentation, label_names)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}" for key, value in values]
+
+class Histogram(_Metric):
+    """
+    Bucketed observations per label set.
+
+    Each observation costs a binary search and one locked increment; bucket
+    counts are only made cumulative when scraped.
+    """
+
+    type_name = 'histogram'
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count per bucket (last is +Inf), sum, count]
+        self._series: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """Observe the wall time of a block, including when it raises"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            series = [(key, list(counts), total, count) for key, (counts, total, count) in self._series.items()]
+        lines = []
+        for key, counts, total, count in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                le = ('le', _format_value(bound))
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {count}")
+        return lines
+
+class CallbackMetric(_Metric):
+    """Gauge or counter whose values are read from a callback at scrape time"""
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str],
+                 callback: Callable[[], Dict[LabelValues, float]], type_name: str = 'gauge'):
+        super().__init__(name, documentation, label_names)
+        self.callback = callback
+        self.type_name = type_name
+
+    def _samples(self) -> List[str]:
+        try:
+            values = self.callback()
+        except Exception:
+            # A failing source must not break the whole scrape
+            return []
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}" for key, value in values.items()]
+
+class MetricsRegistry:
+    """Named metric families of this worker process, rendered in registration order"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, label_names))
+
+    def histogram(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, label_names, buckets))
+
+    def callback(self, name: str, documentation: str, label_names: Sequence[str],
+                 callback: Callable[[], Dict[LabelValues, float]], type_name: str = 'gauge') -> CallbackMetric:
+        """Register (or replace) a metric read from callback when scraped"""
+        metric = CallbackMetric(name, documentation, label_names, callback, type_name)
+        with self._lock:
+            self._metrics[name] = metric
+        return metric
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+# Process-wide registry and the metrics recorded across the API
+registry = MetricsRegistry()
+
+http_requests = registry.counter(
+    'http_requests_total', 'HTTP requests by route and status', ('method', 'route', 'status')
+)
+http_request_errors = registry.counter(
+    'http_request_errors_total', 'HTTP requests answered with a 5xx status', ('method', 'route')
+)
+http_request_duration = registry.histogram(
+    'http_request_duration_seconds', 'Time to produce the HTTP response', ('method', 'route')
+)
+prediction_stage_duration = registry.histogram(
+    'prediction_stage_duration_seconds', 'Time spent in each stage of a single prediction', ('stage',)
+)
+chart_render_duration = registry.histogram(
+    'chart_render_duration_seconds', 'Time to build and render a chart on a cache miss', ('chart_type',)
+)
+db_query_duration = registry.histogram(
+    'db_query_duration_seconds', 'Database query time by operation', ('operation',)
+)
+db_connection_wait = registry.histogram(
+    'db_connection_wait_seconds', 'Time waiting for a pooled database connection'
+)
@@ -3,15 +3,19 @@ Prediction service for fraud detection API
 سرویس پیش‌بینی برای API تشخیص تقلب
 """
 
+import threading
 import pandas as pd
 import numpy as np
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Union
 from sklearn.preprocessing import StandardScaler
 from sklearn.ensemble import IsolationForest
 from scipy.stats import norm
 from config.config import model_config
 from core.exceptions import ModelNotReadyError
-from .feature_extractor import FeatureExtractor
+from .feature_extractor import create_feature_extractor
+from .aggregate_cube import AggregateCube
+from .entity_index import EntityTimeSeriesIndex
+from .metrics import prediction_stage_duration
 from functions.age_calculate_function import calculate_age
 from functions.shamsi_to_miladi_function import shamsi_to_miladi
 from functions.add_one_month_function import add_one_month
@@ -23,6 +27,13 @@ from datetime import datetime, timedelta
 
 logger = logging.getLogger(__name__)
 
+# Row columns kept next to the features for charts and statistics
+METADATA_COLUMNS = [
+    'Adm_date', 'gender', 'age', 'Service', 'province',
+    'Ins_Cover', 'Invice-type', 'Type_Medical_Record',
+    'provider_name', 'provider_specialty', 'ID'
+]
+
 class PredictionService:
     """Service for handling fraud predictions"""
     
@@ -31,6 +42,12 @@ class PredictionService:
         self.clf = clf
         self.scaler = scaler
         self.data_final = None
+        self.model_version: Optional[str] = None
+        self._aggregate_cube: Optional[AggregateCube] = None
+        self._aggregate_cube_source = None
+        self._entity_index: Optional[EntityTimeSeriesIndex] = None
+        self._entity_index_source = None
+        self._index_lock = threading.Lock()
         self._feature_columns = [
             'unq_ratio_provider', 'unq_ratio_patient', 'percent_change_provider',
             'percent_change_patient', 'percent_difference', 'percent_diff_ser',
@@ -87,6 +104,9 @@ class PredictionService:
                 else:
                     logger.info("No sample historical data found, will use simplified feature calculation")
                 
+                # Version cached artifacts (e.g. rendered charts) by training time
+                self.model_version = metadata.get('last_trained')
+                
                 # Check if model is still valid (not too old)
                 if self._is_model_fresh(metadata):
                     logger.info("Successfully loaded existing model and data")
@@ -156,7 +176,7 @@ class PredictionService:
                 
                 # Save metadata
                 metadata = {
-                    'last_trained': datetime.now().isoformat(),
+                    'last_trained': self.model_version or datetime.now().isoformat(),
                     'model_type': 'IsolationForest',
                     'n_estimators': model_config.n_estimators,
                     'max_samples': model_config.max_samples,
@@ -184,6 +204,11 @@ class PredictionService:
             self.scaler = None
             self.data_final = None
             self.data = None
+            self.model_version = None
+            self._aggregate_cube = None
+            self._aggregate_cube_source = None
+            self._entity_index = None
+            self._entity_index_source = None
             
             # Remove existing model files
             for file_path in [self.model_path, self.scaler_path, self.metadata_path, self.data_path, self.sample_data_path]:
@@ -204,13 +229,18 @@ class PredictionService:
             self.data_final is not None
         ])
     
-    def train_model(self, data: pd.DataFrame) -> None:
+    def train_model(self, data: Union[pd.DataFrame, str]) -> None:
         """
         Train the Isolation Forest model
         
         Args:
-            data: Training data with features
+            data: Training data, or the path of a snapshot written by
+                sql_feature_extractor.write_snapshot()
         """
+        if not isinstance(data, pd.DataFrame):
+            self._train_model_from_snapshot(data)
+            return
+        
         try:
             logger.info("Starting model training...")
             
@@ -218,7 +248,7 @@ class PredictionService:
             self.data = data
             
             # Extract features efficiently
-            feature_extractor = FeatureExtractor(data)
+            feature_extractor = create_feature_extractor(data)
             self.data = feature_extractor.extract_all_features()
             
             # Prepare features for training - only keep necessary columns
@@ -245,6 +275,7 @@ class PredictionService:
             
             # Attach metadata columns efficiently
             self._attach_metadata_columns_efficiently()
+            self.model_version = datetime.now().isoformat()
             
             # Clean up intermediate data
             gc.collect()
@@ -259,6 +290,30 @@ class PredictionService:
             logger.error(f"Error training model: {str(e)}")
             raise
     
+    def _train_model_from_snapshot(self, snapshot_path: str) -> None:
+        """Train on a snapshot whose features the SQL backend computes out-of-core"""
+        try:
+            logger.info(f"Starting model training from snapshot {snapshot_path}...")
+            
+            # Only the feature and metadata columns of each batch are kept in memory
+            feature_extractor = create_feature_extractor(snapshot_path)
+            features, metadata = [], []
+            for batch in feature_extractor.iter_feature_batches(columns=METADATA_COLUMNS):
+                features.append(batch[self._feature_columns])
+                metadata.append(batch.drop(columns=self._feature_columns))
+            
+            if not features:
+                raise ValueError(f"Snapshot {snapshot_path} has no rows")
+            
+            self.train_model_streaming(
+                pd.concat(features, ignore_index=True),
+                pd.concat(metadata, ignore_index=True)
+            )
+            
+        except Exception as e:
+            logger.error(f"Error training model from snapshot: {str(e)}")
+            raise
+    
     def train_model_streaming(self, features_df: pd.DataFrame, metadata_df: pd.DataFrame) -> None:
         """
         Train the Isolation Forest model with streaming data
@@ -294,6 +349,7 @@ class PredictionService:
             
             # Attach metadata columns
             self._attach_metadata_columns_streaming(metadata_df)
+            self.model_version = datetime.now().isoformat()
             
             # Clean up intermediate data
             gc.collect()
@@ -332,10 +388,11 @@ class PredictionService:
             logger.info(f"Created new_sample DataFrame with shape: {new_sample.shape}")
             
             # Convert dates efficiently
-            new_sample['Adm_date'] = new_sample['Adm_date'].apply(shamsi_to_miladi)
-            new_sample['Adm_date'] = pd.to_datetime(new_sample['Adm_date'])
-            new_sample['age'] = new_sample['jalali_date'].apply(calculate_age)
-            new_sample['year_month'] = new_sample['Adm_date'].dt.to_period('M')
+            with prediction_stage_duration.time(stage='date_conversion'):
+                new_sample['Adm_date'] = new_sample['Adm_date'].apply(shamsi_to_miladi)
+                new_sample['Adm_date'] = pd.to_datetime(new_sample['Adm_date'])
+                new_sample['age'] = new_sample['jalali_date'].apply(calculate_age)
+                new_sample['year_month'] = new_sample['Adm_date'].dt.to_period('M')
             logger.info(f"Processed dates and created year_month column")
             
             # Select required fields for feature calculation - use minimal data
@@ -346,7 +403,8 @@ class PredictionService:
             logger.info(f"self.data is None: {self.data is None}")
             if self.data is not None:
                 # Create a minimal copy of data for feature calculation
-                data1 = self.data[features1].copy()
+                with prediction_stage_duration.time(stage='history_copy'):
+                    data1 = self.data[features1].copy()
                 logger.info(f"Using self.data for feature calculation, shape: {data1.shape}")
             else:
                 # If self.data is None (model loaded from disk), we need to handle this differently
@@ -363,18 +421,21 @@ class PredictionService:
             
             # Calculate features using helper function
             logger.info("Starting feature calculation...")
-            self._calculate_all_features_efficiently(data1, new_sample)
+            with prediction_stage_duration.time(stage='features'):
+                self._calculate_all_features_efficiently(data1, new_sample)
             logger.info("Feature calculation completed")
             
             # Select features for prediction
             new_sample_final = new_sample[self._feature_columns].copy()
             
             # Normalize features efficiently
-            normalized_array = self.scaler.transform(new_sample_final)
+            with prediction_stage_duration.time(stage='scaling'):
+                normalized_array = self.scaler.transform(new_sample_final)
             
             # Predict
-            y_new_pred = self.clf.predict(normalized_array)
-            scores_new = self.clf.decision_function(normalized_array)
+            with prediction_stage_duration.time(stage='scoring'):
+                y_new_pred = self.clf.predict(normalized_array)
+                scores_new = self.clf.decision_function(normalized_array)
             
             # Calculate risk scores efficiently
             probabilities = norm.cdf(normalized_array)
@@ -416,7 +477,8 @@ class PredictionService:
             
             # Clean up temporary data
             del data1, new_sample
-            gc.collect()
+            with prediction_stage_duration.time(stage='gc_collect'):
+                gc.collect()
             
             return response_data
             
@@ -464,7 +526,8 @@ class PredictionService:
             
             for func, feature_name in feature_functions:
                 try:
-                    result = func(data1, new_sample)
+                    with prediction_stage_duration.time(stage=f'feature:{feature_name}'):
+                        result = func(data1, new_sample)
                     if result is not None and hasattr(result, '__getitem__'):
                         new_sample[feature_name] = result[feature_name]
                     else:
@@ -551,14 +614,8 @@ class PredictionService:
     
     def _attach_metadata_columns_efficiently(self) -> None:
         """Attach metadata columns to data_final for chart generation"""
-        meta_columns = [
-            'Adm_date', 'gender', 'age', 'Service', 'province',
-            'Ins_Cover', 'Invice-type', 'Type_Medical_Record',
-            'provider_name', 'ID'
-        ]
-        
         # Only attach columns that exist in the original data
-        available_meta_columns = [col for col in meta_columns if col in self.data.columns]
+        available_meta_columns = [col for col in METADATA_COLUMNS if col in self.data.columns]
         
         for col in available_meta_columns:
             self.data_final[col] = self.data.loc[self.data_final.index, col]
@@ -573,13 +630,7 @@ class PredictionService:
                 self.data_final = self.data_final.reset_index(drop=True)
                 
                 # Attach metadata columns
-                meta_columns = [
-                    'Adm_date', 'gender', 'age', 'Service', 'province',
-                    'Ins_Cover', 'Invice-type', 'Type_Medical_Record',
-                    'provider_name', 'ID'
-                ]
-                
-                available_meta_columns = [col for col in meta_columns if col in metadata_df.columns]
+                available_meta_columns = [col for col in METADATA_COLUMNS if col in metadata_df.columns]
                 
                 for col in available_meta_columns:
                     self.data_final[col] = metadata_df[col]
@@ -598,6 +649,7 @@ class PredictionService:
         
         return {
             'status': 'ready',
+            'model_version': self.model_version,
             'model_type': 'IsolationForest',
             'n_estimators': model_config.n_estimators,
             'max_samples': model_config.max_samples,
@@ -607,14 +659,36 @@ class PredictionService:
             'feature_count': len(self._feature_columns)
         }
     
+    def get_aggregate_cube(self) -> AggregateCube:
+        """Get the prediction count cube for the current data_final, building it on first use"""
+        data_final = self.data_final
+        if self._aggregate_cube_source is not data_final or self._aggregate_cube is None:
+            with self._index_lock:
+                if self._aggregate_cube_source is not data_final or self._aggregate_cube is None:
+                    self._aggregate_cube = AggregateCube(data_final)
+                    self._aggregate_cube_source = data_final
+        return self._aggregate_cube
+    
+    def get_entity_index(self) -> EntityTimeSeriesIndex:
+        """Get the provider/patient time-series index for the current data_final, building it on first use"""
+        data_final = self.data_final
+        if self._entity_index_source is not data_final or self._entity_index is None:
+            with self._index_lock:
+                if self._entity_index_source is not data_final or self._entity_index is None:
+                    self._entity_index = EntityTimeSeriesIndex(data_final, indicators=self._feature_columns)
+                    self._entity_index_source = data_final
+        return self._entity_index
+    
     def get_statistics(self) -> Dict[str, Any]:
         """Get prediction statistics"""
         if not self.is_ready():
             return {'error': 'Model not ready'}
         
-        total_prescriptions = len(self.data_final)
-        fraud_prescriptions = len(self.data_final[self.data_final['prediction'] == -1])
-        normal_prescriptions = len(self.data_final[self.data_final['prediction'] == 1])
+        cube = self.get_aggregate_cube()
+        totals = cube.prediction_totals()
+        total_prescriptions = cube.total_rows
+        fraud_prescriptions = totals.get(-1, 0)
+        normal_prescriptions = totals.get(1, 0)
         fraud_percentage = (fraud_prescriptions / total_prescriptions) * 100
         
         return {
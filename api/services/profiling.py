@@ -0,0 +1,395 @@
+"""
+Request profiling and stack sampling helpers
+ابزارهای پروفایل درخواست و نمونه‌برداری از پشته فراخوانی
+"""
+
+import cProfile
+import gc
+import itertools
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+# Frames kept per sampled stack; deeper recursion loses its outermost frames
+MAX_STACK_DEPTH = 128
+
+PROFILE_MODES = ('deterministic', 'sampling')
+
+# Innermost Python frames of threads parked waiting for work (request accept loops,
+# idle pool threads, background refresh loops); skipped when sampling CPU use only
+IDLE_FRAMES = frozenset({
+    'threading:Condition.wait',
+    'threading:Event.wait',
+    'threading:Thread._wait_for_tstate_lock',
+    'selectors:EpollSelector.select',
+    'selectors:PollSelector.select',
+    'selectors:SelectSelector.select',
+    'selectors:KqueueSelector.select',
+    'socket:socket.accept',
+    'concurrent.futures.thread:_worker',
+    'gunicorn.workers.sync:SyncWorker.wait',
+})
+
+# Pseudo frame appended to the stack of a thread sampled inside a garbage collection
+GC_FRAME = 'gc:collect'
+
+# Threads currently running a garbage collection, maintained by _track_gc
+_collecting_threads: set = set()
+
+def _track_gc(phase: str, info: Dict[str, Any]):
+    """gc callback marking the collecting thread, which is the thread that triggered it"""
+    if phase == 'start':
+        _collecting_threads.add(threading.get_ident())
+    else:
+        _collecting_threads.discard(threading.get_ident())
+
+# Labels are cached per code object so a sample costs one dict lookup per frame
+_code_labels: Dict[Any, str] = {}
+
+def _frame_label(frame) -> str:
+    """module:qualname of a frame, safe to use in a collapsed stack line"""
+    code = frame.f_code
+    label = _code_labels.get(code)
+    if label is None:
+        module = frame.f_globals.get('__name__') or os.path.basename(code.co_filename)
+        name = getattr(code, 'co_qualname', code.co_name)
+        label = f"{module}:{name}".replace(';', ':').replace(' ', '_')
+        _code_labels[code] = label
+    return label
+
+def collapse_stack(frame) -> str:
+    """Stack of a frame in collapsed form: root first, frames joined by ';'"""
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return ';'.join(labels)
+
+def render_collapsed(stacks: Dict[str, int]) -> str:
+    """Collapsed stack file ("frame;frame;frame count" per line) for flamegraph.pl or speedscope"""
+    return ''.join(f"{stack} {count}\n" for stack, count in sorted(stacks.items(), key=lambda item: -item[1]))
+
+def stack_top_functions(stacks: Dict[str, int], limit: int) -> List[Dict[str, Any]]:
+    """Functions present in the most samples, with the samples where they were the running frame"""
+    total = sum(stacks.values())
+    cumulative: Counter = Counter()
+    own: Counter = Counter()
+    for stack, count in stacks.items():
+        frames = stack.split(';')
+        own[frames[-1]] += count
+        for label in set(frames):
+            cumulative[label] += count
+    return [{
+        'function': label,
+        'cumulative_samples': count,
+        'self_samples': own[label],
+        'cumulative_percent': round(100.0 * count / total, 2)
+    } for label, count in cumulative.most_common(limit)]
+
+def cprofile_top_functions(stats: Dict[tuple, tuple], limit: int) -> List[Dict[str, Any]]:
+    """Functions with the highest cumulative time in a pstats stats dict"""
+    rows = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:limit]
+    return [{
+        'function': pstats.func_std_string((os.path.basename(filename), line, name)),
+        'calls': calls,
+        'primitive_calls': primitive_calls,
+        'total_time_ms': round(total_time * 1000, 3),
+        'cumulative_time_ms': round(cumulative_time * 1000, 3)
+    } for (filename, line, name), (primitive_calls, calls, total_time, cumulative_time, _) in rows]
+
+class StackSampler:
+    """
+    Samples Python stacks of running threads from a daemon thread.
+
+    Every interval the sampler reads sys._current_frames() and counts the
+    collapsed stack of each watched thread. Nothing is installed in the
+    sampled threads; their only cost is the GIL time the sampler holds.
+    With max_overhead set, the wait after a sample is stretched so that
+    time spent sampling stays below that share of wall time.
+    """
+
+    def __init__(self, interval: float, thread_ids: Optional[Iterable[int]] = None, name: str = 'stack-sampler',
+                 include_idle: bool = True, max_overhead: Optional[float] = None,
+                 max_duration: Optional[float] = None, track_gc: bool = False):
+        """
+        Args:
+            interval: Seconds between samples
+            thread_ids: Threads to sample; None samples every other thread
+            name: Name of the sampling thread
+            include_idle: Also count threads whose innermost frame is in IDLE_FRAMES
+            max_overhead: Upper bound of sampling time as a share of wall time
+            max_duration: Seconds after which the sampler stops by itself
+            track_gc: Mark samples taken during garbage collection with GC_FRAME
+        """
+        self.interval = interval
+        self.thread_ids = set(thread_ids) if thread_ids is not None else None
+        self.name = name
+        self.include_idle = include_idle
+        self.max_overhead = max_overhead
+        self.max_duration = max_duration
+        self.track_gc = track_gc
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.sampling_time = 0.0
+        self.effective_interval = interval
+        self.started_at: Optional[float] = None
+        self.stopped_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def elapsed(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        return (self.stopped_at or time.perf_counter()) - self.started_at
+
+    @property
+    def overhead(self) -> float:
+        """Time spent sampling as a share of the time the sampler has run"""
+        elapsed = self.elapsed
+        return self.sampling_time / elapsed if elapsed else 0.0
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        if self.track_gc:
+            gc.callbacks.append(_track_gc)
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        wait = self.interval
+        try:
+            while not self._stop_event.wait(wait):
+                started = time.perf_counter()
+                self.sample(own_id)
+                cost = time.perf_counter() - started
+                self.sampling_time += cost
+                if self.max_overhead:
+                    # Many threads or deep stacks make samples dearer; sample less often instead
+                    wait = max(self.interval, cost / self.max_overhead)
+                    self.effective_interval = wait
+                if self.max_duration and started - self.started_at >= self.max_duration:
+                    break
+        finally:
+            if self.track_gc and _track_gc in gc.callbacks:
+                gc.callbacks.remove(_track_gc)
+            self.stopped_at = time.perf_counter()
+
+    def sample(self, own_id: Optional[int] = None):
+        """Count the current stack of every watched thread once"""
+        frames = sys._current_frames()
+        try:
+            with self._lock:
+                for thread_id, frame in frames.items():
+                    if thread_id == own_id or (self.thread_ids is not None and thread_id not in self.thread_ids):
+                        continue
+                    if not self.include_idle and _frame_label(frame) in IDLE_FRAMES:
+                        continue
+                    if frame.f_code is _track_gc.__code__:
+                        # The GIL is only handed over at the gc callbacks, so samples
+                        # delayed by a collection land there; report them as the collection
+                        stack = collapse_stack(frame.f_back) + ';' + GC_FRAME
+                    elif thread_id in _collecting_threads:
+                        stack = collapse_stack(frame) + ';' + GC_FRAME
+                    else:
+                        stack = collapse_stack(frame)
+                    self.stacks[stack] += 1
+                self.samples += 1
+        finally:
+            # Frames keep their locals alive; drop them before sleeping
+            del frames
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.stacks)
+
+class RequestProfiler:
+    """
+    Profiles the work done by the calling thread between start() and stop().
+
+    'deterministic' records every call with cProfile and reports exact call
+    counts and cumulative times; only one can run per process at a time.
+    'sampling' counts the thread's stacks every sample interval and can also
+    be exported as a collapsed stack file.
+    """
+
+    _deterministic_lock = threading.Lock()
+
+    def __init__(self, mode: str, sample_interval: float):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode {mode!r}")
+        self.mode = mode
+        self.sample_interval = sample_interval
+        self.started_at: Optional[datetime] = None
+        self.duration = 0.0
+        self._started = 0.0
+        self._profiler: Optional[cProfile.Profile] = None
+        self._sampler: Optional[StackSampler] = None
+
+    def start(self) -> bool:
+        """Start profiling; False when another deterministic profile is running"""
+        if self.mode == 'deterministic':
+            if not self._deterministic_lock.acquire(blocking=False):
+                return False
+            self._profiler = cProfile.Profile()
+            try:
+                self._profiler.enable()
+            except ValueError:
+                # Another profiling tool owns the interpreter hook
+                self._profiler = None
+                self._deterministic_lock.release()
+                return False
+        else:
+            self._sampler = StackSampler(self.sample_interval, thread_ids=[threading.get_ident()], name='request-sampler')
+            self._sampler.start()
+        self.started_at = datetime.now()
+        self._started = time.perf_counter()
+        return True
+
+    def stop(self):
+        self.duration = time.perf_counter() - self._started
+        if self._profiler is not None:
+            self._profiler.disable()
+            self._deterministic_lock.release()
+        if self._sampler is not None:
+            self._sampler.stop()
+
+    def result(self, top: int) -> Dict[str, Any]:
+        """Profile record: summary fields, top functions and the raw data for export"""
+        profile = {
+            'mode': self.mode,
+            'started_at': self.started_at.isoformat(),
+            'duration_ms': round(self.duration * 1000, 3)
+        }
+        if self._profiler is not None:
+            stats = pstats.Stats(self._profiler).stats
+            profile['top_functions'] = cprofile_top_functions(stats, top)
+            profile['pstats'] = marshal.dumps(stats)
+        else:
+            stacks = self._sampler.snapshot()
+            profile['samples'] = self._sampler.samples
+            profile['top_functions'] = stack_top_functions(stacks, top)
+            profile['stacks'] = stacks
+        return profile
+
+class ProfileStore:
+    """Most recent profiles of this worker process, oldest dropped first"""
+
+    # Raw data served by the export formats rather than in summaries
+    RAW_FIELDS = ('pstats', 'stacks', 'top_functions')
+
+    def __init__(self, capacity: int):
+        self.capacity = max(1, capacity)
+        self._profiles: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def add(self, profile: Dict[str, Any]) -> str:
+        """Store a profile and return its id"""
+        with self._lock:
+            profile_id = f"{os.getpid()}-{next(self._ids)}"
+            profile['id'] = profile_id
+            self._profiles[profile_id] = profile
+            while len(self._profiles) > self.capacity:
+                self._profiles.popitem(last=False)
+        return profile_id
+
+    def get(self, profile_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._profiles.get(profile_id)
+
+    def list(self) -> List[Dict[str, Any]]:
+        """Summaries of the stored profiles, newest first"""
+        with self._lock:
+            profiles = list(self._profiles.values())
+        return [
+            {key: value for key, value in profile.items() if key not in self.RAW_FIELDS}
+            for profile in reversed(profiles)
+        ]
+
+class ContinuousProfiler:
+    """
+    Start/stop control of a stack sampler over every thread of this worker.
+
+    Only the answering worker process is sampled; exported stacks are rooted
+    at a worker:<pid> frame so the files of several workers can be
+    concatenated into one flamegraph.
+    """
+
+    def __init__(self, interval: float, max_overhead: float, max_duration: float):
+        """
+        Args:
+            interval: Default seconds between samples
+            max_overhead: Upper bound of sampling time as a share of wall time
+            max_duration: Default seconds after which sampling stops by itself
+        """
+        self.interval = interval
+        self.max_overhead = max_overhead
+        self.max_duration = max_duration
+        self._sampler: Optional[StackSampler] = None
+        self._started_at: Optional[datetime] = None
+        self._lock = threading.Lock()
+
+    def start(self, interval: Optional[float] = None, duration: Optional[float] = None,
+              include_idle: bool = False) -> bool:
+        """Start a new sampling run, dropping the previous stacks; False when already running"""
+        with self._lock:
+            if self._sampler is not None and self._sampler.running:
+                return False
+            self._sampler = StackSampler(
+                interval or self.interval, name='continuous-profiler', include_idle=include_idle,
+                max_overhead=self.max_overhead, max_duration=duration or self.max_duration, track_gc=True
+            )
+            self._sampler.start()
+            self._started_at = datetime.now()
+            return True
+
+    def stop(self) -> bool:
+        """Stop the running sampler, keeping its stacks for export; False when not running"""
+        with self._lock:
+            if self._sampler is None or not self._sampler.running:
+                return False
+            self._sampler.stop()
+            return True
+
+    def status(self) -> Dict[str, Any]:
+        sampler = self._sampler
+        status = {'worker': os.getpid(), 'running': sampler is not None and sampler.running}
+        if sampler is not None:
+            status.update({
+                'started_at': self._started_at.isoformat(),
+                'elapsed_s': round(sampler.elapsed, 3),
+                'max_duration_s': sampler.max_duration,
+                'include_idle': sampler.include_idle,
+                'samples': sampler.samples,
+                'distinct_stacks': len(sampler.stacks),
+                'interval_ms': round(sampler.interval * 1000, 3),
+                'effective_interval_ms': round(sampler.effective_interval * 1000, 3),
+                'overhead_percent': round(100.0 * sampler.overhead, 3)
+            })
+        return status
+
+    def stacks(self) -> Dict[str, int]:
+        """Collapsed stacks of the current or last run, rooted at this worker"""
+        if self._sampler is None:
+            return {}
+        root = f"worker:{os.getpid()}"
+        return {f"{root};{stack}": count for stack, count in self._sampler.snapshot().items()}
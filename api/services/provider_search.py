@@ -0,0 +1,126 @@
+"""
+Typeahead search index over provider names
+نمایه جستجوی پیشوندی و n-gram نام پزشکان
+"""
+
+import bisect
+import heapq
+import re
+from typing import Any, Dict, List
+import numpy as np
+
+# Arabic code points folded onto their Persian forms, plus digits and hamza carriers
+_CHARACTER_MAP = str.maketrans({
+    'ي': 'ی',  # Arabic yeh -> Persian yeh
+    'ى': 'ی',  # alef maksura -> Persian yeh
+    'ئ': 'ی',  # yeh with hamza -> Persian yeh
+    'ك': 'ک',  # Arabic kaf -> Persian kaf
+    'ة': 'ه',  # teh marbuta -> heh
+    'ۀ': 'ه',  # heh with yeh -> heh
+    'أ': 'ا',  # alef with hamza above -> alef
+    'إ': 'ا',  # alef with hamza below -> alef
+    'آ': 'ا',  # alef with madda -> alef
+    'ؤ': 'و',  # waw with hamza -> waw
+    '\u200c': ' ',  # zero-width non-joiner separates words
+    **{chr(0x06f0 + digit): str(digit) for digit in range(10)},  # Persian digits
+    **{chr(0x0660 + digit): str(digit) for digit in range(10)},  # Arabic-Indic digits
+})
+
+# Harakat, superscript alef and tatweel carry no meaning for matching
+_IGNORED_CHARACTERS = re.compile('[\u064b-\u065f\u0670\u0640\u200d\u200e\u200f]')
+_WHITESPACE = re.compile(r'\s+')
+
+# Substring matching uses character bigrams so two-letter queries are covered
+NGRAM_SIZE = 2
+
+def normalize_persian(text: str) -> str:
+    """
+    Normalize Persian/Arabic text for matching
+
+    Folds Arabic yeh and kaf onto the Persian letters, treats ZWNJ as a word
+    break, strips diacritics and tatweel, converts digits to ASCII and
+    collapses whitespace.
+    """
+    if not text:
+        return ''
+    text = _IGNORED_CHARACTERS.sub('', str(text).translate(_CHARACTER_MAP))
+    return _WHITESPACE.sub(' ', text).strip().casefold()
+
+class ProviderSearchIndex:
+    """
+    Prefix and n-gram index over providers ordered by prescription volume.
+
+    Providers keep their position in the volume-ordered list as id, so the
+    lowest matching ids are the top-K by volume. A query first matches the
+    start of any word of a name through binary search over sorted word
+    suffixes (names starting with the query rank first), then falls back to
+    substring matches found by intersecting n-gram postings.
+    """
+
+    def __init__(self, providers: List[Dict[str, Any]]):
+        self.providers = providers
+        self.names = [normalize_persian(provider.get('provider_name') or '') for provider in providers]
+
+        # Name suffixes starting at each word, so a query prefix-matches any word
+        suffixes = []
+        for provider_id, name in enumerate(self.names):
+            for match in re.finditer(r'\S+', name):
+                suffixes.append((name[match.start():], provider_id))
+        suffixes.sort()
+        self.suffixes = [suffix for suffix, _ in suffixes]
+        self.suffix_ids = [provider_id for _, provider_id in suffixes]
+
+        postings: Dict[str, List[int]] = {}
+        for provider_id, name in enumerate(self.names):
+            for gram in {name[i:i + NGRAM_SIZE] for i in range(len(name) - NGRAM_SIZE + 1)}:
+                postings.setdefault(gram, []).append(provider_id)
+        self.postings = {gram: np.asarray(ids, dtype=np.int32) for gram, ids in postings.items()}
+
+    def __len__(self) -> int:
+        return len(self.providers)
+
+    def search(self, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        Top providers by prescription volume whose name matches the query
+
+        Args:
+            query: Typed text; an empty query returns the highest-volume providers
+            limit: Maximum number of providers
+
+        Returns:
+            Matching providers, word-prefix matches before substring matches
+        """
+        query = normalize_persian(query)
+        if not query:
+            return self.providers[:limit]
+
+        lo = bisect.bisect_left(self.suffixes, query)
+        hi = bisect.bisect_left(self.suffixes, query + '\uffff')
+        prefix_ids = set(self.suffix_ids[lo:hi])
+        ranked = heapq.nsmallest(
+            limit, prefix_ids,
+            key=lambda provider_id: (not self.names[provider_id].startswith(query), provider_id)
+        )
+
+        if len(ranked) < limit and len(query) >= NGRAM_SIZE:
+            for provider_id in self._substring_ids(query):
+                if provider_id not in prefix_ids:
+                    ranked.append(provider_id)
+                    if len(ranked) == limit:
+                        break
+
+        return [self.providers[provider_id] for provider_id in ranked]
+
+    def _substring_ids(self, query: str) -> List[int]:
+        """Ids of names containing the query, in volume order"""
+        grams = {query[i:i + NGRAM_SIZE] for i in range(len(query) - NGRAM_SIZE + 1)}
+        lists = sorted((self.postings.get(gram) for gram in grams), key=lambda ids: 0 if ids is None else len(ids))
+        if lists[0] is None:
+            return []
+        candidates = lists[0]
+        for ids in lists[1:]:
+            candidates = np.intersect1d(candidates, ids, assume_unique=True)
+            if len(candidates) == 0:
+                return []
+        # Bigrams can co-occur without being adjacent; confirm the substring
+        return [int(provider_id) for provider_id in candidates if query in self.names[provider_id]]
@@ -0,0 +1,145 @@
+"""
+Row selection index for filtered dashboard charts
+نمایه انتخاب سطر برای نمودارهای فیلترشده داشبورد
+"""
+
+import numpy as np
+import pandas as pd
+from typing import Any, Dict, List, Optional, Tuple
+from .entity_index import EntityIndex
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Category filters and the data_final column they select on
+FILTER_COLUMNS = {
+    'province': 'province',
+    'service': 'Service',
+    'specialty': 'provider_specialty',
+}
+
+ONE_DAY = np.timedelta64(1, 'D').astype('timedelta64[ns]').astype('int64')
+
+class RowFilterIndex:
+    """
+    Admission-date order and per-category row lists over data_final.
+
+    A date range is located with two binary searches over the date-sorted rows;
+    each category value maps to the sorted list of its row positions. A filter
+    starts from its most selective constraint and narrows that candidate set by
+    the remaining ones, so selecting k rows costs O(k) rather than O(len(data_final)).
+    """
+
+    def __init__(self, data_final: pd.DataFrame):
+        self.n_rows = len(data_final)
+        positions = np.arange(self.n_rows)
+
+        if 'Adm_date' in data_final.columns:
+            dates = pd.to_datetime(data_final['Adm_date'], errors='coerce').to_numpy().astype('datetime64[ns]')
+        else:
+            dates = np.full(self.n_rows, np.datetime64('NaT'), dtype='datetime64[ns]')
+        # Missing dates never fall inside a range
+        self.dates = dates.view('int64').copy()
+        self.dates[np.isnat(dates)] = np.iinfo('int64').max
+        self.date_order = np.argsort(self.dates, kind='stable')
+        self.sorted_dates = self.dates[self.date_order]
+
+        self.categories: Dict[str, EntityIndex] = {}
+        for name, column in FILTER_COLUMNS.items():
+            if column in data_final.columns:
+                # Ordering each value's rows by position keeps them sorted for intersection
+                self.categories[name] = EntityIndex(data_final[column], positions)
+
+        category_counts = ', '.join(f"{len(index)} {name} values" for name, index in self.categories.items())
+        logger.info(f"Built row filter index over {self.n_rows} rows with {category_counts}")
+
+    def available(self, name: str) -> bool:
+        """Check whether a category filter can be applied to this data"""
+        return name in self.categories
+
+    def select(self, filters: Dict[str, Any]) -> np.ndarray:
+        """
+        Positions of the rows matching every filter, in ascending order
+
+        Args:
+            filters: Validated chart filters (from, to, province, service, specialty)
+
+        Returns:
+            Sorted row positions into data_final
+        """
+        constraints = self._constraints(filters)
+        if not constraints:
+            return np.arange(self.n_rows)
+
+        constraints.sort(key=lambda constraint: constraint[0])
+        _, kind, value = constraints[0]
+        if kind == 'date':
+            lo, hi = self._date_slice(*value)
+            rows = np.sort(self.date_order[lo:hi])
+        else:
+            index = self.categories[kind]
+            lists = [index.positions[index.starts[code]:index.ends[code]] for code in value]
+            if not lists:
+                return index.positions[:0]
+            # A single value's rows are already ascending; a union needs one sort
+            rows = lists[0] if len(lists) == 1 else np.sort(np.concatenate(lists))
+        return self._narrow(rows, constraints[1:])
+
+    def narrow(self, rows: np.ndarray, filters: Dict[str, Any]) -> np.ndarray:
+        """
+        Keep the rows of an existing row set that match every filter, preserving order
+
+        Args:
+            rows: Row positions into data_final
+            filters: Validated chart filters
+
+        Returns:
+            Matching subset of rows
+        """
+        return self._narrow(rows, self._constraints(filters))
+
+    def _constraints(self, filters: Dict[str, Any]) -> List[Tuple[int, str, Any]]:
+        """(matching row count, kind, bounds or codes) for each filter given"""
+        constraints = []
+        if filters.get('from') or filters.get('to'):
+            start = self._day(filters.get('from'), np.iinfo('int64').min)
+            end = self._day(filters.get('to'), np.iinfo('int64').max - ONE_DAY) + ONE_DAY
+            lo, hi = self._date_slice(start, end)
+            constraints.append((hi - lo, 'date', (start, end)))
+
+        for name in FILTER_COLUMNS:
+            values = filters.get(name)
+            if not values:
+                continue
+            index = self.categories.get(name)
+            if index is None:
+                raise KeyError(name)
+            codes = [index.codes[value] for value in values if value in index.codes]
+            size = sum(int(index.ends[code] - index.starts[code]) for code in codes)
+            constraints.append((size, name, codes))
+        return constraints
+
+    def _narrow(self, rows: np.ndarray, constraints: List[Tuple[int, str, Any]]) -> np.ndarray:
+        """Apply constraints to a row set by looking up each candidate's date or category"""
+        for _, kind, value in constraints:
+            if len(rows) == 0:
+                break
+            if kind == 'date':
+                start, end = value
+                dates = self.dates[rows]
+                rows = rows[(dates >= start) & (dates < end)]
+            else:
+                rows = rows[np.isin(self.categories[kind].row_codes[rows], value)]
+        return rows
+
+    def _date_slice(self, start: int, end: int) -> Tuple[int, int]:
+        """Bounds in date_order of rows admitted in [start, end)"""
+        lo, hi = np.searchsorted(self.sorted_dates, [start, end], side='left')
+        return int(lo), int(hi)
+
+    @staticmethod
+    def _day(value: Optional[str], default: int) -> int:
+        """Nanosecond timestamp of a YYYY-MM-DD day, or the default when not given"""
+        if not value:
+            return default
+        return int(np.datetime64(value, 'ns').astype('int64'))
@@ -0,0 +1,429 @@
+"""
+SQL feature extraction backend for fraud detection (DuckDB)
+استخراج ویژگی‌ها با موتور SQL درون‌پردازه‌ای (DuckDB)
+
+Expresses the 11 risk indicators of ``FeatureExtractor`` as SQL aggregate and
+window queries so they can run multi-threaded and out-of-core over a DataFrame,
+a Parquet snapshot or a CSV export of the Prescriptions table.
+"""
+
+import pandas as pd
+import numpy as np
+from typing import Iterable, Iterator, List, Optional, Union
+from core.utils import performance_monitor
+from config.config import app_config, memory_config
+import logging
+import os
+
+try:
+    import duckdb
+except ImportError:  # Optional dependency
+    duckdb = None
+
+logger = logging.getLogger(__name__)
+
+# Service excluded from the service cost-difference features (same as the pandas implementation)
+DRUG_SERVICE = 'دارو و ملزومات دارویی'
+
+ROW_ID_COLUMN = '__row_id'
+
+# Rows per engine vector; result batches are fetched in whole vectors
+ENGINE_VECTOR_SIZE = 2048
+
+
+def _quote_path(path: str) -> str:
+    """SQL string literal for a file path"""
+    return "'" + str(path).replace("'", "''") + "'"
+
+
+def _keys_present(*keys: str) -> str:
+    """SQL condition dropping rows with a missing group key, as pandas groupby does"""
+    return ' AND '.join(f"{key} IS NOT NULL" for key in keys)
+
+
+def write_snapshot(chunks: Iterable[pd.DataFrame], directory: str) -> int:
+    """
+    Write processed prescription chunks as a Parquet snapshot for the SQL backend
+
+    Each chunk becomes one part file carrying a global row id, so only one chunk
+    is held in memory at a time and ``SQLFeatureExtractor(directory)`` reads the
+    parts back in their original row order.
+
+    Args:
+        chunks: Processed prescription chunks with the same columns
+        directory: Snapshot directory (created if missing)
+
+    Returns:
+        Number of rows written
+    """
+    if duckdb is None:
+        raise ImportError("duckdb is required for the SQL feature backend (pip install duckdb)")
+
+    os.makedirs(directory, exist_ok=True)
+    conn = duckdb.connect(database=':memory:')
+    rows = 0
+    try:
+        for part, chunk in enumerate(chunks):
+            if chunk is None or chunk.empty:
+                continue
+            df = chunk.assign(**{ROW_ID_COLUMN: np.arange(rows, rows + len(chunk), dtype=np.int64)})
+            # Text columns are written as VARCHAR even when a chunk has only missing values,
+            # so every part has the same schema
+            projection = ', '.join(
+                f'CAST("{col}" AS VARCHAR) AS "{col}"' if df[col].dtype == object else f'"{col}"'
+                for col in df.columns
+            )
+            conn.register('snapshot_chunk', df)
+            conn.execute(
+                f"COPY (SELECT {projection} FROM snapshot_chunk) "
+                f"TO {_quote_path(os.path.join(directory, f'part-{part:05d}.parquet'))} (FORMAT PARQUET)"
+            )
+            conn.unregister('snapshot_chunk')
+            rows += len(chunk)
+        logger.info(f"Wrote {rows} rows to feature snapshot {directory}")
+        return rows
+    finally:
+        conn.close()
+
+
+def _non_negative(expr: str) -> str:
+    """SQL expression mapping NULL, NaN and negative values to 0"""
+    return f"CASE WHEN ({expr}) IS NULL OR isnan({expr}) OR ({expr}) < 0 THEN 0 ELSE ({expr}) END"
+
+
+def _percent_diff(value: str, reference: str) -> str:
+    """SQL expression for the percentage difference of value against reference"""
+    return f"(({value}) - ({reference})) / ({reference}) * 100"
+
+
+def _percent_change(current: str, previous: str) -> str:
+    """SQL equivalent of core.utils.calculate_percentage_change"""
+    change = _percent_diff(current, previous)
+    return (
+        f"CASE WHEN ({current}) IS NULL OR ({previous}) IS NULL OR ({previous}) <= 0 THEN 0 "
+        f"WHEN {change} < 0 OR {change} > {float(app_config.max_percentage_change)} THEN 0 "
+        f"ELSE {change} END"
+    )
+
+
+def _average_previous(prev_1: str, prev_2: str) -> str:
+    """SQL equivalent of DataFrame.mean(axis=1) over two lagged columns (NaN skipped)"""
+    return (
+        f"CASE WHEN {prev_1} IS NULL THEN {prev_2} "
+        f"WHEN {prev_2} IS NULL THEN {prev_1} "
+        f"ELSE ({prev_1} + {prev_2}) / 2 END"
+    )
+
+
+class SQLFeatureExtractor:
+    """Feature extractor backed by the DuckDB embedded SQL engine"""
+
+    def __init__(self, data: Union[pd.DataFrame, str], threads: Optional[int] = None,
+                 memory_limit_mb: Optional[int] = None, temp_directory: Optional[str] = None):
+        """
+        Args:
+            data: DataFrame, or path to a snapshot directory written by write_snapshot(),
+                a Parquet file or a CSV export
+            threads: Number of engine threads (defaults to memory_config.sql_engine_threads)
+            memory_limit_mb: Engine memory limit before spilling to disk
+                (defaults to memory_config.max_memory_usage_mb)
+            temp_directory: Spill directory (defaults to memory_config.sql_engine_temp_dir)
+        """
+        if duckdb is None:
+            raise ImportError("duckdb is required for the SQL feature backend (pip install duckdb)")
+
+        self.data = data
+        self.threads = threads if threads is not None else memory_config.sql_engine_threads
+        self.memory_limit_mb = memory_limit_mb or memory_config.max_memory_usage_mb
+        self.temp_directory = temp_directory or memory_config.sql_engine_temp_dir
+        self.feature_columns = [
+            'unq_ratio_provider', 'unq_ratio_patient', 'percent_change_provider',
+            'percent_change_patient', 'percent_difference', 'percent_diff_ser',
+            'percent_diff_spe', 'percent_diff_spe2', 'percent_diff_ser_patient',
+            'percent_diff_serv', 'Ratio'
+        ]
+
+    def _connect(self):
+        """Open an in-process engine configured for multi-threaded, out-of-core execution"""
+        conn = duckdb.connect(database=':memory:')
+        if self.threads and self.threads > 0:
+            conn.execute(f"SET threads = {int(self.threads)}")
+        conn.execute(f"SET memory_limit = '{int(self.memory_limit_mb)}MB'")
+        if self.temp_directory:
+            conn.execute(f"SET temp_directory = {_quote_path(self.temp_directory)}")
+        return conn
+
+    def _register_source(self, conn) -> None:
+        """Expose the input as the ``prescriptions`` relation with a stable row id"""
+        if isinstance(self.data, pd.DataFrame):
+            df = self.data
+            # The engine cannot ingest Period columns; year_month is compared as 'YYYY-MM' text
+            if 'year_month' in df.columns and isinstance(df['year_month'].dtype, pd.PeriodDtype):
+                df = df.assign(year_month=df['year_month'].astype(str).where(df['year_month'].notna()))
+            df = df.assign(**{ROW_ID_COLUMN: np.arange(len(df), dtype=np.int64)})
+            conn.register('prescriptions_source', df)
+            conn.execute("CREATE VIEW prescriptions AS SELECT * FROM prescriptions_source")
+            return
+
+        path = str(self.data)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Feature source not found: {path}")
+
+        # The engine scans the files itself, so the source never has to fit in RAM
+        if os.path.isdir(path):
+            conn.execute(f"""
+                CREATE VIEW prescriptions AS
+                SELECT * FROM read_parquet({_quote_path(os.path.join(path, '*.parquet'))}, union_by_name = true)
+            """)
+        elif path.lower().endswith('.parquet'):
+            conn.execute(f"""
+                CREATE VIEW prescriptions AS
+                SELECT * EXCLUDE (file_row_number), file_row_number AS {ROW_ID_COLUMN}
+                FROM read_parquet({_quote_path(path)}, file_row_number = true)
+            """)
+        else:
+            conn.execute(f"""
+                CREATE VIEW prescriptions AS
+                SELECT *, row_number() OVER () - 1 AS {ROW_ID_COLUMN}
+                FROM read_csv_auto({_quote_path(path)})
+            """)
+
+    def build_query(self, columns: Optional[List[str]] = None) -> str:
+        """
+        Build the feature query over the ``prescriptions`` relation
+
+        Args:
+            columns: Input columns returned next to the features (defaults to all)
+        """
+        passthrough = 'b.* EXCLUDE (__cost)' if columns is None else ', '.join(
+            [f'b."{col}"' for col in columns] + [f'b.{ROW_ID_COLUMN}']
+        )
+        return f"""
+        WITH base AS (
+            SELECT *, CAST(cost_amount AS DOUBLE) AS __cost
+            FROM prescriptions
+        ),
+        patient_month AS (
+            SELECT year_month, ID,
+                   COUNT(provider_name) AS total_providers_monthly,
+                   COUNT(DISTINCT provider_name) AS unique_providers,
+                   AVG(__cost) AS mean_amount_patient,
+                   LAG(AVG(__cost), 1) OVER (PARTITION BY ID ORDER BY year_month) AS prev_patient_1,
+                   LAG(AVG(__cost), 2) OVER (PARTITION BY ID ORDER BY year_month) AS prev_patient_2
+            FROM base
+            WHERE {_keys_present('year_month', 'ID')}
+            GROUP BY year_month, ID
+        ),
+        provider_month AS (
+            SELECT year_month, provider_name,
+                   COUNT(ID) AS total_patients_monthly,
+                   COUNT(DISTINCT ID) AS unique_patients,
+                   AVG(__cost) AS mean_amount_provider,
+                   LAG(AVG(__cost), 1) OVER (PARTITION BY provider_name ORDER BY year_month) AS prev_provider_1,
+                   LAG(AVG(__cost), 2) OVER (PARTITION BY provider_name ORDER BY year_month) AS prev_provider_2
+            FROM base
+            WHERE {_keys_present('year_month', 'provider_name')}
+            GROUP BY year_month, provider_name
+        ),
+        service_month AS (
+            SELECT year_month, Service,
+                   AVG(__cost) AS avg_amount,
+                   LAG(AVG(__cost)) OVER (PARTITION BY Service ORDER BY year_month) AS prev_avg_amount_serv
+            FROM base
+            WHERE {_keys_present('year_month', 'Service')}
+            GROUP BY year_month, Service
+        ),
+        provider_service_month AS (
+            SELECT year_month, provider_name, Service, AVG(__cost) AS avg_amount_ser
+            FROM base
+            WHERE {_keys_present('year_month', 'provider_name', 'Service')}
+            GROUP BY year_month, provider_name, Service
+        ),
+        patient_service_month AS (
+            SELECT year_month, ID, Service, AVG(__cost) AS avg_amount_ser_patient
+            FROM base
+            WHERE {_keys_present('year_month', 'ID', 'Service')}
+            GROUP BY year_month, ID, Service
+        ),
+        specialty_month AS (
+            SELECT year_month, provider_specialty,
+                   LAG(AVG(__cost)) OVER (PARTITION BY provider_specialty ORDER BY year_month) AS prev_avg_amount_spe
+            FROM base
+            WHERE {_keys_present('year_month', 'provider_specialty')}
+            GROUP BY year_month, provider_specialty
+        ),
+        provider_specialty_month AS (
+            SELECT year_month, provider_name, provider_specialty, AVG(__cost) AS avg_amount_spe
+            FROM base
+            WHERE {_keys_present('year_month', 'provider_name', 'provider_specialty')}
+            GROUP BY year_month, provider_name, provider_specialty
+        ),
+        provider_service AS (
+            SELECT provider_name, Service, COUNT(*) AS service_count
+            FROM base
+            WHERE {_keys_present('provider_name', 'Service')}
+            GROUP BY provider_name, Service
+        ),
+        provider_total AS (
+            SELECT provider_name, COUNT(*) AS total_count
+            FROM base
+            WHERE {_keys_present('provider_name')}
+            GROUP BY provider_name
+        )
+        SELECT
+            {passthrough},
+            CASE WHEN pm.unique_providers IS NULL OR pm.unique_providers = 0 THEN 0
+                 ELSE pm.total_providers_monthly / pm.unique_providers END AS unq_ratio_provider,
+            CASE WHEN prm.unique_patients IS NULL OR prm.unique_patients = 0 THEN 0
+                 ELSE prm.total_patients_monthly / prm.unique_patients END AS unq_ratio_patient,
+            CASE WHEN prm.provider_name IS NULL THEN NULL
+                 ELSE {_percent_change('prm.mean_amount_provider', _average_previous('prm.prev_provider_1', 'prm.prev_provider_2'))} END AS percent_change_provider,
+            CASE WHEN pm.ID IS NULL THEN NULL
+                 ELSE {_percent_change('pm.mean_amount_patient', _average_previous('pm.prev_patient_1', 'pm.prev_patient_2'))} END AS percent_change_patient,
+            CASE WHEN b.Service = '{DRUG_SERVICE}' THEN 0
+                 ELSE {_non_negative(_percent_diff('b.__cost', 'sm.avg_amount'))} END AS percent_difference,
+            CASE WHEN b.Service = '{DRUG_SERVICE}' THEN 0
+                 ELSE {_non_negative(_percent_diff('psm.avg_amount_ser', 'sm.prev_avg_amount_serv'))} END AS percent_diff_ser,
+            {_non_negative(_percent_diff('pspm.avg_amount_spe', 'spm.prev_avg_amount_spe'))} AS percent_diff_spe,
+            {_non_negative(_percent_diff('b.__cost', 'spm.prev_avg_amount_spe'))} AS percent_diff_spe2,
+            CASE WHEN b.Service = '{DRUG_SERVICE}' THEN 0
+                 ELSE {_non_negative(_percent_diff('patsm.avg_amount_ser_patient', 'sm.prev_avg_amount_serv'))} END AS percent_diff_ser_patient,
+            CASE WHEN b.Service = '{DRUG_SERVICE}' THEN 0
+                 ELSE {_non_negative(_percent_diff('b.__cost', 'sm.prev_avg_amount_serv'))} END AS percent_diff_serv,
+            CASE WHEN ps.service_count IS NULL THEN NULL
+                 WHEN pt.total_count = 1 THEN 0
+                 ELSE 1 - ps.service_count / pt.total_count END AS Ratio
+        FROM base b
+        LEFT JOIN patient_month pm
+            ON b.year_month = pm.year_month AND b.ID = pm.ID
+        LEFT JOIN provider_month prm
+            ON b.year_month = prm.year_month AND b.provider_name = prm.provider_name
+        LEFT JOIN service_month sm
+            ON b.year_month = sm.year_month AND b.Service = sm.Service
+        LEFT JOIN provider_service_month psm
+            ON b.year_month = psm.year_month AND b.provider_name = psm.provider_name AND b.Service = psm.Service
+        LEFT JOIN patient_service_month patsm
+            ON b.year_month = patsm.year_month AND b.ID = patsm.ID AND b.Service = patsm.Service
+        LEFT JOIN specialty_month spm
+            ON b.year_month = spm.year_month AND b.provider_specialty = spm.provider_specialty
+        LEFT JOIN provider_specialty_month pspm
+            ON b.year_month = pspm.year_month AND b.provider_name = pspm.provider_name
+               AND b.provider_specialty = pspm.provider_specialty
+        LEFT JOIN provider_service ps
+            ON b.provider_name = ps.provider_name AND b.Service = ps.Service
+        LEFT JOIN provider_total pt
+            ON b.provider_name = pt.provider_name
+        ORDER BY b.{ROW_ID_COLUMN}
+        """
+
+    @performance_monitor
+    def extract_all_features(self) -> pd.DataFrame:
+        """Extract all features and return the input rows with feature columns appended"""
+        conn = None
+        try:
+            logger.info("Starting SQL feature extraction (duckdb)...")
+            conn = self._connect()
+            self._register_source(conn)
+
+            result = conn.execute(self.build_query()).df()
+            result = result.drop(columns=[ROW_ID_COLUMN])
+            if isinstance(self.data, pd.DataFrame):
+                result.index = self.data.index
+
+            self.data = result
+            logger.info(f"SQL feature extraction completed for {len(result)} rows")
+            return self.data
+
+        except Exception as e:
+            logger.error(f"Error in SQL feature extraction: {str(e)}")
+            raise
+        finally:
+            if conn is not None:
+                conn.close()
+
+    def iter_feature_batches(self, columns: Optional[List[str]] = None,
+                             batch_rows: Optional[int] = None) -> Iterator[pd.DataFrame]:
+        """
+        Extract features and yield them in row-order batches
+
+        Only the current batch is converted to a DataFrame; the engine keeps its
+        group aggregates within the memory limit and spills the rest to disk.
+
+        Args:
+            columns: Input columns returned next to the features (defaults to all);
+                columns the source does not have are skipped
+            batch_rows: Rows per batch (defaults to memory_config.chunk_size)
+
+        Yields:
+            DataFrames of input columns and feature columns
+        """
+        vectors = max(1, (batch_rows or memory_config.chunk_size) // ENGINE_VECTOR_SIZE)
+        conn = None
+        try:
+            logger.info("Starting batched SQL feature extraction (duckdb)...")
+            conn = self._connect()
+            self._register_source(conn)
+
+            if columns is not None:
+                available = {col[0] for col in conn.execute("SELECT * FROM prescriptions LIMIT 0").description}
+                columns = [col for col in columns if col in available]
+
+            result = conn.execute(self.build_query(columns))
+            rows = 0
+            while True:
+                batch = result.fetch_df_chunk(vectors)
+                if batch.empty:
+                    break
+                rows += len(batch)
+                yield batch.drop(columns=[ROW_ID_COLUMN])
+            logger.info(f"Batched SQL feature extraction completed for {rows} rows")
+
+        except Exception as e:
+            logger.error(f"Error in SQL feature extraction: {str(e)}")
+            raise
+        finally:
+            if conn is not None:
+                conn.close()
+
+    @performance_monitor
+    def extract_to_parquet(self, output_path: str) -> str:
+        """
+        Extract features and write them straight to a Parquet file
+
+        The result never has to fit in RAM: the engine streams it to disk,
+        spilling intermediate aggregates to its temp directory if needed.
+
+        Args:
+            output_path: Destination Parquet path
+
+        Returns:
+            The output path
+        """
+        conn = None
+        try:
+            logger.info(f"Starting SQL feature extraction to {output_path}...")
+            conn = self._connect()
+            self._register_source(conn)
+            conn.execute(
+                f"COPY (SELECT * EXCLUDE ({ROW_ID_COLUMN}) FROM ({self.build_query()})) "
+                f"TO {_quote_path(output_path)} (FORMAT PARQUET)"
+            )
+            logger.info(f"SQL feature extraction written to {output_path}")
+            return output_path
+
+        except Exception as e:
+            logger.error(f"Error in SQL feature extraction: {str(e)}")
+            raise
+        finally:
+            if conn is not None:
+                conn.close()
+
+    def get_feature_columns(self) -> List[str]:
+        """Get list of feature column names"""
+        return self.feature_columns
+
+    def prepare_features_for_prediction(self) -> pd.DataFrame:
+        """Prepare features for model prediction"""
+        features_df = self.data[self.feature_columns].copy()
+        features_df.dropna(inplace=True)
+        return features_df
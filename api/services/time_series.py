@@ -0,0 +1,118 @@
+"""
+Date bucketing and shape-preserving downsampling for time-series charts
+دسته‌بندی تاریخ و کاهش نقاط سری‌های زمانی نمودارها با حفظ شکل
+"""
+
+import numpy as np
+import pandas as pd
+from typing import Optional
+
+# Resampling rules of the supported date buckets. Weeks start on Saturday and
+# are labelled by their first day, like months.
+DATE_BUCKET_RULES = {
+    'week': 'W-SAT',
+    'month': 'MS',
+}
+
+DATE_BUCKETS = ('auto', 'day') + tuple(DATE_BUCKET_RULES)
+
+def choose_date_bucket(index: pd.DatetimeIndex, max_points: int, bucket: str = 'auto') -> str:
+    """
+    Pick the finest bucket that keeps a daily index within max_points
+
+    Args:
+        index: Daily dates of the series
+        max_points: Target number of points
+        bucket: Requested bucket; anything but 'auto' is returned as is
+
+    Returns:
+        'day', 'week' or 'month'
+    """
+    if bucket != 'auto':
+        return bucket
+    if len(index) == 0:
+        return 'day'
+    span_days = (index.max() - index.min()).days + 1
+    if span_days <= max_points:
+        return 'day'
+    if span_days / 7 <= max_points:
+        return 'week'
+    return 'month'
+
+def resample_counts(counts: pd.DataFrame, bucket: str) -> pd.DataFrame:
+    """
+    Sum daily counts into week or month buckets
+
+    Counts are summed rather than ratios averaged, so ratios derived from the
+    result are exact per bucket.
+
+    Args:
+        counts: Daily counts indexed by date
+        bucket: 'day', 'week' or 'month'
+
+    Returns:
+        Counts indexed by bucket start date
+    """
+    if bucket == 'day' or counts.empty:
+        return counts
+    return counts.resample(DATE_BUCKET_RULES[bucket], label='left', closed='left').sum()
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets downsampling
+
+    Keeps the first and last points and, from each of threshold - 2 equal
+    buckets in between, the point forming the largest triangle with the
+    previously kept point and the average of the next bucket. Peaks and dips
+    survive where uniform striding would drop them.
+
+    Args:
+        x: Monotonic x values
+        y: y values
+        threshold: Number of points to keep
+
+    Returns:
+        Sorted positions of the kept points
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    every = (n - 2) / (threshold - 2)
+    selected = np.empty(threshold, dtype=np.intp)
+    selected[0] = 0
+    selected[-1] = n - 1
+
+    previous = 0
+    for i in range(threshold - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+
+        areas = np.abs(
+            (x[previous] - avg_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (avg_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        selected[i + 1] = previous
+    return selected
+
+def downsample_series(series: pd.Series, max_points: Optional[int]) -> pd.Series:
+    """
+    Reduce a date-indexed series to at most max_points with LTTB
+
+    Args:
+        series: Series indexed by date
+        max_points: Target number of points, or None to keep every point
+
+    Returns:
+        The series itself or the subset of its points LTTB keeps
+    """
+    if not max_points or len(series) <= max_points:
+        return series
+    x = series.index.to_numpy().astype('datetime64[ns]').view('int64')
+    return series.iloc[lttb_indices(x, series.to_numpy(dtype=float), max_points)]
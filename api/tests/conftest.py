@@ -0,0 +1,19 @@
+"""
+Shared pytest setup for the fraud detection API
+تنظیمات مشترک pytest برای API تشخیص تقلب
+"""
+
+import os
+import sys
+import types
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if API_DIR not in sys.path:
+    sys.path.insert(0, API_DIR)
+
+# Importing the core package creates the Flask app (and trains the model); register
+# an empty package instead so tests can import core.utils and core.exceptions alone
+if 'core' not in sys.modules:
+    core = types.ModuleType('core')
+    core.__path__ = [os.path.join(API_DIR, 'core')]
+    sys.modules['core'] = core
@@ -0,0 +1,163 @@
+"""
+Tests for feature aggregate pushdown
+تست‌های محاسبه تجمیع‌های ویژگی در پایگاه داده
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import text
+
+from config.config import PROVIDER_NAME_EXPRESSION, DatabaseConfig, DatabaseManager
+from core.exceptions import FeatureExtractionError
+from core.utils import clean_key_column, clean_numeric_column
+from functions.shamsi_to_miladi_function import shamsi_year_month
+from services.feature_extractor import FeatureExtractor
+
+FEATURE_COLUMNS = [
+    'unq_ratio_provider', 'unq_ratio_patient', 'percent_change_provider',
+    'percent_change_patient', 'percent_difference', 'percent_diff_ser',
+    'percent_diff_spe', 'percent_diff_spe2', 'percent_diff_ser_patient',
+    'percent_diff_serv', 'Ratio'
+]
+
+def _prescriptions(rows: int = 600, seed: int = 7) -> pd.DataFrame:
+    """Rows with NULL keys, decimal and NULL costs, invalid dates and a stale year_month column"""
+    rng = np.random.default_rng(seed)
+    months = ['1402/10', '1402/11', '1402/12', '1403/01', '1403/02']
+    dates = [f"{rng.choice(months)}/{rng.integers(1, 29):02d}" for _ in range(rows)]
+    dates[:6] = [None, None, '1402/13/40', 'not a date', '', '1402-11-05']
+    providers = rng.choice(['dr_a', 'dr_b', 'dr_c', 'dr_d', None], rows, p=[0.3, 0.25, 0.2, 0.15, 0.1])
+    ref_codes = rng.choice(['ref_1', None], rows)
+    costs = rng.choice([120000.0, 98000.5, 430000.0, 15000.75, None], rows)
+    return pd.DataFrame({
+        'ID': rng.choice([f"p{i}" for i in range(25)] + [None], rows),
+        'provider_name': providers,
+        'Ref_code': ref_codes,
+        'Ref_name': rng.choice(['ref name', None], rows),
+        'Service': rng.choice(['visit', 'lab', 'دارو و ملزومات دارویی', None], rows),
+        'provider_specialty': rng.choice(['general', 'cardio', None], rows),
+        'cost_amount': costs,
+        'Adm_date': dates,
+        # Stored year_month is NULL or Jalali, so it cannot be used as the group key
+        'year_month': [d[:7] if d and rng.random() < 0.5 else None for d in dates]
+    })
+
+def _process(chunk: pd.DataFrame) -> pd.DataFrame:
+    """Key and cost preparation of LazyDataLoader._process_chunk"""
+    chunk['cost_amount'] = clean_numeric_column(chunk['cost_amount'], 'cost_amount')
+    chunk['year_month'] = shamsi_year_month(chunk['Adm_date'])
+    for col in ['ID', 'provider_name', 'Service', 'provider_specialty']:
+        chunk[col] = clean_key_column(chunk[col])
+    return chunk
+
+@pytest.fixture
+def db_manager(tmp_path):
+    manager = DatabaseManager(DatabaseConfig(backend='sqlite', sqlite_path=str(tmp_path / 'pushdown.sqlite')))
+    with manager.get_connection() as conn:
+        _prescriptions().to_sql('Prescriptions', conn, index=False)
+        conn.commit()
+    manager.add_feature_key_columns('Prescriptions')
+    yield manager
+    manager.engine.dispose()
+
+def _load_rows(db_manager: DatabaseManager) -> pd.DataFrame:
+    """All rows, selected the way LazyDataLoader loads a chunk"""
+    query, params = db_manager.build_select_query(
+        'Prescriptions',
+        columns=['ID', 'provider_name', 'Service', 'provider_specialty', 'cost_amount', 'Adm_date'],
+        column_expressions={'provider_name': PROVIDER_NAME_EXPRESSION}
+    )
+    return _process(db_manager.load_data_from_db('Prescriptions', query, params=params))
+
+def _load_aggregates(db_manager: DatabaseManager):
+    aggregates = db_manager.load_feature_aggregates(
+        shamsi_year_month, 'Prescriptions', provider_expression=PROVIDER_NAME_EXPRESSION
+    )
+    assert aggregates is not None
+    return aggregates
+
+def test_pushdown_matches_pandas_features(db_manager):
+    rows = _load_rows(db_manager)
+    expected = FeatureExtractor(rows.copy()).extract_all_features()[FEATURE_COLUMNS]
+    actual = FeatureExtractor(rows.copy()).extract_features_from_aggregates(_load_aggregates(db_manager))[FEATURE_COLUMNS]
+
+    assert actual.notna().all().all()
+    pd.testing.assert_frame_equal(actual.astype(float), expected.astype(float), rtol=1e-9)
+
+def test_pushdown_groups_keep_null_keys_and_unconverted_dates(db_manager):
+    aggregates = _load_aggregates(db_manager)
+
+    assert 'NaT' in set(aggregates['patient_month']['year_month'])
+    assert 'None' in set(aggregates['provider_total']['provider_name'])
+    assert aggregates['provider_total']['TotalCount'].sum() == len(_prescriptions())
+
+def test_month_keys_table_is_dropped_after_loading(db_manager):
+    _load_aggregates(db_manager)
+    with db_manager.get_connection() as conn:
+        tables = conn.execute(text("SELECT name FROM sqlite_temp_master WHERE type = 'table'")).fetchall()
+    assert tables == []
+
+def test_rows_without_aggregate_group_raise(db_manager):
+    rows = _load_rows(db_manager)
+    rows.loc[0, 'provider_name'] = 'inserted after the aggregates were loaded'
+
+    with pytest.raises(FeatureExtractionError, match='1 of'):
+        FeatureExtractor(rows).extract_features_from_aggregates(_load_aggregates(db_manager))
+
+def test_feature_keys_are_filled_for_new_rows(db_manager):
+    _load_aggregates(db_manager)
+    with db_manager.get_connection() as conn:
+        conn.execute(text(
+            "INSERT INTO Prescriptions (ID, provider_name, Ref_code, Service, provider_specialty, cost_amount, Adm_date) "
+            "VALUES ('p_new', NULL, 'ref_new', 'visit', 'general', 1000, '1403/02/10')"
+        ))
+        conn.commit()
+
+    aggregates = _load_aggregates(db_manager)
+    with db_manager.get_connection() as conn:
+        unfilled = conn.execute(text("SELECT COUNT(*) FROM Prescriptions WHERE adm_month IS NULL")).scalar()
+        keys = conn.execute(text("SELECT adm_month, provider_key FROM Prescriptions WHERE ID = 'p_new'")).fetchone()
+
+    assert unfilled == 0
+    assert tuple(keys) == ('2024-04', 'ref_new')
+    assert aggregates['provider_total'].set_index('provider_name').loc['ref_new', 'TotalCount'] == 1
+
+def test_pushdown_requires_stored_feature_keys(tmp_path):
+    manager = DatabaseManager(DatabaseConfig(backend='sqlite', sqlite_path=str(tmp_path / 'unmigrated.sqlite')))
+    with manager.get_connection() as conn:
+        _prescriptions().to_sql('Prescriptions', conn, index=False)
+        conn.commit()
+
+    assert manager.load_feature_aggregates(shamsi_year_month, 'Prescriptions') is None
+    manager.engine.dispose()
+
+def test_text_none_key_next_to_null_key_disables_pushdown(db_manager):
+    with db_manager.get_connection() as conn:
+        conn.execute(text("UPDATE Prescriptions SET Service = 'None' WHERE Service = 'visit'"))
+        conn.commit()
+
+    assert db_manager.load_feature_aggregates(
+        shamsi_year_month, 'Prescriptions', provider_expression=PROVIDER_NAME_EXPRESSION
+    ) is None
+
+def test_aggregate_queries_read_groups_from_covering_indexes(db_manager):
+    from scripts.setup_database import AGGREGATE_PLAN_NAMES, PRESCRIPTION_INDEXES
+
+    queries = db_manager.feature_aggregate_queries('Prescriptions')
+    with db_manager.get_connection() as conn:
+        for index_name, columns in PRESCRIPTION_INDEXES.items():
+            conn.execute(text(f"CREATE INDEX {index_name} ON Prescriptions ({', '.join(columns)})"))
+        conn.execute(text("ANALYZE Prescriptions"))
+        conn.commit()
+        plans = {
+            name: ' ; '.join(row['detail'] for row in conn.execute(text(f"EXPLAIN QUERY PLAN {query}")).mappings())
+            for name, query in queries.items()
+        }
+
+    for name in AGGREGATE_PLAN_NAMES:
+        assert 'USING COVERING INDEX' in plans[name], plans[name]
+        assert 'FOR GROUP BY' not in plans[name], plans[name]
+    # The three-key groups are read from a covering index, sorted on their last key
+    assert all('USING COVERING INDEX' in plan for plan in plans.values()), plans
+    assert _load_aggregates(db_manager)['provider_total']['TotalCount'].sum() == len(_prescriptions())
@@ -0,0 +1,61 @@
+"""
+Tests for the provider typeahead search index
+تست‌های نمایه جستجوی پزشکان
+"""
+
+from services.provider_search import ProviderSearchIndex, normalize_persian
+
+def _providers(*names):
+    """Providers in volume order, highest first"""
+    return [
+        {'provider_name': name, 'provider_specialty': None, 'services_count': 1, 'total_prescriptions': 100 - i}
+        for i, name in enumerate(names)
+    ]
+
+def _names(results):
+    return [provider['provider_name'] for provider in results]
+
+def test_name_prefix_ranks_before_word_prefix_and_substring():
+    index = ProviderSearchIndex(_providers('Karim Ali', 'Salimi', 'Ali Rezaei', 'Alireza Moradi'))
+
+    # Names starting with the query first, then other word prefixes, then substrings, each by volume
+    assert _names(index.search('ali', 10)) == ['Ali Rezaei', 'Alireza Moradi', 'Karim Ali', 'Salimi']
+
+def test_limit_keeps_the_highest_volume_matches():
+    index = ProviderSearchIndex(_providers('Ali A', 'Ali B', 'Ali C', 'Ali D'))
+
+    assert _names(index.search('ali', 2)) == ['Ali A', 'Ali B']
+
+def test_empty_query_returns_top_providers():
+    index = ProviderSearchIndex(_providers('a', 'b', 'c'))
+
+    assert _names(index.search('', 2)) == ['a', 'b']
+    assert _names(index.search('   ', 5)) == ['a', 'b', 'c']
+
+def test_persian_names_match_arabic_letters_zwnj_and_diacritics():
+    index = ProviderSearchIndex(_providers('دکتر علی کریمی', 'مهدی‌زاده', 'سعید رضایی'))
+
+    # Arabic kaf and yeh fold onto the Persian letters
+    assert _names(index.search('كريمي', 5)) == ['دکتر علی کریمی']
+    # ZWNJ is a word break, so the second part is a word prefix
+    assert _names(index.search('زاده', 5)) == ['مهدی‌زاده']
+    # Harakat are ignored
+    assert _names(index.search('سَعید', 5)) == ['سعید رضایی']
+    # Substring inside a word
+    assert _names(index.search('ضای', 5)) == ['سعید رضایی']
+
+def test_non_adjacent_bigrams_are_not_a_match():
+    index = ProviderSearchIndex(_providers('abxab', 'zzz'))
+
+    # 'ab' and 'bx' both occur but 'abab' does not
+    assert index.search('abab', 5) == []
+    assert _names(index.search('bxa', 5)) == ['abxab']
+
+def test_missing_names_are_indexed_as_empty():
+    index = ProviderSearchIndex(_providers(None, 'Reza'))
+
+    assert len(index) == 2
+    assert _names(index.search('rez', 5)) == ['Reza']
+
+def test_normalize_persian_digits_and_whitespace():
+    assert normalize_persian(' دكتر‌يك  ۱۲٣ ') == 'دکتر یک 123'
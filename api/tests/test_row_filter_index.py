@@ -0,0 +1,70 @@
+"""
+Tests for the chart row filter index
+تست‌های نمایه فیلتر سطرهای نمودار
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from services.row_filter_index import RowFilterIndex
+
+def _data_final(rows: int = 2000, seed: int = 3) -> pd.DataFrame:
+    """Prediction rows with missing dates and categories"""
+    rng = np.random.default_rng(seed)
+    dates = pd.Series(pd.date_range('2023-01-01', periods=400, freq='D').strftime('%Y-%m-%d'))
+    adm_date = rng.choice(dates, rows).astype(object)
+    adm_date[rng.random(rows) < 0.03] = None
+    return pd.DataFrame({
+        'Adm_date': adm_date,
+        'province': rng.choice(['تهران', 'اصفهان', 'فارس', None], rows, p=[0.4, 0.3, 0.25, 0.05]),
+        'Service': rng.choice(['visit', 'lab', 'drug'], rows),
+        'provider_specialty': rng.choice(['general', 'cardio', None], rows, p=[0.5, 0.45, 0.05]),
+    })
+
+def _mask(data: pd.DataFrame, filters: dict) -> np.ndarray:
+    """The same filters as a pandas boolean mask"""
+    mask = pd.Series(True, index=data.index)
+    dates = pd.to_datetime(data['Adm_date'])
+    if 'from' in filters:
+        mask &= dates >= pd.Timestamp(filters['from'])
+    if 'to' in filters:
+        mask &= dates <= pd.Timestamp(filters['to'])
+    for name, column in (('province', 'province'), ('service', 'Service'), ('specialty', 'provider_specialty')):
+        if name in filters:
+            mask &= data[column].isin(filters[name])
+    return np.flatnonzero(mask.to_numpy())
+
+@pytest.mark.parametrize('filters', [
+    {},
+    {'from': '2023-03-01', 'to': '2023-03-31'},
+    {'from': '2023-12-01'},
+    {'to': '2023-01-01'},
+    {'province': ['تهران']},
+    {'service': ['lab', 'visit'], 'specialty': ['cardio']},
+    {'from': '2023-02-10', 'to': '2023-06-30', 'province': ['فارس', 'اصفهان'], 'service': ['drug']},
+    {'province': ['unknown']},
+    {'from': '2030-01-01'},
+])
+def test_select_matches_pandas_mask(filters):
+    data = _data_final()
+    index = RowFilterIndex(data)
+
+    np.testing.assert_array_equal(index.select(filters), _mask(data, filters))
+
+def test_narrow_keeps_order_of_the_given_rows():
+    data = _data_final()
+    index = RowFilterIndex(data)
+    rows = np.arange(len(data))[::-1]
+    filters = {'from': '2023-05-01', 'service': ['lab']}
+
+    narrowed = index.narrow(rows, filters)
+    np.testing.assert_array_equal(narrowed, _mask(data, filters)[::-1])
+
+def test_missing_filter_column_is_unavailable():
+    data = _data_final().drop(columns=['provider_specialty'])
+    index = RowFilterIndex(data)
+
+    assert not index.available('specialty')
+    with pytest.raises(KeyError):
+        index.select({'specialty': ['general']})
@@ -0,0 +1,70 @@
+"""
+Tests for the DuckDB feature backend
+تست‌های موتور SQL استخراج ویژگی‌ها
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('duckdb')
+
+from services.feature_extractor import FeatureExtractor
+from services.sql_feature_extractor import SQLFeatureExtractor, write_snapshot
+
+FEATURE_COLUMNS = FeatureExtractor(pd.DataFrame()).get_feature_columns()
+
+def _prescriptions(rows: int = 3000, seed: int = 11) -> pd.DataFrame:
+    """Chunk-shaped rows with missing providers, services, specialties, months and costs"""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'ID': rng.choice([f"p{i}" for i in range(80)], rows),
+        'provider_name': rng.choice(['dr_a', 'dr_b', 'dr_c', 'dr_d', None], rows, p=[0.3, 0.25, 0.2, 0.2, 0.05]),
+        'Service': rng.choice(['visit', 'lab', 'دارو و ملزومات دارویی', None], rows, p=[0.4, 0.3, 0.25, 0.05]),
+        'provider_specialty': rng.choice(['general', 'cardio', None], rows, p=[0.5, 0.45, 0.05]),
+        'cost_amount': rng.choice([120000.0, 98000.0, 430000.0, 15000.0, np.nan], rows),
+        'year_month': rng.choice(['2023-12', '2024-01', '2024-02', '2024-03', None], rows, p=[0.2, 0.25, 0.25, 0.25, 0.05])
+    })
+
+def test_sql_backend_matches_pandas_features():
+    data = _prescriptions()
+    expected = FeatureExtractor(data.copy()).extract_all_features()[FEATURE_COLUMNS]
+    actual = SQLFeatureExtractor(data.copy(), threads=2).extract_all_features()[FEATURE_COLUMNS]
+
+    pd.testing.assert_frame_equal(actual.astype(float), expected.astype(float), rtol=1e-9)
+
+def test_missing_keys_are_left_out_of_groups_as_in_pandas():
+    data = _prescriptions()
+    missing = data['provider_name'].isna()
+    features = SQLFeatureExtractor(data, threads=2).extract_all_features()
+
+    assert features.loc[missing, 'provider_name'].isna().all()
+    assert features.loc[missing, 'percent_change_provider'].isna().all()
+    assert features.loc[missing, 'Ratio'].isna().all()
+
+def test_snapshot_batches_match_dataframe_features(tmp_path):
+    data = _prescriptions()
+    chunks = [data.iloc[start:start + 700] for start in range(0, len(data), 700)]
+    assert write_snapshot(chunks, str(tmp_path)) == len(data)
+
+    extractor = SQLFeatureExtractor(str(tmp_path), threads=2)
+    batches = list(extractor.iter_feature_batches(columns=['ID', 'Service', 'gender'], batch_rows=2048))
+    expected = SQLFeatureExtractor(data, threads=2).extract_all_features()
+
+    assert len(batches) == 2
+    assert all(len(batch) <= 2048 for batch in batches)
+    actual = pd.concat(batches, ignore_index=True)
+    assert list(actual.columns) == ['ID', 'Service'] + FEATURE_COLUMNS
+    pd.testing.assert_frame_equal(
+        actual[FEATURE_COLUMNS].astype(float),
+        expected[FEATURE_COLUMNS].reset_index(drop=True).astype(float),
+        rtol=1e-9
+    )
+
+def test_input_frame_is_not_modified():
+    data = _prescriptions()
+    before = data.copy()
+    FeatureExtractor(data).extract_all_features()
+    SQLFeatureExtractor(data, threads=2).extract_all_features()
+
+    pd.testing.assert_frame_equal(data, before)
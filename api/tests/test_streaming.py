@@ -0,0 +1,160 @@
+"""
+Tests for streaming table reads
+تست‌های خواندن جریانی جدول‌ها
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tracemalloc
+
+import pandas as pd
+import pytest
+from sqlalchemy import event, text
+
+from config.config import DatabaseConfig, DatabaseManager, memory_config
+
+CHUNK_SIZE = 2000
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# MariaDB server for the server-side cursor test; the test is skipped without one
+MARIADB_ENV = {
+    'DB_HOST': os.getenv('TEST_MARIADB_HOST', ''),
+    'DB_PORT': os.getenv('TEST_MARIADB_PORT', '3306'),
+    'DB_USER': os.getenv('TEST_MARIADB_USER', 'root'),
+    'DB_PASSWORD': os.getenv('TEST_MARIADB_PASSWORD', ''),
+    'DB_NAME': os.getenv('TEST_MARIADB_DATABASE', 'test')
+}
+MARIADB_TABLE = 'stream_rss_test'
+
+# Run in a fresh interpreter so ru_maxrss is the high-water mark of this stream alone
+RSS_PROBE = """
+import json, resource, sys
+from config.config import DatabaseManager
+manager = DatabaseManager()
+# Warm up the driver, the pool and pandas before taking the baseline
+for chunk in manager.stream_data_from_db(sys.argv[1], chunk_size=10, query=f"SELECT * FROM {sys.argv[1]} LIMIT 10"):
+    pass
+baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+rows = largest = 0
+for chunk in manager.stream_data_from_db(sys.argv[1], chunk_size=int(sys.argv[2])):
+    rows += len(chunk)
+    largest = max(largest, len(chunk))
+    del chunk
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({'rows': rows, 'largest': largest, 'rss_growth_kb': peak - baseline}))
+"""
+
+def _fill(db_manager: DatabaseManager, rows: int):
+    """Prescriptions table of the given size with a wide text column"""
+    with db_manager.get_connection() as conn:
+        pd.DataFrame({
+            'ID': [f"p{i % 997}" for i in range(rows)],
+            'provider_name': [f"provider {i % 31}" for i in range(rows)],
+            'cost_amount': [float(i % 5000) for i in range(rows)],
+            'notes': [f"{i:08d}" * 32 for i in range(rows)]
+        }).to_sql('Prescriptions', conn, index=False, if_exists='replace')
+        conn.commit()
+
+def _stream_peak(db_manager: DatabaseManager) -> tuple:
+    """Peak traced allocation while consuming the stream, and the largest chunk"""
+    largest = 0
+    tracemalloc.start()
+    try:
+        for chunk in db_manager.stream_data_from_db('Prescriptions', chunk_size=CHUNK_SIZE):
+            largest = max(largest, len(chunk))
+            del chunk
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return peak, largest
+
+@pytest.fixture
+def db_manager(tmp_path):
+    manager = DatabaseManager(DatabaseConfig(backend='sqlite', sqlite_path=str(tmp_path / 'stream.sqlite')))
+    yield manager
+    manager.engine.dispose()
+
+def test_stream_memory_stays_bounded_as_table_grows(db_manager):
+    peaks = {}
+    for rows in (20000, 80000):
+        _fill(db_manager, rows)
+        _stream_peak(db_manager)  # warm up imports and statement caches
+        peaks[rows], largest = _stream_peak(db_manager)
+        assert largest == CHUNK_SIZE
+
+    # Four times the rows must not mean four times the memory: only a chunk is held at a time
+    assert peaks[80000] < peaks[20000] * 1.5
+    # Holding the whole table would take over 20 MB (256-character notes per row)
+    assert peaks[80000] < 8 * 1024 * 1024
+
+def test_server_stream_requests_bounded_row_buffer(db_manager, monkeypatch):
+    _fill(db_manager, 5000)
+    # Take the MariaDB path over the SQLite engine, which is already created
+    monkeypatch.setattr(DatabaseManager, 'is_embedded', property(lambda self: False))
+    monkeypatch.setattr(memory_config, 'enable_server_side_cursor', True)
+    monkeypatch.setattr(memory_config, 'stream_fetch_size', 500)
+
+    options = []
+    event.listen(db_manager.engine, 'before_cursor_execute',
+                 lambda conn, cursor, statement, parameters, context, executemany: options.append(context.execution_options))
+    chunks = list(db_manager.stream_data_from_db('Prescriptions', chunk_size=CHUNK_SIZE))
+
+    assert [len(chunk) for chunk in chunks] == [2000, 2000, 1000]
+    assert options[-1]['stream_results'] is True
+    assert options[-1]['max_row_buffer'] == 500
+
+@pytest.fixture
+def mariadb_manager():
+    if not MARIADB_ENV['DB_HOST']:
+        pytest.skip('TEST_MARIADB_HOST is not set')
+    manager = DatabaseManager(DatabaseConfig(
+        host=MARIADB_ENV['DB_HOST'], port=int(MARIADB_ENV['DB_PORT']), user=MARIADB_ENV['DB_USER'],
+        password=MARIADB_ENV['DB_PASSWORD'], database=MARIADB_ENV['DB_NAME'], backend='mysql'
+    ))
+    if not manager.test_connection():
+        pytest.skip(f"No MariaDB server at {MARIADB_ENV['DB_HOST']}:{MARIADB_ENV['DB_PORT']}")
+    yield manager
+    with manager.get_connection() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {MARIADB_TABLE}"))
+        conn.commit()
+    manager.engine.dispose()
+
+def _fill_mariadb(db_manager: DatabaseManager, rows: int):
+    """MariaDB test table of the given size with a wide text column"""
+    with db_manager.get_connection() as conn:
+        pd.DataFrame({
+            'ID': [f"p{i % 997}" for i in range(rows)],
+            'cost_amount': [float(i % 5000) for i in range(rows)],
+            'notes': [f"{i:08d}" * 32 for i in range(rows)]
+        }).to_sql(MARIADB_TABLE, conn, index=False, if_exists='replace', chunksize=10000)
+        conn.commit()
+
+def _server_stream_rss(server_side_cursor: bool) -> dict:
+    """Stream the MariaDB test table in a child process and report its RSS growth"""
+    env = dict(os.environ, **MARIADB_ENV, DB_BACKEND='mysql', STREAM_FETCH_SIZE='500',
+               ENABLE_SERVER_SIDE_CURSOR=str(server_side_cursor))
+    result = subprocess.run(
+        [sys.executable, '-c', RSS_PROBE, MARIADB_TABLE, str(CHUNK_SIZE)],
+        cwd=API_DIR, env=env, capture_output=True, text=True, timeout=300, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def test_server_side_cursor_rss_stays_bounded_as_table_grows(mariadb_manager):
+    growth = {}
+    for rows in (50000, 200000):
+        _fill_mariadb(mariadb_manager, rows)
+        stats = _server_stream_rss(server_side_cursor=True)
+        assert stats['rows'] == rows
+        assert stats['largest'] == CHUNK_SIZE
+        growth[rows] = stats['rss_growth_kb']
+    buffered = _server_stream_rss(server_side_cursor=False)['rss_growth_kb']
+
+    # Four times the rows must not mean four times the memory: the driver holds
+    # STREAM_FETCH_SIZE rows and the consumer one chunk
+    assert growth[200000] < growth[50000] * 1.5 + 4096
+    # 200k rows of 256-character notes take over 50 MB once buffered by the driver
+    assert growth[200000] < 32 * 1024
+    assert buffered > growth[200000] * 2
@@ -0,0 +1,80 @@
+"""
+Tests for date bucketing and LTTB downsampling of the date series charts
+تست‌های دسته‌بندی تاریخ و کاهش نقاط سری‌های زمانی
+"""
+
+import numpy as np
+import pandas as pd
+
+from services.time_series import choose_date_bucket, downsample_series, lttb_indices, resample_counts
+
+def _daily_counts(days: int = 120, seed: int = 5) -> pd.DataFrame:
+    """Daily normal (1) and fraud (-1) counts with some days missing"""
+    rng = np.random.default_rng(seed)
+    index = pd.date_range('2024-01-01', periods=days, freq='D')
+    counts = pd.DataFrame({1: rng.integers(0, 50, days), -1: rng.integers(0, 5, days)}, index=index)
+    return counts.drop(index[40:75])
+
+def test_lttb_keeps_endpoints_and_point_count():
+    x = np.arange(1000, dtype=float)
+    y = np.sin(x / 25.0)
+    kept = lttb_indices(x, y, 100)
+
+    assert len(kept) == 100
+    assert kept[0] == 0 and kept[-1] == 999
+    assert np.all(np.diff(kept) > 0)
+
+def test_lttb_keeps_an_isolated_spike():
+    x = np.arange(500, dtype=float)
+    y = np.zeros(500)
+    y[237] = 10.0
+
+    assert 237 in lttb_indices(x, y, 20)
+
+def test_lttb_returns_every_point_below_threshold():
+    x = np.arange(10, dtype=float)
+
+    np.testing.assert_array_equal(lttb_indices(x, x, 50), np.arange(10))
+    np.testing.assert_array_equal(lttb_indices(x, x, 2), np.arange(10))
+
+def test_downsample_series_keeps_first_and_last_dates():
+    series = pd.Series(np.random.default_rng(1).random(400), index=pd.date_range('2023-01-01', periods=400, freq='D'))
+    reduced = downsample_series(series, 60)
+
+    assert len(reduced) == 60
+    assert reduced.index[0] == series.index[0] and reduced.index[-1] == series.index[-1]
+    assert downsample_series(series, None) is series
+
+def test_resample_counts_sums_buckets_exactly():
+    counts = _daily_counts()
+    monthly = resample_counts(counts, 'month')
+
+    assert monthly.sum().to_dict() == counts.sum().to_dict()
+    assert list(monthly.index) == list(pd.date_range('2024-01-01', periods=4, freq='MS'))
+    # Weeks start on Saturday
+    assert (resample_counts(counts, 'week').index.dayofweek == 5).all()
+
+def test_resample_counts_fills_empty_buckets_with_zero():
+    weekly = resample_counts(_daily_counts(), 'week')
+    empty = weekly[weekly.sum(axis=1) == 0]
+
+    assert len(empty) > 0
+    # The fraud ratio chart drops these buckets instead of plotting 0/0
+    ratio = weekly[-1] / (weekly[1] + weekly[-1])
+    assert ratio[empty.index].isna().all()
+
+def test_resample_counts_leaves_daily_and_empty_counts_alone():
+    counts = _daily_counts()
+
+    assert resample_counts(counts, 'day') is counts
+    assert resample_counts(counts.iloc[:0], 'month').empty
+
+def test_choose_date_bucket_picks_finest_fitting_bucket():
+    def days(n):
+        return pd.date_range('2020-01-01', periods=n, freq='D')
+
+    assert choose_date_bucket(days(300), 365) == 'day'
+    assert choose_date_bucket(days(2000), 365) == 'week'
+    assert choose_date_bucket(days(4000), 365) == 'month'
+    assert choose_date_bucket(days(4000), 365, 'day') == 'day'
+    assert choose_date_bucket(pd.DatetimeIndex([]), 365) == 'day'
@@ -52,6 +52,51 @@ export interface ChartResponse {
   chart: string;
 }
 
+export interface ChartDataResponse {
+  chart_type: string;
+  kind: 'bar' | 'pie' | 'line' | 'grouped_bar';
+  title: string;
+  x_label: string | null;
+  y_label: string | null;
+  labels: (string | number)[];
+  values?: number[];
+  series?: Record<string, number[]>;
+  fraud_counts?: number[];
+  total_counts?: number[];
+  model_version: string | null;
+}
+
+// فیلترهای اختیاری نمودار (تاریخ‌ها به صورت YYYY-MM-DD میلادی)
+export interface ChartFilters {
+  from?: string;
+  to?: string;
+  province?: string[];
+  service?: string[];
+  specialty?: string[];
+}
+
+export interface ChartBundleSpec {
+  chart: string; // نام مسیر نمودار، مثلاً 'fraud-by-province'
+  id?: string;
+  format?: 'image' | 'data' | 'png' | 'svg' | 'webp';
+  dpi?: number;
+  width?: number;
+  height?: number;
+  params?: Record<string, string | number>;
+  filters?: ChartFilters;
+}
+
+export interface ChartBundleItem {
+  id: string | number;
+  name: string;
+  chart_type: string;
+  format: string;
+  chart?: string;
+  mimetype?: string;
+  data?: ChartDataResponse;
+  error?: string;
+}
+
 export interface RiskIndicatorsResponse {
   chart: string;
   prediction: PredictionResult;
@@ -67,6 +112,32 @@ export interface SpecialtiesResponse {
   count: number;
 }
 
+export interface ProviderSummary {
+  provider_name: string;
+  provider_specialty: string | null;
+  services_count: number;
+  total_prescriptions: number;
+}
+
+export interface ProvidersPage {
+  providers: ProviderSummary[];
+  count: number;
+  next_cursor: string | null;
+}
+
+export interface ProvidersQuery {
+  specialty?: string;
+  service?: string;
+  limit?: number;
+  cursor?: string;
+}
+
+export interface ProviderSearchResponse {
+  query: string;
+  providers: ProviderSummary[];
+  count: number;
+}
+
 export const apiService = {
   // پیش‌بینی تقلب برای نسخه جدید
   predictFraud: async (data: PrescriptionData): Promise<PredictionResult> => {
@@ -165,6 +236,57 @@ export const apiService = {
     return response.data;
   },
 
+  // آدرس مستقیم تصویر نمودار برای استفاده در <img> (مثلاً بندانگشتی‌های گالری)
+  getChartImageUrl: (
+    path: string,
+    options: { format?: 'png' | 'svg' | 'webp'; dpi?: number; width?: number; height?: number } = {},
+    params: Record<string, string | number> = {}
+  ): string => {
+    const query = new URLSearchParams();
+    Object.entries({ ...params, format: options.format ?? 'png', dpi: options.dpi, width: options.width, height: options.height })
+      .forEach(([key, value]) => {
+        if (value !== undefined) query.set(key, String(value));
+      });
+    return `${API_BASE_URL}${path}?${query.toString()}`;
+  },
+
+  // داده‌های تجمیعی نمودار برای رسم در مرورگر (مثلاً '/charts/fraud-by-province')
+  getChartData: async (path: string, params?: Record<string, string | number>): Promise<ChartDataResponse> => {
+    const response = await api.get(path, {
+      params: { ...params, format: 'data' }
+    });
+    return response.data;
+  },
+
+  // چند نمودار در یک درخواست؛ هر نمودار به محض آماده شدن به onChart داده می‌شود
+  getChartBundle: async (
+    charts: (string | ChartBundleSpec)[],
+    onChart: (item: ChartBundleItem) => void
+  ): Promise<void> => {
+    const response = await fetch(`${API_BASE_URL}/charts/bundle`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ charts }),
+    });
+    if (!response.ok || !response.body) {
+      throw new Error(`Chart bundle request failed with status ${response.status}`);
+    }
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    for (;;) {
+      const { done, value } = await reader.read();
+      buffer += decoder.decode(value, { stream: !done });
+      const lines = buffer.split('\n');
+      buffer = lines.pop() ?? '';
+      lines.filter((line) => line.trim()).forEach((line) => {
+        const item = JSON.parse(line);
+        if (!item.done) onChart(item);
+      });
+      if (done) break;
+    }
+  },
+
   // دریافت لیست خدمات
   getServices: async (): Promise<ServicesResponse> => {
     const response = await api.get('/services/list');
@@ -176,4 +298,16 @@ export const apiService = {
     const response = await api.get('/services/specialties');
     return response.data;
   },
+
+  // دریافت صفحه‌ای از لیست پزشکان
+  getProviders: async (query: ProvidersQuery = {}): Promise<ProvidersPage> => {
+    const response = await api.get('/services/providers', { params: query });
+    return response.data;
+  },
+
+  // جستجوی پزشکان بر اساس نام
+  searchProviders: async (q: string, limit: number = 20): Promise<ProviderSearchResponse> => {
+    const response = await api.get('/services/providers/search', { params: { q, limit } });
+    return response.data;
+  },
 };